@@ -0,0 +1,239 @@
+# accounts/authentication.py
+
+"""
+Stateless JWT authentication.
+
+Access tokens carry the user fields most views read (email, user_type,
+is_disabled, is_active, is_staff) plus the user's token_version, so
+authenticating a request is a signature check plus one cache read, with no
+database query. request.user is then a ClaimsUser; a view that needs the
+full CustomUser calls request.user.get_user(), which is served from a
+short-TTL cache in each worker.
+
+Changing any of those fields, or deleting the user, bumps token_version in
+the database (CustomUser.save), so every outstanding access token
+stops matching. Refresh tokens carry no claims: each refresh re-reads the
+user, so a demoted or disabled user gets the new claims or nothing.
+
+The current token_version is cached for AUTH_USER_CACHE_TTL seconds and
+re-read from the database on a miss, so an evicted entry costs a query,
+never a revoked token accepted. Revocation is immediate with a shared
+cache backend (Redis / Memcached); with the per-process local-memory
+backend other workers pick it up within AUTH_USER_CACHE_TTL.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+CLAIMS = ("email", "user_type", "is_disabled", "is_active", "is_staff", "token_version")
+
+TOKEN_VERSION_KEY = "auth:token-version:{}"
+VERSION_KEY = "auth:user-version:{}"
+# token_version of a user that no longer exists
+DELETED = -1
+
+# user id -> (expires, version, user)
+_users = {}
+_users_lock = threading.Lock()
+
+
+def cache_ttl():
+    return getattr(settings, "AUTH_USER_CACHE_TTL", 30)
+
+
+def claims_for(user):
+    return {claim: getattr(user, claim) for claim in CLAIMS}
+
+
+def user_version(user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted key never comes back as a
+        # version some worker already holds
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_cached_user(user_id):
+    """
+    The CustomUser with `user_id`, from this worker's cache while it is
+    younger than AUTH_USER_CACHE_TTL and the user has not been saved since.
+    """
+    version = user_version(user_id)
+    now = time.monotonic()
+    with _users_lock:
+        entry = _users.get(user_id)
+    if entry and entry[0] > now and entry[1] == version:
+        return entry[2]
+
+    user = get_user_model().objects.get(pk=user_id)
+    with _users_lock:
+        _users[user_id] = (now + cache_ttl(), version, user)
+    return user
+
+
+def can_authenticate(user):
+    return user.is_active and not user.is_disabled
+
+
+def invalidate_user(user):
+    """
+    Drop every worker's cached copy of `user` and its cached token_version.
+    """
+    with _users_lock:
+        _users.pop(user.pk, None)
+    try:
+        cache.incr(VERSION_KEY.format(user.pk))
+    except ValueError:
+        cache.add(VERSION_KEY.format(user.pk), time.time_ns(), None)
+    cache.delete(TOKEN_VERSION_KEY.format(user.pk))
+
+
+def current_token_version(user_id):
+    """
+    The token_version access tokens of `user_id` must carry, DELETED if the
+    user is gone. A cache miss reads the database.
+    """
+    key = TOKEN_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = get_user_model().objects.filter(pk=user_id).values_list("token_version", flat=True).first()
+        if version is None:
+            version = DELETED
+        cache.set(key, version, cache_ttl())
+    return version
+
+
+def clear():
+    with _users_lock:
+        _users.clear()
+
+
+class UserRefreshToken(RefreshToken):
+    """
+    Refresh token whose access tokens carry the CLAIMS, read from the user
+    each time an access token is made. The refresh token itself carries
+    none, so a refresh can never hand back claims from login time.
+    """
+
+    no_copy_claims = RefreshToken.no_copy_claims + CLAIMS
+    user = None
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.user = user
+        return token
+
+    @property
+    def access_token(self):
+        user = self.user or refreshable_user(self)
+        access = super().access_token
+        for claim, value in claims_for(user).items():
+            access[claim] = value
+        return access
+
+
+def refreshable_user(refresh):
+    """
+    The current user behind `refresh`, if it may still get access tokens.
+    """
+    user_id = refresh[api_settings.USER_ID_CLAIM]
+    if current_token_version(user_id) == DELETED:
+        raise AuthenticationFailed("User is inactive", code="user_inactive")
+    # Straight from the database: the claims must be current
+    user = get_user_model().objects.get(pk=user_id)
+    if not can_authenticate(user):
+        raise AuthenticationFailed("User is inactive", code="user_inactive")
+    return user
+
+
+def refreshed_access_token(refresh):
+    """
+    A new access token for `refresh`, with the claims re-read so a change
+    to the user since login is picked up.
+    """
+    return UserRefreshToken(str(refresh)).access_token
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    simplejwt's refresh endpoint, minting access tokens through
+    UserRefreshToken.
+    """
+
+    token_class = UserRefreshToken
+
+
+class ClaimsUser(TokenUser):
+    """
+    request.user built from the access token alone.
+    """
+
+    @property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def email(self):
+        return self.token.get("email", "")
+
+    @property
+    def user_type(self):
+        return self.token.get("user_type", "")
+
+    @property
+    def is_disabled(self):
+        return bool(self.token.get("is_disabled", False))
+
+    @property
+    def is_active(self):
+        return bool(self.token.get("is_active", True))
+
+    @property
+    def is_staff(self):
+        return bool(self.token.get("is_staff", False))
+
+    @property
+    def token_version(self):
+        return self.token.get("token_version")
+
+    def get_user(self):
+        return get_cached_user(self.id)
+
+    def __str__(self):
+        return self.email
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user query. Tokens issued
+    before the claims were added still resolve through the database.
+    """
+
+    def get_user(self, validated_token):
+        if "token_version" not in validated_token:
+            return super().get_user(validated_token)
+
+        user = ClaimsUser(validated_token)
+        # The claims say how the user was at login; token_version says
+        # whether any of them, or the user itself, has changed since
+        if not can_authenticate(user) or user.token_version != current_token_version(user.id):
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
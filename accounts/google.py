@@ -0,0 +1,139 @@
+# accounts/google.py
+
+"""
+Google ID-token verification.
+
+Google signs ID tokens with keys it rotates every few days and publishes
+at CERTS_URL with a Cache-Control max-age. The certificates are fetched
+through one keep-alive session per worker and kept until that max-age
+runs out, so a login is a local signature check rather than a round trip
+to Google. A token signed by a key we have not seen yet (just after a
+rotation) triggers one early refetch, at most every MIN_REFETCH seconds.
+If Google cannot be reached, verify() raises GoogleCertsUnavailable rather
+than InvalidGoogleToken, so the views answer 503 instead of blaming the
+token.
+"""
+
+import re
+import threading
+import time
+
+import requests
+from django.conf import settings
+from google.auth import exceptions as google_exceptions
+from google.auth import jwt
+from requests.adapters import HTTPAdapter
+
+CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+# Used when Google's response has no usable max-age
+DEFAULT_MAX_AGE = 3600
+MIN_REFETCH = 60
+CLOCK_SKEW = 10
+TIMEOUT = (3.05, 10)
+
+_session = None
+_certs = {"keys": None, "expires": 0.0, "fetched": 0.0}
+_lock = threading.Lock()
+
+
+class InvalidGoogleToken(ValueError):
+    pass
+
+
+class GoogleCertsUnavailable(Exception):
+    pass
+
+
+def certs_url():
+    return getattr(settings, "GOOGLE_CERTS_URL", CERTS_URL)
+
+
+def session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                s = requests.Session()
+                s.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+                s.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+                _session = s
+    return _session
+
+
+def max_age(headers):
+    """
+    Seconds the response may be cached for, from Cache-Control and Age.
+    """
+    cache_control = headers.get("Cache-Control", "")
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if not match:
+        return DEFAULT_MAX_AGE
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        age = 0
+    return max(int(match.group(1)) - age, 0)
+
+
+def fetch_certs():
+    try:
+        response = session().get(certs_url(), timeout=TIMEOUT)
+        response.raise_for_status()
+        return response.json(), max_age(response.headers)
+    except (requests.RequestException, ValueError) as e:
+        raise GoogleCertsUnavailable(f"Could not fetch Google certificates: {e}")
+
+
+def get_certs(refresh=False):
+    """
+    Google's current signing certificates, {key id: PEM}.
+    """
+    now = time.monotonic()
+    with _lock:
+        keys = _certs["keys"]
+        if keys is not None and _certs["expires"] > now and not refresh:
+            return keys
+        if keys is not None and refresh and now - _certs["fetched"] < MIN_REFETCH:
+            return keys
+
+    keys, ttl = fetch_certs()
+    with _lock:
+        _certs.update(keys=keys, expires=now + ttl, fetched=now)
+    return keys
+
+
+def clear():
+    with _lock:
+        _certs.update(keys=None, expires=0.0, fetched=0.0)
+
+
+def verify(token, audience=None):
+    """
+    Check a Google ID token's signature, expiry, issuer and (when
+    GOOGLE_CLIENT_ID is set) audience. Returns its claims.
+    """
+    if audience is None:
+        audience = getattr(settings, "GOOGLE_CLIENT_ID", None)
+
+    try:
+        key_id = jwt.decode_header(token).get("kid")
+    except (ValueError, google_exceptions.GoogleAuthError) as e:
+        raise InvalidGoogleToken(str(e))
+
+    certs = get_certs()
+    if key_id and key_id not in certs:
+        # Probably signed with a key published after our copy
+        certs = get_certs(refresh=True)
+
+    try:
+        claims = jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=CLOCK_SKEW)
+    except (ValueError, google_exceptions.GoogleAuthError) as e:
+        raise InvalidGoogleToken(str(e))
+
+    if claims.get("iss") not in ISSUERS:
+        raise InvalidGoogleToken(f"Wrong issuer: {claims.get('iss')}")
+    return claims
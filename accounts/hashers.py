@@ -0,0 +1,19 @@
+# accounts/hashers.py
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ProfiledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with its cost taken from AUTH_PASSWORD_ITERATIONS.
+
+    Same algorithm name as Django's hasher, so existing hashes keep
+    verifying. A hash made under another iteration count is reported by
+    must_update(), and the login path re-hashes it with the current
+    profile. List this first in PASSWORD_HASHERS.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, "AUTH_PASSWORD_ITERATIONS", PBKDF2PasswordHasher.iterations)
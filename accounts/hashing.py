@@ -0,0 +1,160 @@
+# accounts/hashing.py
+
+"""
+Password hashing off the request path.
+
+Hashing a password is deliberately slow (hundreds of milliseconds of CPU).
+Login and signup hand it to a small dedicated pool instead of running it
+on the request thread, and at most AUTH_HASH_QUEUE hashes may be running
+or waiting per process; past that, HashingBusy is raised at once and the
+view answers 503 with Retry-After rather than queue without bound.
+Database work stays on the request thread; pool threads only hash.
+
+This assumes threaded workers (gunicorn gthread, as in render.yaml): with
+--threads 8 and the default AUTH_HASH_QUEUE of 4, a login burst can hold
+at most 4 of a worker's 8 request threads, and the rest keep serving.
+AUTH_HASH_QUEUE must stay below the thread count. Under sync workers each
+process serves one request at a time and the cap never engages.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth import hashers
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+
+_stats = {"hashed": 0, "rejected": 0, "rehashed": 0, "running": 0, "peak": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """
+    Too many hashes already running or queued in this process.
+    """
+
+    retry_after = 1
+
+
+def pool():
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _slots = threading.BoundedSemaphore(getattr(settings, "AUTH_HASH_QUEUE", 4))
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "AUTH_HASH_WORKERS", 2),
+                    thread_name_prefix="password-hash",
+                )
+    return _pool
+
+
+def _timed(fn, *args):
+    with _stats_lock:
+        _stats["running"] += 1
+        _stats["peak"] = max(_stats["peak"], _stats["running"])
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        with _stats_lock:
+            _stats["running"] -= 1
+            _stats["hashed"] += 1
+            _stats["seconds"] += time.perf_counter() - started
+
+
+def run(fn, *args):
+    """
+    Run `fn(*args)` on the hashing pool and wait for its result.
+    """
+    executor = pool()
+    if not _slots.acquire(blocking=False):
+        with _stats_lock:
+            _stats["rejected"] += 1
+        raise HashingBusy()
+    slots = _slots
+    try:
+        future = executor.submit(_timed, fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # The slot is held until the hash finishes, even if we stop waiting
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=getattr(settings, "AUTH_HASH_TIMEOUT", 10))
+    except FutureTimeout:
+        future.cancel()
+        with _stats_lock:
+            _stats["rejected"] += 1
+        raise HashingBusy()
+
+
+def make_password(password):
+    return run(hashers.make_password, password)
+
+
+def _verify(password, encoded):
+    outdated = []
+    # Django calls the setter when the hash is right but was made with
+    # another hasher or cost than the preferred one
+    matches = hashers.check_password(password, encoded, setter=outdated.append)
+    return matches, bool(outdated)
+
+
+def check_password(password, encoded):
+    """
+    (matches, outdated): whether `password` matches `encoded`, and whether
+    `encoded` should be re-hashed under the current hasher profile.
+    """
+    return run(_verify, password, encoded)
+
+
+def authenticate(email, password):
+    """
+    The active user with this email and password, or None. Equivalent to
+    ModelBackend, but hashing on the pool. A hash made under an older
+    hasher profile is replaced with one made under the current profile.
+    """
+    User = get_user_model()
+    try:
+        user = User._default_manager.get_by_natural_key(email)
+    except User.DoesNotExist:
+        # Hash anyway, so unknown emails take as long as wrong passwords
+        make_password(password)
+        return None
+
+    matches, outdated = check_password(password, user.password)
+    if not matches or not user.is_active:
+        return None
+
+    if outdated:
+        user.password = make_password(password)
+        user.save(update_fields=["password"])
+        with _stats_lock:
+            _stats["rehashed"] += 1
+    return user
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset():
+    """
+    Drop the pool, e.g. after changing AUTH_HASH_WORKERS in tests.
+    """
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = _slots = None
+    with _stats_lock:
+        _stats.update(hashed=0, rejected=0, rehashed=0, running=0, peak=0, seconds=0.0)
@@ -0,0 +1,99 @@
+# accounts/management/commands/bench_logins.py
+
+import os
+import threading
+import time
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from accounts import hashing
+from accounts.hashers import ProfiledPBKDF2PasswordHasher
+from payments.management.commands.bench_payment_init import percentile
+
+PASSWORD = "correct horse battery staple"
+
+
+def cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Password checks per second (and per core) for each hasher cost "
+        "profile, hashing inline on every request thread (before) and on "
+        "the bounded hashing pool (after). A probe thread stands in for the "
+        "other endpoints and reports how long it waits meanwhile. No "
+        "database access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations", default=f"{hashers.PBKDF2PasswordHasher.iterations},600000",
+            help="Comma-separated PBKDF2 iteration counts to compare",
+        )
+        parser.add_argument("--threads", type=int, default=16, help="Concurrent login requests")
+        parser.add_argument("--workers", type=int, default=2, help="AUTH_HASH_WORKERS for the pooled run")
+        parser.add_argument("--seconds", type=float, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{cores()} core(s), {options['threads']} concurrent logins")
+        for iterations in [int(n) for n in options["iterations"].split(",")]:
+            with override_settings(AUTH_PASSWORD_ITERATIONS=iterations):
+                encoded = ProfiledPBKDF2PasswordHasher().encode(PASSWORD, hashers.get_hasher().salt())
+
+            self.run(f"{iterations} it, inline", options, lambda: hashers.check_password(PASSWORD, encoded))
+
+            hashing.reset()
+            with override_settings(AUTH_HASH_WORKERS=options["workers"], AUTH_HASH_QUEUE=options["threads"]):
+                self.run(
+                    f"{iterations} it, pool of {options['workers']}", options,
+                    lambda: hashing.check_password(PASSWORD, encoded),
+                )
+            hashing.reset()
+
+    def run(self, label, options, login):
+        deadline = time.monotonic() + options["seconds"]
+        done, busy, latencies, probes = [0], [0], [], []
+        lock = threading.Lock()
+
+        def client():
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    login()
+                except hashing.HashingBusy:
+                    with lock:
+                        busy[0] += 1
+                    continue
+                with lock:
+                    done[0] += 1
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        def probe():
+            # A cheap request: a little Python work, every 10 ms
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                sum(range(2000))
+                probes.append((time.perf_counter() - started) * 1000)
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=client) for _ in range(options["threads"])]
+        threads.append(threading.Thread(target=probe))
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        rate = done[0] / elapsed
+        self.stdout.write(
+            f"{label:>28}: {rate:7.1f} logins/s  {rate / cores():6.1f}/s per core  "
+            f"p95 {percentile(latencies or [0], 95):7.1f} ms  busy {busy[0]:5d}  "
+            f"probe p95 {percentile(probes or [0], 95):6.2f} ms"
+        )
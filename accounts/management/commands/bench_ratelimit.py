@@ -0,0 +1,76 @@
+# accounts/management/commands/bench_ratelimit.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from accounts import ratelimit
+from payments.management.commands.bench_payment_init import percentile
+
+
+class Plain(APIView):
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = []
+
+    def post(self, request):
+        return Response({})
+
+
+class Throttled(Plain):
+    throttle_classes = [ratelimit.ContactThrottle]
+
+
+class Command(BaseCommand):
+    help = (
+        "Overhead of the rate limiter on the configured cache backend: one "
+        "limiter check on its own, and a DRF POST with and without a "
+        "throttle. Clients are spread over --clients IPs; the limit is set "
+        "high enough that nothing is denied."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20000)
+        parser.add_argument("--clients", type=int, default=100, help="Distinct client IPs")
+
+    def handle(self, *args, **options):
+        count, clients = options["requests"], options["clients"]
+        rate = f"{count * 10}/m"
+        self.stdout.write(f"Cache backend: {settings.CACHES['default']['BACKEND']}")
+        if not ratelimit.cache_is_shared():
+            self.stderr.write(self.style.WARNING(
+                "Warning: this cache is per process. Every worker keeps its own "
+                "counters, so deployed limits are the configured rate times the "
+                "number of workers; configure a shared cache (Redis / Memcached)."
+            ))
+
+        ratelimit.reset()
+        self.timed("limiter check", count, lambda n: ratelimit.hit("bench", f"10.0.{n % clients // 256}.{n % 256}", rate))
+        stats = ratelimit.stats()
+        self.stdout.write(f"{'':>22}  {stats['cache_trips'] / stats['checks']:.3f} cache round trips per check")
+
+        factory = APIRequestFactory()
+        requests = [
+            factory.post("/bench/", {}, format="json", REMOTE_ADDR=f"10.1.{n // 256}.{n % 256}")
+            for n in range(clients)
+        ]
+        plain, throttled = Plain.as_view(), Throttled.as_view()
+        with override_settings(RATE_LIMITS={"contact": rate}):
+            without = self.timed("POST, no throttle", count, lambda n: plain(requests[n % clients]))
+            with_throttle = self.timed("POST, throttled", count, lambda n: throttled(requests[n % clients]))
+        self.stdout.write(f"{'':>22}  overhead {(with_throttle - without) * 1000:.1f} us per request (p50)")
+
+    def timed(self, label, count, call):
+        samples = []
+        for n in range(count):
+            started = time.perf_counter()
+            call(n)
+            samples.append((time.perf_counter() - started) * 1000)
+        p50 = percentile(samples, 50)
+        self.stdout.write(f"{label:>22}: p50 {p50 * 1000:7.1f} us  p99 {percentile(samples, 99) * 1000:7.1f} us")
+        return p50
@@ -0,0 +1,132 @@
+# accounts/management/commands/import_users.py
+
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import hashers
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from accounts.models import CustomUser
+from accounts.services import DuplicateUser, UserService
+
+
+def encode(row):
+    """
+    The stored password for a CSV row: its password_hash column as is,
+    its password column hashed, or an unusable password.
+    """
+    if row.get("password_hash"):
+        hashers.identify_hasher(row["password_hash"])  # ValueError if not a Django hash
+        return row["password_hash"]
+    return hashers.make_password(row.get("password") or None)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users from a CSV with columns email, first_name, last_name, "
+        "phone and either password or password_hash (an existing Django "
+        "hash). Rows without either get an unusable password. Passwords are "
+        "hashed in parallel up front and each batch is written with one "
+        "bulk_create; rows whose email or phone is already taken are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path")
+        parser.add_argument("--user-type", choices=["guest", "staff"], default="guest")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--hash-workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--dry-run", action="store_true", help="Validate and report without writing")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["csv_path"], newline="", encoding="utf-8-sig") as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            raise CommandError(str(e))
+
+        totals = {"created": 0, "duplicates": 0, "invalid": 0}
+        rows = self.valid_rows(rows, totals)
+
+        with ThreadPoolExecutor(max_workers=options["hash_workers"]) as pool:
+            for start in range(0, len(rows), options["batch_size"]):
+                batch = self.new_rows(rows[start:start + options["batch_size"]], totals)
+                try:
+                    passwords = list(pool.map(encode, batch))
+                except ValueError as e:
+                    raise CommandError(f"Bad password_hash: {e}")
+                users = [
+                    UserService.build_user(row, options["user_type"], password)
+                    for row, password in zip(batch, passwords)
+                ]
+                if not options["dry_run"]:
+                    self.insert(users, totals)
+                else:
+                    totals["created"] += len(users)
+
+        prefix = "Would import" if options["dry_run"] else "Imported"
+        self.stdout.write(
+            f"{prefix} {totals['created']} {options['user_type']} user(s); skipped "
+            f"{totals['duplicates']} duplicate(s) and {totals['invalid']} invalid row(s)"
+        )
+
+    def valid_rows(self, rows, totals):
+        valid, seen = [], set()
+        for line, row in enumerate(rows, start=2):
+            row = {key.strip(): (value or "").strip() for key, value in row.items() if key}
+            try:
+                validate_email(row.get("email", ""))
+            except ValidationError:
+                self.stderr.write(f"Line {line}: invalid email {row.get('email')!r}")
+                totals["invalid"] += 1
+                continue
+            # Duplicates within the file itself
+            keys = {("email", CustomUser.objects.normalize_email(row["email"]))}
+            if row.get("phone"):
+                keys.add(("phone", row["phone"]))
+            if keys & seen:
+                totals["duplicates"] += 1
+                continue
+            seen |= keys
+            valid.append(row)
+        return valid
+
+    def new_rows(self, batch, totals):
+        """
+        Drop rows whose email or phone is already in the database; two
+        queries per batch.
+        """
+        emails = {CustomUser.objects.normalize_email(row["email"]) for row in batch}
+        phones = {row["phone"] for row in batch if row.get("phone")}
+        taken_emails = set(CustomUser.objects.filter(email__in=emails).values_list("email", flat=True))
+        taken_phones = set(CustomUser.objects.filter(phone__in=phones).values_list("phone", flat=True))
+
+        fresh = [
+            row for row in batch
+            if CustomUser.objects.normalize_email(row["email"]) not in taken_emails
+            and row.get("phone") not in taken_phones
+        ]
+        totals["duplicates"] += len(batch) - len(fresh)
+        return fresh
+
+    def insert(self, users, totals):
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(users)
+            totals["created"] += len(users)
+        except IntegrityError:
+            # Someone registered one of these meanwhile: fall back to one
+            # insert per row for this batch
+            for user in users:
+                user.pk = None
+                user._state.adding = True
+                try:
+                    with transaction.atomic():
+                        user.save(force_insert=True)
+                    totals["created"] += 1
+                except IntegrityError as e:
+                    self.stderr.write(f"{user.email}: {DuplicateUser(UserService.duplicate_field(e, user))}")
+                    totals["duplicates"] += 1
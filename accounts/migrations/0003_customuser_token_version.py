@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_contactmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
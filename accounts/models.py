@@ -11,6 +11,10 @@ GENDERS = (
     ('female', 'Female'),
 )
 
+# Fields access tokens carry as claims, see accounts/authentication.py
+TOKEN_FIELDS = ("user_type", "is_disabled", "is_active", "is_staff")
+
+
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     user_type = models.CharField(max_length=20, choices=USER_TYPES, default='guest')
@@ -21,6 +25,9 @@ class CustomUser(AbstractUser):
     birth_date = models.DateField(blank=True, null=True)
     is_verified = models.BooleanField(default=False)
     is_disabled = models.BooleanField(default=False)
+    # Bumped whenever a field the access tokens carry changes, which
+    # invalidates the outstanding ones (accounts/authentication.py)
+    token_version = models.PositiveIntegerField(default=0)
     created = models.DateTimeField(auto_now_add=True)
 
     USERNAME_FIELD = 'email'
@@ -29,6 +36,27 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.email
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_token_fields = instance.token_fields()
+        return instance
+
+    def token_fields(self):
+        return tuple(self.__dict__.get(field) for field in TOKEN_FIELDS)
+
+    def save(self, *args, **kwargs):
+        # A change to a field the access tokens carry invalidates them
+        # (queryset.update() bypasses this, so change those fields with
+        # save()). Users saved without being loaded first are bumped
+        # regardless.
+        if not self._state.adding and getattr(self, "_loaded_token_fields", None) != self.token_fields():
+            self.token_version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "token_version"}
+        super().save(*args, **kwargs)
+        self._loaded_token_fields = self.token_fields()
+
 
 class ContactMessage(models.Model):
     name = models.CharField(max_length=120)
@@ -0,0 +1,261 @@
+# accounts/ratelimit.py
+
+"""
+Sliding-window rate limiting for the public endpoints.
+
+Each key (client IP, or an identity such as the email being logged into)
+gets one counter per fixed window in the shared cache. A hit is a single
+atomic cache.incr on the current window's counter; the request is allowed
+while
+
+    previous_count * (share of the previous window still in view) + current_count
+
+stays within the limit, which approximates a true sliding window without
+storing timestamps. The previous window's count no longer changes, so each
+worker reads it once and keeps it, leaving one cache round trip per key in
+the steady state (two on a client's first request in a window).
+
+Use a SlidingWindowThrottle subclass in `throttle_classes` on DRF views, or
+@rate_limit on plain views and view methods. Rates use DRF's "10/m"
+format and can be overridden per scope with the RATE_LIMITS setting.
+
+The counters must live in a cache every worker process shares (Redis /
+Memcached). With the default per-process local-memory backend each worker
+counts on its own, so the effective limit is the configured rate times the
+number of workers; cache_is_shared() tells which case applies, and
+`manage.py bench_ratelimit` warns about it.
+"""
+
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+KEY = "ratelimit:{scope}:{ident}:{window}"
+
+DEFAULT_RATES = {
+    "login": "10/m",
+    "login-identity": "5/m",
+    "signup": "5/m",
+    "signup-identity": "3/m",
+    "contact": "5/m",
+    "subscribe": "5/m",
+    "availability": "30/m",
+}
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# What this worker already knows: previous-window counts it has read, and
+# current-window counters it has seen exist
+_previous = {}
+_existing = set()
+_memo_lock = threading.Lock()
+MAX_REMEMBERED = 10_000
+
+_stats = {"checks": 0, "denied": 0, "cache_trips": 0}
+_stats_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """
+    "10/m" -> (10, 60).
+    """
+    count, period = rate.split("/")
+    return int(count), PERIODS[period[0]]
+
+
+def rate_for(scope):
+    return getattr(settings, "RATE_LIMITS", {}).get(scope, DEFAULT_RATES[scope])
+
+
+def _remember(key, count=None):
+    with _memo_lock:
+        if len(_previous) + len(_existing) >= MAX_REMEMBERED:
+            _previous.clear()
+            _existing.clear()
+        if count is None:
+            _existing.add(key)
+        else:
+            _previous[key] = count
+
+
+def _previous_count(key):
+    with _memo_lock:
+        if key in _previous:
+            return _previous[key], 0
+    count = cache.get(key, 0)
+    _remember(key, count)
+    return count, 1
+
+
+def _increment(key, timeout):
+    trips = 0
+    if key in _existing:
+        try:
+            return cache.incr(key), 1
+        except ValueError:
+            trips += 1  # evicted
+    if cache.add(key, 1, timeout):
+        count = 1
+    else:
+        count = cache.incr(key)
+        trips += 1
+    _remember(key)
+    return count, trips + 1
+
+
+def retry_after(limit, period, previous, current, elapsed):
+    """
+    Seconds until one more request would fit under the limit again.
+    Denied requests are counted too, so a client that keeps retrying early
+    keeps pushing this out.
+    """
+    if previous and current < limit:
+        # Wait for enough of the previous window to slide out of view
+        wait = period * (1 - (limit - current - 1) / previous) - elapsed
+    else:
+        # Wait for the next window, and for enough of this one to slide out
+        wait = (period - elapsed) + period * (1 - (limit - 1) / max(current, 1))
+    return max(1, math.ceil(wait))
+
+
+def hit(scope, ident, rate=None):
+    """
+    Count one request for `ident` under `scope`. Returns (allowed,
+    retry_after seconds or None).
+    """
+    limit, period = parse_rate(rate or rate_for(scope))
+    now = time.time()
+    window = int(now // period)
+    elapsed = now - window * period
+
+    current, trips = _increment(KEY.format(scope=scope, ident=ident, window=window), period * 2)
+    previous, previous_trips = _previous_count(KEY.format(scope=scope, ident=ident, window=window - 1))
+
+    estimate = previous * (1 - elapsed / period) + current
+    allowed = estimate <= limit
+    with _stats_lock:
+        _stats["checks"] += 1
+        _stats["cache_trips"] += trips + previous_trips
+        if not allowed:
+            _stats["denied"] += 1
+
+    if allowed:
+        return True, None
+    return False, retry_after(limit, period, previous, current, elapsed)
+
+
+def cache_is_shared():
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def client_ip(request):
+    """
+    The client address, honouring X-Forwarded-For behind the proxy (the
+    last NUM_PROXIES entries are our own proxies).
+    """
+    proxies = getattr(settings, "RATE_LIMIT_NUM_PROXIES", 1)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if forwarded and proxies:
+        addresses = [address.strip() for address in forwarded.split(",")]
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset():
+    with _memo_lock:
+        _previous.clear()
+        _existing.clear()
+    with _stats_lock:
+        _stats.update(checks=0, denied=0, cache_trips=0)
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Limits each client IP to the `scope` rate and, when `identity_field`
+    is set, each value of that request field (e.g. the email being logged
+    into) to the `scope`-identity rate, so spreading one target across
+    many IPs does not help.
+    """
+
+    scope = None
+    identity_field = None
+
+    def __init__(self):
+        self.retry_after = None
+
+    def idents(self, request):
+        yield self.scope, client_ip(request)
+        if self.identity_field:
+            try:
+                value = request.data.get(self.identity_field)
+            except AttributeError:
+                value = None
+            if value:
+                yield f"{self.scope}-identity", str(value).strip().lower()
+
+    def allow_request(self, request, view):
+        if request.method in ("GET", "HEAD", "OPTIONS"):
+            return True
+        for scope, ident in self.idents(request):
+            allowed, wait = hit(scope, ident)
+            if not allowed:
+                self.retry_after = wait
+                return False
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class LoginThrottle(SlidingWindowThrottle):
+    scope = "login"
+    identity_field = "email"
+
+
+class SignupThrottle(SlidingWindowThrottle):
+    scope = "signup"
+    identity_field = "email"
+
+
+class ContactThrottle(SlidingWindowThrottle):
+    scope = "contact"
+
+
+class SubscribeThrottle(SlidingWindowThrottle):
+    scope = "subscribe"
+
+
+class AvailabilityThrottle(SlidingWindowThrottle):
+    scope = "availability"
+
+
+def rate_limit(scope, rate=None):
+    """
+    Per-IP limit for a plain view function or a view method. Over the
+    limit, answers 429 with Retry-After without calling the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            request = next(arg for arg in args if hasattr(arg, "META"))
+            allowed, wait = hit(scope, client_ip(request), rate)
+            if not allowed:
+                response = JsonResponse({"detail": "Request was throttled."}, status=429)
+                response["Retry-After"] = str(wait)
+                return response
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -1,44 +1,118 @@
 # accounts/services.py
-from django.db import transaction
+import re
+
+from django.contrib.auth import hashers
+from django.db import IntegrityError, connection, transaction
+from accounts import hashing
 from accounts.models import CustomUser
 
+# Unique columns -> the registration error for each. username is the
+# email, so a username clash is an email clash.
+UNIQUE_FIELDS = {
+    "email": "Email already used",
+    "username": "Email already used",
+    "phone": "Phone number already used",
+}
+
+
+# SQLite names the failed column as table.column
+SQLITE_UNIQUE = re.compile(r"UNIQUE constraint failed: (\w+)\.(\w+)")
+
+
+class DuplicateUser(ValueError):
+    def __init__(self, field):
+        self.field = "email" if field == "username" else field
+        super().__init__(UNIQUE_FIELDS[field])
+
+
 class UserService:
 
     @staticmethod
-    @transaction.atomic
-    def create_guest_user(data):
+    def build_user(data, user_type, encoded_password=None):
+        """
+        An unsaved user with every registration field set, so it can be
+        inserted in one statement. Pass `encoded_password` when the hash is
+        already made; otherwise data["password"] is hashed here.
+        """
+        if encoded_password is None:
+            encoded_password = hashers.make_password(data.get("password") or None)
+        email = CustomUser.objects.normalize_email(data["email"])
+        return CustomUser(
+            username=email,
+            email=email,
+            password=encoded_password,
+            first_name=data.get("first_name", ""),
+            last_name=data.get("last_name", ""),
+            phone=data.get("phone") or None,
+            user_type=user_type,
+        )
+
+    @staticmethod
+    def unique_columns():
+        """
+        {column: field name} for the unique user columns.
+        """
+        return {
+            CustomUser._meta.get_field(field).column: field
+            for field in UNIQUE_FIELDS
+        }
+
+    @staticmethod
+    def violated_column(error):
+        """
+        The column an IntegrityError names, or None if the backend does not
+        say: the constraint name on PostgreSQL, table.column on SQLite.
+        """
+        table = CustomUser._meta.db_table
+        constraint = getattr(getattr(error.__cause__, "diag", None), "constraint_name", None)
+        if constraint:
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, table)
+            columns = constraints.get(constraint, {}).get("columns") or []
+            return columns[0] if len(columns) == 1 else None
+
+        match = SQLITE_UNIQUE.search(str(error))
+        if match and match.group(1) == table:
+            return match.group(2)
+        return None
+
+    @staticmethod
+    def duplicate_field(error, user):
+        """
+        Which unique field an IntegrityError on inserting `user` was about.
+        """
+        field = UserService.unique_columns().get(UserService.violated_column(error))
+        if field:
+            return field
+        # Backend did not name the column: ask the database
+        if CustomUser.objects.filter(email=user.email).exists():
+            return "email"
+        if user.phone and CustomUser.objects.filter(phone=user.phone).exists():
+            return "phone"
+        raise error
+
+    @staticmethod
+    def create_user(data, user_type):
+        """
+        Register a user with a single INSERT. The unique constraints do the
+        duplicate checks; a clash raises DuplicateUser. The password is
+        hashed on the bounded hashing pool.
+        """
+        user = UserService.build_user(data, user_type, hashing.make_password(data["password"]))
         try:
-            user = CustomUser.objects.create_user(
-                username=data["email"],
-                email=data["email"],
-                password=data["password"],
-                first_name=data.get("first_name", ""),
-                last_name=data.get("last_name", "")
-            )
-            user.phone = data.get("phone")
-            user.user_type = "guest"
-            user.save()
-            return user
-        except Exception as e:
-            raise ValueError(f"Error creating guest user: {str(e)}")
-
-    @staticmethod
-    @transaction.atomic
+            with transaction.atomic():
+                user.save(force_insert=True)
+        except IntegrityError as e:
+            raise DuplicateUser(UserService.duplicate_field(e, user))
+        return user
+
+    @staticmethod
+    def create_guest_user(data):
+        return UserService.create_user(data, "guest")
+
+    @staticmethod
     def create_staff_user(data):
-        try:
-            user = CustomUser.objects.create_user(
-                username=data["email"],
-                email=data["email"],
-                password=data["password"],
-                first_name=data.get("first_name", ""),
-                last_name=data.get("last_name", "")
-            )
-            user.phone = data.get("phone")
-            user.user_type = "staff"
-            user.save()
-            return user
-        except Exception as e:
-            raise ValueError(f"Error creating staff user: {str(e)}")
+        return UserService.create_user(data, "staff")
 
     @staticmethod
     def user_exists(email):
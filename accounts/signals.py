@@ -0,0 +1,25 @@
+# accounts/signals.py
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User, dispatch_uid="auth-user-saved")
+def user_saved(sender, instance, **kwargs):
+    # Drop cached copies now and again after commit, so a worker cannot
+    # re-cache the old row in between.
+    invalidate_user(instance)
+    transaction.on_commit(lambda: invalidate_user(instance))
+
+
+@receiver(post_delete, sender=User, dispatch_uid="auth-user-deleted")
+def user_deleted(sender, instance, **kwargs):
+    # The next token check finds no row and rejects the token
+    invalidate_user(instance)
+    transaction.on_commit(lambda: invalidate_user(instance))
@@ -1,3 +1,579 @@
-from django.test import TestCase
+import json
+from io import StringIO
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import rsa
+from django.contrib.auth import hashers
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from google.auth import crypt, jwt
+
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import authentication, google, hashing, ratelimit
+from .authentication import ClaimsUser, UserRefreshToken
+from .models import CustomUser
+from .services import UserService
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.clear()
+        self.user = CustomUser.objects.create_user(
+            username="claims", email="claims@example.com", password="pw", user_type="staff",
+        )
+        self.client = APIClient()
+
+    def login(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_access_token_carries_claims(self):
+        access = UserRefreshToken.for_user(self.user).access_token
+        self.assertEqual(access["email"], "claims@example.com")
+        self.assertEqual(access["user_type"], "staff")
+        self.assertFalse(access["is_disabled"])
+        self.assertTrue(access["is_active"])
+        self.assertFalse(access["is_staff"])
+
+    def test_whoami_needs_no_queries(self):
+        self.login(UserRefreshToken.for_user(self.user).access_token)
+        # The first request reads the token version from the database
+        with self.assertNumQueries(1):
+            self.client.get("/api/accounts/auth/whoami/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/accounts/auth/whoami/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["email"], "claims@example.com")
+        self.assertEqual(response.json()["user_type"], "staff")
+
+    def test_token_without_claims_falls_back_to_database(self):
+        self.login(RefreshToken.for_user(self.user).access_token)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/accounts/auth/whoami/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user_type"], "staff")
+
+    def test_disabling_user_rejects_outstanding_tokens(self):
+        self.login(UserRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 200)
+
+        self.user.is_disabled = True
+        self.user.save()
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 401)
+
+        # Re-enabling does not revive the old tokens; a new login works
+        self.user.is_disabled = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 401)
+        self.login(UserRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 200)
+
+    def test_deactivating_user_rejects_outstanding_tokens(self):
+        self.login(UserRefreshToken.for_user(self.user).access_token)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 401)
+
+        refresh = UserRefreshToken.for_user(self.user)
+        self.assertFalse(refresh.access_token["is_active"])
+        with self.assertRaises(AuthenticationFailed):
+            authentication.refreshed_access_token(RefreshToken(str(refresh)))
+
+    def test_deleting_user_rejects_outstanding_tokens(self):
+        self.login(UserRefreshToken.for_user(self.user).access_token)
+        self.user.delete()
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 401)
+
+    def test_inactive_claim_is_rejected(self):
+        self.user.is_active = False
+        self.login(UserRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 401)
+
+    def test_disabled_claim_is_rejected(self):
+        self.user.is_disabled = True
+        self.login(UserRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 401)
+
+    def test_full_user_is_cached_until_saved(self):
+        user = ClaimsUser(UserRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(user.id, self.user.pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.get_user().pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user.get_user()
+
+        CustomUser.objects.get(pk=self.user.pk).save(update_fields=["first_name"])
+        with self.assertNumQueries(1):
+            user.get_user()
+
+    @override_settings(AUTH_USER_CACHE_TTL=0)
+    def test_full_user_cache_expires(self):
+        user = ClaimsUser(UserRefreshToken.for_user(self.user).access_token)
+        user.get_user()
+        with self.assertNumQueries(1):
+            user.get_user()
+
+    def test_demoted_staff_loses_access_and_refresh_rereads_claims(self):
+        self.user.is_staff = True
+        self.user.save()
+        refresh = UserRefreshToken.for_user(self.user)
+        self.assertNotIn("is_staff", refresh.payload)
+        self.login(refresh.access_token)
+        self.assertEqual(self.client.get(reverse("payment-metrics")).status_code, 200)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 401)
+
+        response = self.client.post("/api/accounts/token/refresh/", {"refresh": str(refresh)}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        access = response.json()["access"]
+        self.assertFalse(UserRefreshToken.access_token_class(access)["is_staff"])
+        self.login(access)
+        self.assertEqual(self.client.get(reverse("payment-metrics")).status_code, 403)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post("/api/accounts/token/refresh/", {"refresh": str(refresh)}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_evicted_token_version_fails_closed(self):
+        self.login(UserRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 200)
+        CustomUser.objects.filter(pk=self.user.pk).update(token_version=5)  # e.g. a save by another worker
+        cache.clear()
+        self.assertEqual(self.client.get("/api/accounts/auth/whoami/").status_code, 401)
+
+    def test_refreshed_access_token_rereads_claims(self):
+        refresh = UserRefreshToken.for_user(self.user)
+        self.user.user_type = "guest"
+        self.user.save()
+
+        access = authentication.refreshed_access_token(RefreshToken(str(refresh)))
+        self.assertEqual(access["user_type"], "guest")
+
+
+class CertsServer:
+    """
+    Serves a Google-style {key id: PEM} certificate set on a local port.
+    """
+
+    def __init__(self, keys, cache_control="public, max-age=3600", status=200):
+        outer = self
+        self.keys = keys
+        self.cache_control = cache_control
+        self.status = status
+        self.hits = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                outer.hits += 1
+                payload = json.dumps(outer.keys).encode()
+                self.send_response(outer.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", outer.cache_control)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/oauth2/v1/certs"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class GoogleIdTokenTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.keys = {}
+        for key_id in ("key-1", "key-2"):
+            public, private = rsa.newkeys(1024)
+            cls.keys[key_id] = (
+                public.save_pkcs1().decode(),
+                crypt.RSASigner.from_string(private.save_pkcs1(), key_id=key_id),
+            )
+
+    def setUp(self):
+        google.clear()
+
+    def certs(self, *key_ids):
+        return {key_id: self.keys[key_id][0] for key_id in key_ids}
+
+    def id_token(self, key_id="key-1", **claims):
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com", "aud": "client-id", "sub": "1",
+            "email": "google@example.com", "iat": now, "exp": now + 600,
+        }
+        payload.update(claims)
+        return jwt.encode(self.keys[key_id][1], payload).decode()
+
+    def test_both_login_views_share_the_cached_keys(self):
+        with CertsServer(self.certs("key-1")) as certs, override_settings(GOOGLE_CERTS_URL=certs.url):
+            client = APIClient()
+            for path in ("/api/accounts/auth/google-login/", "/api/rooms/auth/google-login/"):
+                response = client.post(path, {"id_token": self.id_token()}, format="json")
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertIn("access", response.json())
+            self.assertEqual(certs.hits, 1)
+        self.assertEqual(CustomUser.objects.filter(email="google@example.com").count(), 1)
+
+    def test_keys_are_refetched_when_max_age_runs_out(self):
+        with CertsServer(self.certs("key-1"), cache_control="public, max-age=0") as certs, \
+                override_settings(GOOGLE_CERTS_URL=certs.url):
+            google.verify(self.id_token())
+            google.verify(self.id_token())
+            self.assertEqual(certs.hits, 2)
+
+    def test_unknown_key_id_refetches(self):
+        with CertsServer(self.certs("key-1")) as certs, override_settings(GOOGLE_CERTS_URL=certs.url):
+            google.verify(self.id_token())
+            # Too soon after the last fetch: no refetch
+            with self.assertRaises(google.InvalidGoogleToken):
+                google.verify(self.id_token("key-2"))
+            self.assertEqual(certs.hits, 1)
+
+            certs.keys = self.certs("key-1", "key-2")
+            with mock.patch.object(google, "MIN_REFETCH", 0):
+                self.assertEqual(google.verify(self.id_token("key-2"))["email"], "google@example.com")
+            self.assertEqual(certs.hits, 2)
+
+    def test_rejects_bad_tokens(self):
+        with CertsServer(self.certs("key-1")) as certs, override_settings(GOOGLE_CERTS_URL=certs.url):
+            # key-1's header on a token signed with key-2
+            _, payload, signature = self.id_token("key-2").split(".")
+            forged = ".".join([self.id_token().split(".")[0], payload, signature])
+            bad = [
+                forged,
+                self.id_token(iss="https://evil.example.com"),
+                self.id_token(exp=int(time.time()) - 600),
+                "not-a-token",
+            ]
+            for token in bad:
+                with self.assertRaises(google.InvalidGoogleToken):
+                    google.verify(token)
+
+            with override_settings(GOOGLE_CLIENT_ID="other-client"):
+                with self.assertRaises(google.InvalidGoogleToken):
+                    google.verify(self.id_token())
+
+            response = APIClient().post("/api/rooms/auth/google-login/", {"id_token": forged}, format="json")
+            self.assertEqual(response.status_code, 401)
+
+    def test_certs_outage_is_503_not_401(self):
+        with CertsServer({}, status=500) as certs, override_settings(GOOGLE_CERTS_URL=certs.url):
+            with self.assertRaises(google.GoogleCertsUnavailable):
+                google.verify(self.id_token())
+            for path in ("/api/accounts/auth/google-login/", "/api/rooms/auth/google-login/"):
+                response = APIClient().post(path, {"id_token": self.id_token()}, format="json")
+                self.assertEqual(response.status_code, 503, response.content)
+
+        # Nothing listening at all
+        with override_settings(GOOGLE_CERTS_URL=certs.url):
+            response = APIClient().post("/api/rooms/auth/google-login/", {"id_token": self.id_token()}, format="json")
+            self.assertEqual(response.status_code, 503)
+
+    def test_max_age(self):
+        self.assertEqual(google.max_age({"Cache-Control": "public, max-age=300", "Age": "100"}), 200)
+        self.assertEqual(google.max_age({"Cache-Control": "no-cache"}), 0)
+        self.assertEqual(google.max_age({}), google.DEFAULT_MAX_AGE)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["accounts.hashers.ProfiledPBKDF2PasswordHasher"],
+    AUTH_PASSWORD_ITERATIONS=1000,
+)
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        hashing.reset()
+        self.addCleanup(hashing.reset)
+        self.user = CustomUser.objects.create_user(username="hash", email="hash@example.com", password="secret-pw")
+        self.client = APIClient()
+
+    def login(self, password="secret-pw"):
+        return self.client.post("/api/accounts/auth/login/", {"email": "hash@example.com", "password": password}, format="json")
+
+    def test_login_hashes_on_the_pool(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login("wrong").status_code, 401)
+        stats = hashing.stats()
+        self.assertEqual(stats["hashed"], 2)
+        self.assertEqual(stats["rehashed"], 0)
+
+    def test_unknown_email_still_hashes(self):
+        response = self.client.post("/api/accounts/auth/login/", {"email": "nobody@example.com", "password": "x"}, format="json")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(hashing.stats()["hashed"], 1)
+
+    def test_login_rehashes_when_the_profile_changes(self):
+        self.assertIn("$1000$", self.user.password)
+        with override_settings(AUTH_PASSWORD_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertIn("$2000$", self.user.password)
+            self.assertTrue(self.user.check_password("secret-pw"))
+            self.assertEqual(hashing.stats()["rehashed"], 1)
+
+            self.assertEqual(self.login().status_code, 200)
+            self.assertEqual(hashing.stats()["rehashed"], 1)
+
+    @override_settings(AUTH_HASH_QUEUE=0)
+    def test_full_pool_answers_503(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(hashing.stats()["rejected"], 1)
+
+    @override_settings(AUTH_HASH_WORKERS=1, AUTH_HASH_QUEUE=2)
+    def test_pool_bounds_concurrent_hashing(self):
+        release = threading.Event()
+        results = []
+
+        def slow():
+            release.wait(5)
+            return True
+
+        waiters = [threading.Thread(target=lambda: results.append(hashing.run(slow))) for _ in range(2)]
+        for thread in waiters:
+            thread.start()
+        time.sleep(0.1)
+        with self.assertRaises(hashing.HashingBusy):
+            hashing.run(slow)
+        release.set()
+        for thread in waiters:
+            thread.join()
+        self.assertEqual(results, [True, True])
+        self.assertEqual(hashing.stats()["peak"], 1)
+
+    def test_signup_stores_a_profiled_hash(self):
+        response = self.client.post(
+            "/api/accounts/auth/signup/",
+            {"name": "New", "email": "new@example.com", "password": "pw-123456"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        user = CustomUser.objects.get(email="new@example.com")
+        self.assertIn("$1000$", user.password)
+        self.assertTrue(user.check_password("pw-123456"))
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        self.client = APIClient()
+
+    def test_allows_up_to_the_limit(self):
+        with mock.patch("accounts.ratelimit.time.time", return_value=600.0):
+            results = [ratelimit.hit("test", "1.2.3.4", "3/m") for _ in range(4)]
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False])
+        # 60 s to the next window, then half of it for the 4 hits to slide out
+        self.assertEqual(results[-1][1], 90)
+        self.assertTrue(ratelimit.hit("test", "5.6.7.8", "3/m")[0])
+
+    def test_previous_window_slides_out(self):
+        with mock.patch("accounts.ratelimit.time.time", return_value=600.0):
+            for _ in range(4):
+                ratelimit.hit("test", "ip", "4/m")
+        # A quarter into the next window, 3 of the previous 4 still count
+        with mock.patch("accounts.ratelimit.time.time", return_value=675.0):
+            self.assertTrue(ratelimit.hit("test", "ip", "4/m")[0])
+            allowed, wait = ratelimit.hit("test", "ip", "4/m")
+        self.assertFalse(allowed)
+        self.assertEqual(wait, 30)
+        with mock.patch("accounts.ratelimit.time.time", return_value=705.0):
+            self.assertTrue(ratelimit.hit("test", "ip", "4/m")[0])
+
+    @mock.patch("accounts.ratelimit.time.time", return_value=600.0)
+    def test_one_cache_round_trip_per_check(self, _):
+        ratelimit.hit("test", "ip", "100/m")
+        before = ratelimit.stats()["cache_trips"]
+        for _ in range(10):
+            ratelimit.hit("test", "ip", "100/m")
+        self.assertEqual(ratelimit.stats()["cache_trips"] - before, 10)
+
+    @override_settings(RATE_LIMITS={"login": "2/m", "login-identity": "3/m"})
+    def test_login_throttle(self):
+        def login(ip, email="limit@example.com"):
+            return self.client.post(
+                "/api/accounts/auth/login/", {"email": email, "password": "x"}, format="json", REMOTE_ADDR=ip,
+            )
+
+        self.assertEqual(login("10.0.0.1").status_code, 401)
+        self.assertEqual(login("10.0.0.1").status_code, 401)
+        response = login("10.0.0.1")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+        # Same account from another address: the per-email limit applies
+        self.assertEqual(login("10.0.0.2").status_code, 401)
+        self.assertEqual(login("10.0.0.3").status_code, 429)
+        self.assertEqual(login("10.0.0.4", "other@example.com").status_code, 401)
+
+    @override_settings(RATE_LIMITS={"contact": "1/m"}, RATE_LIMIT_NUM_PROXIES=1)
+    def test_contact_throttle_uses_forwarded_address(self):
+        body = {"name": "A", "email": "a@example.com", "message": "hi"}
+        post = lambda forwarded: self.client.post(
+            "/api/contact/", body, format="json", HTTP_X_FORWARDED_FOR=forwarded,
+        )
+        self.assertEqual(post("1.1.1.1, 10.0.0.9").status_code, 201)
+        self.assertEqual(post("2.2.2.2, 10.0.0.9").status_code, 429)
+        self.assertEqual(post("10.0.0.8").status_code, 201)
+
+    def test_decorator(self):
+        @ratelimit.rate_limit("test", "1/m")
+        def view(request):
+            return "ok"
+
+        request = mock.Mock(META={"REMOTE_ADDR": "9.9.9.9"})
+        self.assertEqual(view(request), "ok")
+        response = view(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response["Retry-After"]) >= 1)
+
+    def test_bench_warns_about_a_per_process_cache(self):
+        self.assertFalse(ratelimit.cache_is_shared())
+        err = StringIO()
+        call_command("bench_ratelimit", "--requests", "20", "--clients", "2", stdout=StringIO(), stderr=err)
+        self.assertIn("per process", err.getvalue())
+
+
+@override_settings(
+    PASSWORD_HASHERS=["accounts.hashers.ProfiledPBKDF2PasswordHasher"],
+    AUTH_PASSWORD_ITERATIONS=1000,
+)
+class RegistrationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset()
+        self.client = APIClient()
+        CustomUser.objects.create_user(
+            username="taken@example.com", email="taken@example.com", password="pw", phone="+256700000001",
+        )
+
+    def register(self, **overrides):
+        data = {
+            "email": "new@example.com", "first_name": "New", "last_name": "Guest",
+            "phone": "+256700000002", "password": "pw-123456",
+        }
+        data.update(overrides)
+        return self.client.post(reverse("register-guest"), data, format="json")
+
+    def test_registers_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.register()
+        self.assertEqual(response.status_code, 201, response.content)
+        statements = [q["sql"].split()[0].upper() for q in queries.captured_queries]
+        self.assertEqual(statements.count("INSERT"), 1)
+        self.assertNotIn("SELECT", statements)
+        self.assertNotIn("UPDATE", statements)
+
+        user = CustomUser.objects.get(email="new@example.com")
+        self.assertEqual((user.user_type, user.phone, user.first_name), ("guest", "+256700000002", "New"))
+        self.assertTrue(user.check_password("pw-123456"))
+
+    def test_duplicate_email_and_phone_are_409(self):
+        response = self.register(email="taken@example.com")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["error"], "Email already used")
+
+        response = self.register(phone="+256700000001")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["error"], "Phone number already used")
+        self.assertEqual(CustomUser.objects.count(), 1)
+
+    def test_duplicate_field_reads_the_column_the_error_names(self):
+        user = UserService.build_user({"email": "taken@example.com", "phone": "+256700000001"}, "guest", "!")
+
+        def error(message, constraint=None):
+            e = IntegrityError(message)
+            if constraint:
+                # psycopg's UniqueViolation carries the constraint in .diag
+                e.__cause__ = Exception(message)
+                e.__cause__.diag = mock.Mock(constraint_name=constraint)
+            return e
+
+        # Both values clash, so only the message can tell which one it was
+        with self.assertNumQueries(0):
+            self.assertEqual(UserService.duplicate_field(error("UNIQUE constraint failed: accounts_customuser.phone"), user), "phone")
+            self.assertEqual(UserService.duplicate_field(error("UNIQUE constraint failed: accounts_customuser.username"), user), "username")
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, CustomUser._meta.db_table)
+        phone_constraint = next(name for name, c in constraints.items() if c["unique"] and c["columns"] == ["phone"])
+        self.assertEqual(UserService.duplicate_field(error("duplicate key value", phone_constraint), user), "phone")
+
+        # Another table's column that merely contains "phone": ask the database
+        with self.assertNumQueries(1):
+            field = UserService.duplicate_field(error("UNIQUE constraint failed: accounts_phone_otp.phone"), user)
+        self.assertEqual(field, "email")
+
+    def test_staff_registration(self):
+        response = self.client.post(reverse("register-staff"), {
+            "email": "staff@example.com", "first_name": "S", "last_name": "T",
+            "phone": "+256700000003", "password": "pw-123456",
+        }, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CustomUser.objects.get(email="staff@example.com").user_type, "staff")
+
+    def test_import_users(self):
+        existing_hash = hashers.make_password("kept-pw")
+        rows = [
+            "email,first_name,last_name,phone,password,password_hash",
+            "a@example.com,A,One,+256711000001,pw-a,",
+            f"b@example.com,B,Two,,,{existing_hash}",
+            "c@example.com,C,Three,,,",
+            "a@example.com,A,Again,,pw,",           # repeated in the file
+            "taken@example.com,T,Taken,,pw,",       # already registered
+            "d@example.com,D,Four,+256700000001,pw,",  # phone taken
+            "not-an-email,X,Bad,,pw,",
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("\n".join(rows))
+        self.addCleanup(os.unlink, f.name)
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command("import_users", f.name, "--user-type", "staff", stdout=out, stderr=StringIO())
+        self.assertIn("Imported 3 staff user(s); skipped 3 duplicate(s) and 1 invalid row(s)", out.getvalue())
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertTrue(CustomUser.objects.get(email="a@example.com").check_password("pw-a"))
+        self.assertEqual(CustomUser.objects.get(email="b@example.com").password, existing_hash)
+        self.assertFalse(CustomUser.objects.get(email="c@example.com").has_usable_password())
+        self.assertEqual(CustomUser.objects.filter(user_type="staff").count(), 3)
+
+    def test_import_dry_run_writes_nothing(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("email,first_name,last_name,phone,password\nz@example.com,Z,Z,,pw\n")
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        call_command("import_users", f.name, "--dry-run", stdout=out)
+        self.assertIn("Would import 1 guest user(s)", out.getvalue())
+        self.assertFalse(CustomUser.objects.filter(email="z@example.com").exists())
@@ -3,12 +3,13 @@
 from django.urls import path
 from . import views
 from rest_framework_simplejwt.views import TokenRefreshView
+from .authentication import UserTokenRefreshSerializer
 
 urlpatterns = [
     path("register/guest/", views.RegisterStaffView.as_view(), name='register-staff'),
     path("register/staff/", views.RegisterGuestView.as_view(), name='register-guest'),
     path('login/', views.LoginView.as_view(), name='account-login'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', TokenRefreshView.as_view(serializer_class=UserTokenRefreshSerializer), name='token_refresh'),
     path("auth/signup/", views.SignupView.as_view(), name="signup"),
     path("auth/login/", views.LoginView.as_view(), name="login"),
     path("auth/google-login/", views.GoogleLoginView.as_view(), name="google_login"),
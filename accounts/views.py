@@ -5,7 +5,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from .services import UserService
+from .services import DuplicateUser, UserService
 from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate
 from django.core.validators import validate_email
@@ -15,9 +15,9 @@ from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
 import requests
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
+from . import hashing
+from .ratelimit import ContactThrottle, LoginThrottle, SignupThrottle
+from .authentication import ClaimsJWTAuthentication, UserRefreshToken, refreshed_access_token
 from django.conf import settings
 
 User = get_user_model()
@@ -27,6 +27,7 @@ class RegisterStaffView(APIView):
     # Public endpoint for registration
     authentication_classes = []
     permission_classes = []
+    throttle_classes = [SignupThrottle]
 
     def validate_input(self, data):
         required_fields = ['email', 'first_name', 'last_name', 'phone', 'password']
@@ -43,19 +44,12 @@ class RegisterStaffView(APIView):
         if error:
             return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if email or phone already exists
-        if User.objects.filter(email=data["email"]).exists():
-            return Response({"error": "Email already used"}, status=status.HTTP_409_CONFLICT)
-
-        if UserService.user_phone_exists(data["phone"]):
-            return Response({"error": "Phone number already used"}, status=status.HTTP_409_CONFLICT)
-
         try:
-            # Create staff user
+            # Create staff user; email/phone clashes surface as DuplicateUser
             user = UserService.create_staff_user(data)
 
             # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = UserRefreshToken.for_user(user)
             tokens = {
                 "refresh": str(refresh),
                 "access": str(refresh.access_token)
@@ -73,6 +67,10 @@ class RegisterStaffView(APIView):
                 "tokens": tokens
             }, status=status.HTTP_201_CREATED)
 
+        except DuplicateUser as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except hashing.HashingBusy as e:
+            return busy_response(e)
         except Exception as e:
             # Optional: log exception for debugging
             print(f"Error creating staff user: {e}")
@@ -82,6 +80,7 @@ class RegisterStaffView(APIView):
 class RegisterGuestView(APIView):
     authentication_classes = []
     permission_classes = []
+    throttle_classes = [SignupThrottle]
 
     def validate_input(self, data):
         required_fields = ['email', 'first_name', 'last_name', 'phone', 'password']
@@ -98,19 +97,12 @@ class RegisterGuestView(APIView):
         if error:
             return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if email or phone already exists
-        if User.objects.filter(email=data["email"]).exists():
-            return Response({"error": "Email already used"}, status=status.HTTP_409_CONFLICT)
-
-        if UserService.user_phone_exists(data["phone"]):
-            return Response({"error": "Phone number already used"}, status=status.HTTP_409_CONFLICT)
-
         try:
-            # Create guest user
+            # Create guest user; email/phone clashes surface as DuplicateUser
             user = UserService.create_guest_user(data)
 
             # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = UserRefreshToken.for_user(user)
             tokens = {
                 "refresh": str(refresh),
                 "access": str(refresh.access_token)
@@ -128,6 +120,10 @@ class RegisterGuestView(APIView):
                 "tokens": tokens
             }, status=status.HTTP_201_CREATED)
 
+        except DuplicateUser as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except hashing.HashingBusy as e:
+            return busy_response(e)
         except Exception as e:
             print(f"Error creating guest user: {e}")
             return Response({"error": "Server error creating user"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -142,7 +138,7 @@ class LoginView(APIView):
         if user is None:
             return Response({"error": "Invalid credentials"}, status=401)
 
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         
         access = refresh.access_token
         res = Response({
@@ -174,6 +170,7 @@ class LoginView(APIView):
     
 
 class ContactMessageView(APIView):
+    throttle_classes = [ContactThrottle]
 
     def post(self, request):
         data = request.data
@@ -232,8 +229,15 @@ def set_jwt_cookies(resp, refresh_token, access_token, access_max_age=60*30, ref
     )
     return resp
 
+def busy_response(error):
+    resp = Response({"error": "Too many logins right now, please retry"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    resp["Retry-After"] = str(error.retry_after)
+    return resp
+
+
 class SignupView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [SignupThrottle]
     def post(self, request):
         data = request.data
         name = data.get("name")
@@ -244,9 +248,15 @@ class SignupView(APIView):
             return Response({"error": "name, email and password required"}, status=status.HTTP_400_BAD_REQUEST)
         if User.objects.filter(email=email).exists():
             return Response({"error": "Email already registered"}, status=status.HTTP_400_BAD_REQUEST)
-        user = User.objects.create_user(username=email.split("@")[0], email=email, password=password)
+        try:
+            encoded = hashing.make_password(password)
+        except hashing.HashingBusy as e:
+            return busy_response(e)
+        user = User.objects.create(
+            username=email.split("@")[0], email=User.objects.normalize_email(email), password=encoded,
+        )
         # optional: store phone if your user model has it
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         access = refresh.access_token
         resp = Response({"message": "Signup successful"}, status=status.HTTP_201_CREATED)
         set_jwt_cookies(resp, refresh, access)
@@ -255,15 +265,19 @@ class SignupView(APIView):
 
 class LoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [LoginThrottle]
     def post(self, request):
         email = request.data.get("email")
         password = request.data.get("password")
         if not email or not password:
             return Response({"error": "email and password required"}, status=status.HTTP_400_BAD_REQUEST)
-        user = authenticate(request, username=email, password=password)
+        try:
+            user = hashing.authenticate(email, password)
+        except hashing.HashingBusy as e:
+            return busy_response(e)
         if user is None:
             return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         access = refresh.access_token
         resp = Response({"message": "Login successful"}, status=status.HTTP_200_OK)
         set_jwt_cookies(resp, refresh, access)
@@ -276,8 +290,7 @@ from rest_framework.permissions import AllowAny
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from google.oauth2 import id_token
-from google.auth.transport import requests as grequests
+from . import google
 
 User = get_user_model()
 
@@ -310,9 +323,11 @@ class GoogleLoginView(APIView):
         if not token:
             return Response({"error": "id_token required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # ✅ Correct Google verification (local, no HTTP call)
+        # Local signature check against Google's cached signing keys
         try:
-            gdata = id_token.verify_oauth2_token(token, grequests.Request())
+            gdata = google.verify(token)
+        except google.GoogleCertsUnavailable:
+            return Response({"error": "Google sign-in is unavailable, try again shortly"}, status=503)
         except Exception as e:
             return Response({"error": "Invalid Google token", "details": str(e)}, status=401)
 
@@ -330,7 +345,7 @@ class GoogleLoginView(APIView):
             user.set_unusable_password()
             user.save()
 
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         access = refresh.access_token
 
         resp = Response({
@@ -349,7 +364,7 @@ class RefreshTokenView(APIView):
             return Response({"error": "No refresh token"}, status=status.HTTP_400_BAD_REQUEST)
         try:
             refresh = RefreshToken(refresh_token)
-            access = refresh.access_token
+            access = refreshed_access_token(refresh)
             resp = Response({"message": "Refreshed"}, status=status.HTTP_200_OK)
             resp.set_cookie("access_token", str(access), httponly=True, secure=False, samesite="Lax", max_age=60*30, path="/")
             return resp
@@ -357,7 +372,7 @@ class RefreshTokenView(APIView):
             return Response({"error": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
 
 class WhoAmIView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
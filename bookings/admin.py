@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from bookings.models import Booking, GalleryCategory, GalleryImage, Room, RoomImage, RoomReview, RoomService, RoomType, Subscription
+from bookings.models import Booking, BookingGroup, GalleryCategory, GalleryImage, NightlyRate, RateRule, Room, RoomImage, RoomReview, RoomService, RoomType, Subscription
 from django import forms
 
 # Optional: show checkboxes in RoomType
@@ -35,6 +35,20 @@ class RoomImageAdmin(admin.ModelAdmin):
 class BookingAdmin(admin.ModelAdmin):
     list_display = ('user', 'room', 'check_in', 'check_out', 'status', 'total_price')
 
+@admin.register(BookingGroup)
+class BookingGroupAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'total_price', 'created')
+
+@admin.register(RateRule)
+class RateRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'room_type', 'start_date', 'end_date', 'weekdays', 'min_occupancy', 'multiplier', 'active')
+    list_filter = ('active', 'room_type')
+
+@admin.register(NightlyRate)
+class NightlyRateAdmin(admin.ModelAdmin):
+    list_display = ('room_type', 'date', 'price')
+    list_filter = ('room_type',)
+
 @admin.register(RoomReview)
 class RoomReviewAdmin(admin.ModelAdmin):
     list_display = ('user', 'room', 'stars', 'created')
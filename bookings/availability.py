@@ -0,0 +1,285 @@
+# bookings/availability.py
+
+"""
+Availability engine.
+
+Occupancy is kept per calendar month as one integer bitmask per room:
+bit n set means the night starting on day n + 1 of that month is taken.
+A stay [check_in, check_out) is free when its own mask does not intersect
+the room's mask, so answering "which rooms are free" is a single pass over
+the masks of the months the stay touches.
+
+Month masks are built with one query over blocking bookings and cached
+under a per-month version. Booking saves and deletes bump the versions of
+the months they touch once they commit (see bookings/signals.py), which
+makes every cached mask and calendar for those months unreachable. A
+reader that built its masks before the commit stores them under the
+version it read beforehand, so they are never served. Code that changes
+bookings with QuerySet.update() or bulk_create() must call
+AvailabilityEngine.invalidate() itself.
+
+Bookings change in every gunicorn worker, in the IPN worker and in
+reconcile_payments, so the versions only work in a cache all of them share
+(Redis / Memcached). With the default per-process local-memory backend
+nothing is cached and every read builds its masks from the database; set
+AVAILABILITY_CACHE to override that choice.
+"""
+
+import time
+from calendar import monthrange
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import cache as catalog_cache
+from .models import Booking, Room
+
+# Bookings in these states hold their room; cancelled and checked-out ones do not.
+BLOCKING_STATUSES = ("pending", "confirmed", "checked_in")
+
+
+def as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return month + timedelta(days=monthrange(month.year, month.month)[1])
+
+
+def months_between(start, end):
+    """
+    First days of every month holding at least one night of [start, end).
+    """
+    month = month_start(start)
+    while month < end:
+        yield month
+        month = next_month(month)
+
+
+def stay_mask(month, check_in, check_out):
+    """
+    Bitmask of the nights of [check_in, check_out) that fall in `month`.
+    """
+    lo = max(check_in, month)
+    hi = min(check_out, next_month(month))
+    if lo >= hi:
+        return 0
+    return ((1 << (hi - lo).days) - 1) << (lo - month).days
+
+
+def _version_key(month):
+    return f"availability:version:{month:%Y-%m}"
+
+
+def _month_key(month, version):
+    return f"availability:v{version}:{month:%Y-%m}"
+
+
+def _calendar_key(room_type_id, month, version, catalog_version):
+    # The catalog version covers rooms being added, retyped or taken offline.
+    return f"availability:calendar:v{version}:c{catalog_version}:{room_type_id}:{month:%Y-%m}"
+
+
+def month_versions(months):
+    """
+    {month: current cache version} in one round trip (two for months
+    never seen before).
+    """
+    keys = {_version_key(month): month for month in months}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    missing = [key for key, month in keys.items() if month not in versions]
+    if missing:
+        # Seed from the clock so an evicted version never comes back as a
+        # value older payloads used
+        seed = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, seed, timeout=None)
+        versions.update({keys[key]: version for key, version in cache.get_many(missing).items()})
+    return versions
+
+
+def caching_enabled():
+    enabled = getattr(settings, "AVAILABILITY_CACHE", None)
+    if enabled is None:
+        # Only a cache shared by every process sees all the version bumps
+        return not isinstance(caches["default"], (LocMemCache, DummyCache))
+    return enabled
+
+
+def _timeout():
+    return getattr(settings, "AVAILABILITY_CACHE_TIMEOUT", 60 * 60)
+
+
+def free_counts(month, masks, room_ids):
+    """
+    Free rooms per night of `month` among `room_ids`. Only set bits are
+    visited, so a mostly empty month costs next to nothing.
+    """
+    taken = [0] * monthrange(month.year, month.month)[1]
+    for room_id in room_ids:
+        mask = masks.get(room_id, 0)
+        while mask:
+            low = mask & -mask
+            taken[low.bit_length() - 1] += 1
+            mask ^= low
+    return [len(room_ids) - count for count in taken]
+
+
+class AvailabilityEngine:
+
+    @staticmethod
+    def build_months(months, room_ids=None):
+        """
+        Build {month: {room_id: mask}} for `months` from one query.
+        """
+        months = sorted(months)
+        grid = {month: {} for month in months}
+        if not months:
+            return grid
+
+        bookings = Booking.objects.filter(
+            status__in=BLOCKING_STATUSES,
+            check_in__lt=next_month(months[-1]),
+            check_out__gt=months[0],
+        )
+        if room_ids is not None:
+            bookings = bookings.filter(room_id__in=room_ids)
+
+        for room_id, check_in, check_out in bookings.values_list("room_id", "check_in", "check_out"):
+            for month in months:
+                mask = stay_mask(month, check_in, check_out)
+                if mask:
+                    grid[month][room_id] = grid[month].get(room_id, 0) | mask
+        return grid
+
+    @staticmethod
+    def occupancy_for_months(months, versions=None):
+        """
+        Cached {month: {room_id: mask}} for `months`. Months missing from
+        the cache are rebuilt together in one query.
+        """
+        months = list(months)
+        if not caching_enabled():
+            return AvailabilityEngine.build_months(months)
+        if versions is None:
+            versions = month_versions(months)
+        keys = {_month_key(month, versions[month]): month for month in months}
+        grid = {keys[key]: masks for key, masks in cache.get_many(list(keys)).items()}
+
+        missing = [month for month in months if month not in grid]
+        if missing:
+            # Versions were read before the query: if a booking commits
+            # meanwhile, these masks land under a version already retired
+            built = AvailabilityEngine.build_months(missing)
+            cache.set_many(
+                {_month_key(month, versions[month]): masks for month, masks in built.items()},
+                timeout=_timeout(),
+            )
+            grid.update(built)
+        return grid
+
+    @staticmethod
+    def occupancy(start, end):
+        """
+        Cached occupancy for every month touching [start, end).
+        """
+        return AvailabilityEngine.occupancy_for_months(months_between(start, end))
+
+    @staticmethod
+    def occupied_room_ids(check_in, check_out, grid=None):
+        if grid is None:
+            grid = AvailabilityEngine.occupancy(check_in, check_out)
+        taken = set()
+        for month, masks in grid.items():
+            window = stay_mask(month, check_in, check_out)
+            if not window:
+                continue
+            for room_id, mask in masks.items():
+                if mask & window:
+                    taken.add(room_id)
+        return taken
+
+    @staticmethod
+    def free_rooms(check_in, check_out, guests=1):
+        """
+        Bookable rooms for [check_in, check_out) that fit `guests`, with
+        room_type already joined.
+        """
+        taken = AvailabilityEngine.occupied_room_ids(check_in, check_out)
+        rooms = Room.objects.select_related("room_type").filter(
+            room_type__max_guests__gte=guests,
+            status="available",
+        ).order_by("id")
+        return [room for room in rooms if room.id not in taken]
+
+    @staticmethod
+    def room_is_available(room_id, check_in, check_out):
+        """
+        Authoritative check for a single room. Reads the database rather
+        than the cache so it is safe to use right before writing a booking.
+        """
+        room_id = int(room_id)
+        check_in, check_out = as_date(check_in), as_date(check_out)
+        grid = AvailabilityEngine.build_months(months_between(check_in, check_out), room_ids=[room_id])
+        return room_id not in AvailabilityEngine.occupied_room_ids(check_in, check_out, grid)
+
+    @staticmethod
+    def calendar(room_type_id, months):
+        """
+        {month: [free rooms per night]} for one room type, cached per
+        (room_type, month).
+        """
+        months = list(months)
+        if not caching_enabled():
+            room_ids = list(
+                Room.objects.filter(room_type_id=room_type_id, status="available").values_list("id", flat=True)
+            )
+            grid = AvailabilityEngine.build_months(months)
+            return {month: free_counts(month, grid[month], room_ids) for month in months}
+
+        catalog_version = catalog_cache.get_version()
+        versions = month_versions(months)
+
+        def key(month):
+            return _calendar_key(room_type_id, month, versions[month], catalog_version)
+
+        keys = {key(month): month for month in months}
+        result = {keys[k]: counts for k, counts in cache.get_many(list(keys)).items()}
+
+        missing = [month for month in months if month not in result]
+        if missing:
+            room_ids = list(
+                Room.objects.filter(room_type_id=room_type_id, status="available").values_list("id", flat=True)
+            )
+            grid = AvailabilityEngine.occupancy_for_months(missing, versions)
+            built = {month: free_counts(month, grid[month], room_ids) for month in missing}
+            cache.set_many({key(month): counts for month, counts in built.items()}, timeout=_timeout())
+            result.update(built)
+        return result
+
+    @staticmethod
+    def invalidate(check_in, check_out):
+        """
+        Retire the cached masks and calendars of every month touching
+        [check_in, check_out). Call after the change has committed.
+        """
+        if not check_in or not check_out or not caching_enabled():
+            return
+        check_in, check_out = as_date(check_in), as_date(check_out)
+        for month in months_between(check_in, check_out):
+            key = _version_key(month)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Never seen (or evicted): any fresh seed retires old payloads
+                cache.add(key, int(time.time() * 1000), timeout=None)
+                cache.incr(key)
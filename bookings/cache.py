@@ -0,0 +1,148 @@
+# bookings/cache.py
+
+"""
+Versioned cache for the public room catalog.
+
+Every cached payload is stored under the current catalog version. Writes to
+any catalog model bump the version (see bookings/signals.py), which makes
+all previously cached payloads unreachable at once, so nothing has to be
+deleted key by key. Works with the local-memory backend as well as a shared
+one (Redis / Memcached), in which case every worker sees the same version.
+
+The version also drives strong ETags, so catalog endpoints can answer
+conditional GETs with 304 without touching the payload.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+VERSION_KEY = "catalog:version"
+MODIFIED_KEY = "catalog:modified"
+
+_stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    """
+    Hit / miss / invalidation counters for this worker process.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock rather than 1 so a version key that was
+        # evicted can never come back as a value older payloads used.
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        # Key missing (first write, eviction or cache restart)
+        get_version()
+        version = cache.incr(VERSION_KEY)
+    cache.set(MODIFIED_KEY, int(time.time()), timeout=None)
+    _count("invalidations")
+    return version
+
+
+def get_state():
+    """
+    Return (version, last_modified) in a single cache round trip.
+    """
+    values = cache.get_many([VERSION_KEY, MODIFIED_KEY])
+    version = values.get(VERSION_KEY)
+    if version is None:
+        version = get_version()
+    modified = values.get(MODIFIED_KEY)
+    if modified is None:
+        modified = int(time.time())
+        cache.add(MODIFIED_KEY, modified, timeout=None)
+    return version, modified
+
+
+def catalog_key(name, version=None):
+    if version is None:
+        version = get_version()
+    return f"catalog:v{version}:{name}"
+
+
+def etag_for(name, version):
+    return quote_etag(f"{version}-{name}")
+
+
+def get_payload(name, build, version=None):
+    """
+    Return the serialized JSON bytes for `name`, building and caching them
+    with `build()` on a miss. Returns (body, hit); body is None when
+    `build()` returns None, which is never cached.
+    """
+    key = catalog_key(name, version)
+    body = cache.get(key)
+    if body is not None:
+        _count("hits")
+        return body, True
+
+    _count("misses")
+    data = build()
+    if data is None:
+        return None, False
+
+    body = JSONRenderer().render(data)
+    cache.set(key, body, timeout=getattr(settings, "CATALOG_CACHE_TIMEOUT", 60 * 60))
+    return body, False
+
+
+def json_response(body, hit=False, status=200):
+    response = HttpResponse(body, status=status, content_type="application/json")
+    response["X-Cache"] = "HIT" if hit else "MISS"
+    return response
+
+
+def catalog_response(request, name, build):
+    """
+    Conditional GET for a catalog payload. Clients presenting the current
+    ETag (or a fresh If-Modified-Since) get a 304 without the payload being
+    read or serialized, as long as it is cached, which proves it exists.
+    Otherwise it is built first, so a missing item is still a 404. Returns
+    None when `build()` finds nothing.
+    """
+    version, modified = get_state()
+    etag = etag_for(name, version)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+    if not_modified is not None and cache.has_key(catalog_key(name, version)):
+        _count("not_modified")
+        return not_modified
+
+    body, hit = get_payload(name, build, version)
+    if body is None:
+        return None
+    if not_modified is not None:
+        _count("not_modified")
+        return not_modified
+
+    response = json_response(body, hit)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(modified)
+    response["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,108 @@
+# bookings/management/commands/explain_booking_queries.py
+
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from accounts.models import CustomUser
+from bookings.availability import BLOCKING_STATUSES
+from bookings.models import Booking, Room, RoomType
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the hot Booking queries against a seeded dataset and "
+        "report which index each one uses. Seed rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bookings", type=int, default=20000, help="Bookings to seed (0 to use existing data)")
+        parser.add_argument("--rooms", type=int, default=200)
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--strict", action="store_true", help="Fail if a query does not use its expected index")
+
+    def handle(self, *args, **options):
+        self.missing = []
+        self.verbosity = options["verbosity"]
+        try:
+            with transaction.atomic():
+                if options["bookings"]:
+                    self.seed(options["bookings"], options["rooms"], options["users"])
+                self.explain_all()
+                raise Rollback
+        except Rollback:
+            pass
+
+        if self.missing and options["strict"]:
+            raise CommandError(f"Expected index not used by: {', '.join(self.missing)}")
+
+    def seed(self, bookings, rooms, users):
+        rng = random.Random(7)
+        room_type = RoomType.objects.create(name="explain-seed", base_price=100, max_guests=2)
+        seeded_rooms = Room.objects.bulk_create(
+            Room(room_number=f"explain-{n}", room_type=room_type) for n in range(rooms)
+        )
+        seeded_users = CustomUser.objects.bulk_create(
+            CustomUser(username=f"explain-{n}", email=f"explain-{n}@example.invalid", password="!")
+            for n in range(users)
+        )
+        statuses = [status for status, _ in Booking._meta.get_field("status").choices]
+        start = date.today() - timedelta(days=365)
+
+        def booking():
+            check_in = start + timedelta(days=rng.randrange(730))
+            return Booking(
+                user=rng.choice(seeded_users),
+                room=rng.choice(seeded_rooms),
+                check_in=check_in,
+                check_out=check_in + timedelta(days=rng.randint(1, 7)),
+                status=rng.choice(statuses),
+            )
+
+        Booking.objects.bulk_create((booking() for _ in range(bookings)), batch_size=2000)
+
+        if connection.vendor in ("postgresql", "sqlite"):
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Booking._meta.db_table}")
+        self.stdout.write(f"Seeded {bookings} bookings over {rooms} rooms and {users} users")
+
+    def queries(self):
+        room = Room.objects.order_by("id").first()
+        user = CustomUser.objects.order_by("id").first()
+        check_in = date.today() + timedelta(days=30)
+        check_out = check_in + timedelta(days=3)
+
+        yield "room overlap", "booking_room_overlap_idx", Booking.objects.filter(
+            room_id=room.id if room else 0,
+            status__in=BLOCKING_STATUSES,
+            check_in__lt=check_out,
+            check_out__gt=check_in,
+        )
+        yield "user history", "booking_user_created_idx", Booking.objects.filter(
+            user_id=user.id if user else 0,
+        ).order_by("-created", "-id")
+        yield "availability window", "booking_window_idx", Booking.objects.filter(
+            status__in=BLOCKING_STATUSES,
+            check_in__lt=check_out,
+            check_out__gt=check_in,
+        )
+
+    def explain_all(self):
+        index_names = [index.name for index in Booking._meta.indexes]
+        for label, expected, queryset in self.queries():
+            plan = queryset.explain()
+            used = [name for name in index_names if name in plan]
+            if expected in used:
+                verdict = self.style.SUCCESS(f"uses {expected}")
+            else:
+                self.missing.append(label)
+                verdict = self.style.WARNING(f"does not use {expected} (indexes seen: {', '.join(used) or 'none'})")
+            self.stdout.write(f"{label}: {verdict}")
+            if self.verbosity > 1:
+                self.stdout.write(plan)
@@ -0,0 +1,20 @@
+# bookings/management/commands/rebuild_rates.py
+
+from django.core.management.base import BaseCommand
+
+from bookings.pricing import RateEngine, horizon_days
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the nightly rate table from RateRules. Schedule it (e.g. "
+        "nightly) so occupancy based rules follow new bookings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--room-type", type=int, action="append", dest="room_types", help="Limit to these room type ids")
+        parser.add_argument("--days", type=int, default=None, help=f"Nights to materialize (default {horizon_days()})")
+
+    def handle(self, *args, **options):
+        rows = RateEngine.rebuild(options["room_types"], days=options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} nightly rates"))
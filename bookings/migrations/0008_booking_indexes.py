@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_roomservice_description'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['room', 'status', 'check_in', 'check_out'], name='booking_room_overlap_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'created'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['check_out', 'check_in'], name='booking_window_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_bookinggroup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('weekdays', models.CharField(blank=True, default='', max_length=20)),
+                ('min_occupancy', models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True)),
+                ('multiplier', models.DecimalField(decimal_places=2, default=1, max_digits=5)),
+                ('active', models.BooleanField(default=True)),
+                ('room_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rate_rules', to='bookings.roomtype')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NightlyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('room_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nightly_rates', to='bookings.roomtype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('room_type', 'date'), name='nightly_rate_unique_night')],
+            },
+        ),
+    ]
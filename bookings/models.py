@@ -22,6 +22,49 @@ class RoomType(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # So saving other fields does not rebuild the rate table (bookings/signals.py)
+        instance._loaded_base_price = instance.__dict__.get("base_price")
+        return instance
+
+
+class RateRule(models.Model):
+    """
+    Price adjustment applied when the nightly rate table is rebuilt. A rule
+    matches a night when every condition that is set holds; matching rules
+    multiply the room type's base price.
+    """
+    name = models.CharField(max_length=100)
+    room_type = models.ForeignKey(RoomType, on_delete=models.CASCADE, related_name="rate_rules", blank=True, null=True)  # empty = all types
+    start_date = models.DateField(blank=True, null=True)
+    end_date = models.DateField(blank=True, null=True)  # inclusive
+    weekdays = models.CharField(max_length=20, blank=True, default="")  # e.g. "4,5" = Fri, Sat nights
+    min_occupancy = models.DecimalField(max_digits=3, decimal_places=2, blank=True, null=True)  # 0.80 = 80% booked
+    multiplier = models.DecimalField(max_digits=5, decimal_places=2, default=1)
+    active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.name} (x{self.multiplier})"
+
+
+class NightlyRate(models.Model):
+    """
+    Precomputed price of one night of a room type, see bookings/pricing.py.
+    """
+    room_type = models.ForeignKey(RoomType, on_delete=models.CASCADE, related_name="nightly_rates")
+    date = models.DateField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["room_type", "date"], name="nightly_rate_unique_night"),
+        ]
+
+    def __str__(self):
+        return f"{self.room_type.name} {self.date}: {self.price}"
+
 
 ROOM_STATUS = (
     ('available', 'Available'),
@@ -59,9 +102,24 @@ BOOKING_STATUS = (
     ('cancelled', 'Cancelled'),
 )
 
+class BookingGroup(models.Model):
+    """
+    Several rooms booked together (events, tour groups) and paid for once.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # The whole party; each booking holds its share
+    guests = models.IntegerField(default=1)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Group booking #{self.id} - {self.user.username}"
+
+
 class Booking(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     room = models.ForeignKey(Room, on_delete=models.PROTECT)
+    group = models.ForeignKey(BookingGroup, on_delete=models.CASCADE, related_name="bookings", blank=True, null=True)
     check_in = models.DateField(blank=True, null=True)
     check_out = models.DateField(blank=True, null=True)
 
@@ -75,9 +133,27 @@ class Booking(models.Model):
     status = models.CharField(max_length=20, choices=BOOKING_STATUS, default='pending')
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # overlap checks for one room (BookingService.room_is_available)
+            models.Index(fields=["room", "status", "check_in", "check_out"], name="booking_room_overlap_idx"),
+            # a user's booking history, newest first
+            models.Index(fields=["user", "created"], name="booking_user_created_idx"),
+            # all bookings touching a date window (availability month grid)
+            models.Index(fields=["check_out", "check_in"], name="booking_window_idx"),
+        ]
+
     def __str__(self):
         return f"Booking #{self.id} - {self.user.username} - Room {self.room.room_number}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stay as loaded, so moving the dates also frees the old nights
+        # in the availability cache (bookings/signals.py)
+        instance._loaded_stay = (instance.__dict__.get("check_in"), instance.__dict__.get("check_out"))
+        return instance
+
     @property
     def nights(self):
         return (self.check_out - self.check_in).days
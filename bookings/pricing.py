@@ -0,0 +1,119 @@
+# bookings/pricing.py
+
+"""
+Rate engine: the single place stays are priced.
+
+Nightly prices are materialized per (room_type, date) in NightlyRate by
+RateEngine.rebuild(), applying the active RateRules (weekend, seasonal and
+occupancy based) to the room type's base price. Quoting a stay is then one
+range query and a sum. Quotes are deliberately not memoized: a memo per
+worker would keep serving old prices after another worker rebuilds, and
+the query is a short range scan on the (room_type, date) unique index.
+Nights beyond the materialized horizon fall back to the base price.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .availability import AvailabilityEngine, months_between
+from .models import NightlyRate, RateRule, Room, RoomType
+
+CENTS = Decimal("0.01")
+
+
+def horizon_days():
+    return getattr(settings, "RATE_HORIZON_DAYS", 365)
+
+
+def rule_matches(rule, night, occupancy):
+    if rule.start_date and night < rule.start_date:
+        return False
+    if rule.end_date and night > rule.end_date:
+        return False
+    if rule.weekdays and str(night.weekday()) not in rule.weekdays.split(","):
+        return False
+    if rule.min_occupancy is not None and occupancy < rule.min_occupancy:
+        return False
+    return True
+
+
+def nightly_price(base_price, rules, night, occupancy=Decimal(0)):
+    price = Decimal(base_price)
+    for rule in rules:
+        if rule_matches(rule, night, occupancy):
+            price *= rule.multiplier
+    return price.quantize(CENTS)
+
+
+class RateEngine:
+
+    @staticmethod
+    def quote(room_type_id, check_in, check_out):
+        """
+        Total price of [check_in, check_out) for a room type.
+        """
+        nights = (check_out - check_in).days
+        rates = NightlyRate.objects.filter(
+            room_type_id=room_type_id, date__gte=check_in, date__lt=check_out,
+        ).aggregate(total=Sum("price"), nights=Count("id"))
+
+        total = rates["total"] or Decimal(0)
+        missing = nights - rates["nights"]
+        if missing:
+            base_price = RoomType.objects.values_list("base_price", flat=True).get(id=room_type_id)
+            total += base_price * missing
+        return total
+
+    @staticmethod
+    def occupancy(room_type_id, start, end):
+        """
+        {night: booked fraction} for a room type, from the availability calendar.
+        """
+        total = Room.objects.filter(room_type_id=room_type_id, status="available").count()
+        if not total:
+            return {}
+        calendar = AvailabilityEngine.calendar(room_type_id, list(months_between(start, end)))
+        result = {}
+        for month, free in calendar.items():
+            for offset, count in enumerate(free):
+                result[month + timedelta(days=offset)] = Decimal(total - count) / total
+        return result
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(room_type_ids=None, start=None, days=None):
+        """
+        Recompute NightlyRate rows for the next `days` nights. Run it when
+        rules or base prices change (signals do) and periodically so that
+        occupancy based rules follow bookings (manage.py rebuild_rates).
+        """
+        start = start or date.today()
+        end = start + timedelta(days=days or horizon_days())
+
+        room_types = RoomType.objects.all()
+        if room_type_ids is not None:
+            room_types = room_types.filter(id__in=room_type_ids)
+        rules = list(RateRule.objects.filter(active=True))
+
+        rows = []
+        for room_type in room_types:
+            type_rules = [rule for rule in rules if rule.room_type_id in (None, room_type.id)]
+            occupancy = RateEngine.occupancy(room_type.id, start, end) if any(
+                rule.min_occupancy is not None for rule in type_rules
+            ) else {}
+            night = start
+            while night < end:
+                rows.append(NightlyRate(
+                    room_type=room_type,
+                    date=night,
+                    price=nightly_price(room_type.base_price, type_rules, night, occupancy.get(night, Decimal(0))),
+                ))
+                night += timedelta(days=1)
+
+        NightlyRate.objects.filter(room_type__in=room_types, date__gte=start, date__lt=end).delete()
+        NightlyRate.objects.bulk_create(rows, batch_size=2000)
+        return len(rows)
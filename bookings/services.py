@@ -1,12 +1,18 @@
 # bookings/services.py
 
 
-from django.db import transaction
+import base64
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from django.db import connection, transaction
 from .models import Booking, Room
 from django.core.exceptions import ValidationError
+from django.db.models import Q
 from datetime import date
-from .models import RoomType, Room, RoomService, RoomImage
-from django.db import transaction
+from .models import BookingGroup, RoomType, RoomService
+from .availability import AvailabilityEngine, months_between
+from .pricing import RateEngine
 from django.conf import settings
 
 class RoomServices:
@@ -49,23 +55,42 @@ class RoomServices:
             room_type_id=data["room_type"]
         )
 
+    @staticmethod
+    def catalog_queryset():
+        """
+        Rooms with their room type joined in, and services and images
+        prefetched, so serializing any number of rooms costs a fixed
+        number of queries.
+        """
+        return Room.objects.select_related("room_type").prefetch_related(
+            "room_type__room_service",
+            "images",
+        )
+
     @staticmethod
     def get_all_rooms(request=None):
         """
         Return all rooms with room type info, services, and images as dicts,
         only modifying the image field to be a full URL.
         """
-        rooms = Room.objects.all()
+        rooms = RoomServices.catalog_queryset().order_by("id")
         result = []
 
         for room in rooms:
-            services = list(room.room_type.room_service.values("id", "name", "icon", "description"))
-            images_qs = RoomImage.objects.filter(room=room).values("id", "image", "caption")
-            
+            room_type = room.room_type
+            services = [
+                {
+                    "id": svc.id,
+                    "name": svc.name,
+                    "icon": svc.icon.name,
+                    "description": svc.description,
+                }
+                for svc in room_type.room_service.all()
+            ]
 
             # Only update image field to full URL
             images = []
-            for img in RoomImage.objects.filter(room=room):
+            for img in room.images.all():
                 images.append({
                     "id": img.id,
                     "image": f"{settings.BASE_URL}{img.image.url}",  # <-- full URL
@@ -78,11 +103,11 @@ class RoomServices:
                 "floor": room.floor,
                 "status": room.status,
                 "room_type": {
-                    "id": room.room_type.id,
-                    "name": room.room_type.name,
-                    "description": room.room_type.description,
-                    "base_price": float(room.room_type.base_price),
-                    "max_guests": room.room_type.max_guests,
+                    "id": room_type.id,
+                    "name": room_type.name,
+                    "description": room_type.description,
+                    "base_price": float(room_type.base_price),
+                    "max_guests": room_type.max_guests,
                     "services": services,
                 },
                 "images": images,
@@ -97,9 +122,16 @@ class RoomServices:
         Return single room by id, including images and services.
         """
         try:
-            room = Room.objects.get(pk=room_id)
-            services = list(room.room_type.room_service.values("id", "name", "icon"))
-            images = list(RoomImage.objects.filter(room=room).values("id", "image", "caption"))
+            room = RoomServices.catalog_queryset().get(pk=room_id)
+            room_type = room.room_type
+            services = [
+                {"id": svc.id, "name": svc.name, "icon": svc.icon.name}
+                for svc in room_type.room_service.all()
+            ]
+            images = [
+                {"id": img.id, "image": img.image.name, "caption": img.caption}
+                for img in room.images.all()
+            ]
 
             return {
                 "id": room.id,
@@ -107,11 +139,11 @@ class RoomServices:
                 "floor": room.floor,
                 "status": room.status,
                 "room_type": {
-                    "id": room.room_type.id,
-                    "name": room.room_type.name,
-                    "description": room.room_type.description,
-                    "base_price": float(room.room_type.base_price),
-                    "max_guests": room.room_type.max_guests,
+                    "id": room_type.id,
+                    "name": room_type.name,
+                    "description": room_type.description,
+                    "base_price": float(room_type.base_price),
+                    "max_guests": room_type.max_guests,
                     "services": services,
                 },
                 "images": images,
@@ -120,6 +152,40 @@ class RoomServices:
             return {"error": "Room not found"}
 
 
+MAX_GROUP_ROOMS = 50
+
+
+class RoomsUnavailable(ValidationError):
+    """
+    The request was valid but the rooms cannot be had for those dates.
+    """
+
+
+def split_guests(guests, rooms):
+    """
+    `guests` spread over `rooms` as evenly as possible, largest shares first.
+    """
+    share, extra = divmod(guests, rooms)
+    return [share + (1 if n < extra else 0) for n in range(rooms)]
+
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def room_write_lock():
+    """
+    Stand-in for row locks on backends without SELECT ... FOR UPDATE
+    (SQLite). SQLite only allows one writer at a time anyway, so a single
+    process-wide lock is used there. Elsewhere the database lock on the
+    room row does the work and this is a no-op.
+    """
+    if connection.features.has_select_for_update:
+        yield
+        return
+    with _write_lock:
+        yield
+
+
 class BookingService:
 
     @staticmethod
@@ -127,18 +193,16 @@ class BookingService:
         """
         Check if room has ANY overlapping bookings.
         """
-        return not Booking.objects.filter(
-            room_id=room_id,
-            check_in__lt=check_out,
-            check_out__gt=check_in,
-            status__in=["pending", "confirmed", "checked_in"]
-        ).exists()
+        return AvailabilityEngine.room_is_available(room_id, check_in, check_out)
 
     @staticmethod
-    @transaction.atomic
     def create_booking(data, user):
-
-        room_id = data["room_id"]
+        """
+        Check availability and insert while holding a lock on the room row,
+        so concurrent requests for the same room are serialized and only one
+        of them can take a given night. Bookings for other rooms do not wait.
+        """
+        room_id = int(data["room_id"])
         check_in = data["check_in"]
         check_out = data["check_out"]
 
@@ -146,22 +210,154 @@ class BookingService:
         if check_in >= check_out:
             raise ValidationError("Check-out must be after check-in")
 
-        # Check availability
-        if not BookingService.room_is_available(room_id, check_in, check_out):
-            raise ValidationError("Room is not available for these dates")
+        with room_write_lock(), transaction.atomic():
+            # Lock only the room row; joining room_type here would lock it too
+            # and serialize every room of the same type.
+            room = Room.objects.select_for_update().get(id=room_id)
 
-        room = Room.objects.get(id=room_id)
+            # Check availability
+            if not BookingService.room_is_available(room_id, check_in, check_out):
+                raise ValidationError("Room is not available for these dates")
 
-        nights = (check_out - check_in).days
-        total_price = nights * room.room_type.base_price
+            total_price = RateEngine.quote(room.room_type_id, check_in, check_out)
 
-        booking = Booking.objects.create(
-            user=user,
-            room=room,
-            check_in=check_in,
-            check_out=check_out,
-            total_price=total_price,
-            status="pending",
-        )
+            booking = Booking.objects.create(
+                user_id=user.pk,
+                room=room,
+                check_in=check_in,
+                check_out=check_out,
+                guests=data.get("guests", 1),
+                special_requests=data.get("special_requests", ""),
+                total_price=total_price,
+                status="pending",
+            )
 
         return booking
+
+    @staticmethod
+    def create_group_booking(data, user):
+        """
+        Book several rooms for the same stay, all or nothing. Rooms come
+        either from data["room_ids"] or as data["quantity"] free rooms of
+        data["room_type_id"]. The rooms are locked, checked with one
+        occupancy query and inserted with bulk_create in one transaction.
+        data["guests"] is the whole party (default one per room), split
+        across the rooms. Bad input raises ValidationError; rooms that
+        cannot be had raise RoomsUnavailable.
+        """
+        check_in = data["check_in"]
+        check_out = data["check_out"]
+        room_ids = sorted({int(room_id) for room_id in data.get("room_ids") or []})
+        quantity = len(room_ids) or int(data.get("quantity") or 0)
+        guests = int(data.get("guests") or quantity)
+
+        if check_in >= check_out:
+            raise ValidationError("Check-out must be after check-in")
+        if not 1 <= quantity <= MAX_GROUP_ROOMS:
+            raise ValidationError(f"A group booking takes between 1 and {MAX_GROUP_ROOMS} rooms")
+        if guests < quantity:
+            raise ValidationError("A group booking needs at least one guest per room")
+
+        months = list(months_between(check_in, check_out))
+
+        with room_write_lock(), transaction.atomic():
+            # Lock in id order so overlapping groups cannot deadlock each other
+            if room_ids:
+                rooms = list(Room.objects.select_for_update().filter(id__in=room_ids).order_by("id"))
+                if len(rooms) != len(room_ids):
+                    raise ValidationError("One or more rooms do not exist")
+                closed = [room.room_number for room in rooms if room.status != "available"]
+                if closed:
+                    raise RoomsUnavailable(f"Rooms not open for booking: {', '.join(closed)}")
+            else:
+                rooms = list(Room.objects.select_for_update().filter(
+                    room_type_id=data["room_type_id"], status="available",
+                ).order_by("id"))
+
+            grid = AvailabilityEngine.build_months(months, room_ids=[room.id for room in rooms])
+            taken = AvailabilityEngine.occupied_room_ids(check_in, check_out, grid)
+
+            if room_ids:
+                if taken:
+                    numbers = ", ".join(room.room_number for room in rooms if room.id in taken)
+                    raise RoomsUnavailable(f"Rooms not available for these dates: {numbers}")
+            else:
+                rooms = [room for room in rooms if room.id not in taken][:quantity]
+                if len(rooms) < quantity:
+                    raise RoomsUnavailable(f"Only {len(rooms)} rooms of this type are available for these dates")
+
+            room_types = {room.room_type_id for room in rooms}
+            quotes = {room_type_id: RateEngine.quote(room_type_id, check_in, check_out) for room_type_id in room_types}
+            prices = {room.id: quotes[room.room_type_id] for room in rooms}
+
+            group = BookingGroup.objects.create(user_id=user.pk, total_price=sum(prices.values()), guests=guests)
+            bookings = Booking.objects.bulk_create([
+                Booking(
+                    user_id=user.pk,
+                    room=room,
+                    group=group,
+                    check_in=check_in,
+                    check_out=check_out,
+                    guests=share,
+                    special_requests=data.get("special_requests", ""),
+                    total_price=prices[room.id],
+                    status="pending",
+                )
+                for room, share in zip(rooms, split_guests(guests, len(rooms)))
+            ])
+
+            # bulk_create sends no post_save, so retire cached availability here
+            transaction.on_commit(lambda: AvailabilityEngine.invalidate(check_in, check_out))
+
+        return group, bookings
+
+    @staticmethod
+    def encode_cursor(row):
+        raw = f"{row['created'].isoformat()}|{row['id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            created, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(created), int(pk)
+        except Exception:
+            raise ValidationError("Invalid cursor")
+
+    @staticmethod
+    def user_bookings_page(user, cursor=None, limit=20, status=None, date_from=None, date_to=None):
+        """
+        One page of a user's bookings, newest first, using keyset pagination
+        on (created, id) so deep pages cost the same as the first one.
+        Returns (rows, next_cursor).
+        """
+        bookings = Booking.objects.filter(user_id=user.pk)
+        if status:
+            bookings = bookings.filter(status=status)
+        if date_from:
+            bookings = bookings.filter(check_out__gt=date_from)
+        if date_to:
+            bookings = bookings.filter(check_in__lt=date_to)
+        if cursor:
+            created, pk = BookingService.decode_cursor(cursor)
+            bookings = bookings.filter(Q(created__lt=created) | Q(created=created, id__lt=pk))
+
+        rows = list(bookings.order_by("-created", "-id").values(
+            "id",
+            "room__room_number",
+            "room__room_type_id",
+            "room__room_type__name",
+            "check_in",
+            "check_out",
+            "guests",
+            "status",
+            "total_price",
+            "group_id",
+            "created",
+        )[:limit + 1])
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = BookingService.encode_cursor(rows[-1])
+        return rows, next_cursor
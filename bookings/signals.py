@@ -0,0 +1,63 @@
+# bookings/signals.py
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache as catalog_cache
+from .availability import AvailabilityEngine
+from .models import Booking, GalleryCategory, GalleryImage, RateRule, Room, RoomImage, RoomService, RoomType
+from .pricing import RateEngine
+
+CATALOG_MODELS = (Room, RoomType, RoomService, RoomImage, GalleryCategory, GalleryImage)
+
+
+def invalidate_catalog(**kwargs):
+    # Bump after commit so a concurrent reader cannot re-cache the old rows
+    # under the new version.
+    transaction.on_commit(catalog_cache.bump_version)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f"catalog-save-{model.__name__}")
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f"catalog-delete-{model.__name__}")
+
+
+@receiver(m2m_changed, sender=RoomType.room_service.through, dispatch_uid="catalog-room-services")
+def room_services_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_catalog()
+
+
+@receiver(post_save, sender=Booking, dispatch_uid="availability-booking-save")
+@receiver(post_delete, sender=Booking, dispatch_uid="availability-booking-delete")
+def booking_changed(sender, instance, **kwargs):
+    # Creates, cancellations, status and date changes all land here.
+    stays = {(instance.check_in, instance.check_out)}
+    loaded = getattr(instance, "_loaded_stay", None)
+    if loaded:
+        stays.add(loaded)
+    instance._loaded_stay = (instance.check_in, instance.check_out)
+
+    def invalidate():
+        for check_in, check_out in stays:
+            AvailabilityEngine.invalidate(check_in, check_out)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=RateRule, dispatch_uid="rates-rule-save")
+@receiver(post_delete, sender=RateRule, dispatch_uid="rates-rule-delete")
+def rate_rule_changed(sender, instance, **kwargs):
+    room_type_ids = None if instance.room_type_id is None else [instance.room_type_id]
+    transaction.on_commit(lambda: RateEngine.rebuild(room_type_ids))
+
+
+@receiver(post_save, sender=RoomType, dispatch_uid="rates-room-type-save")
+def room_type_saved(sender, instance, created, **kwargs):
+    # base_price feeds every materialized night of this type; renaming or
+    # editing the description leaves the rates as they are
+    loaded = getattr(instance, "_loaded_base_price", None)
+    instance._loaded_base_price = instance.base_price
+    if created or loaded is None or loaded != instance.base_price:
+        transaction.on_commit(lambda: RateEngine.rebuild([instance.id]))
@@ -1,3 +1,563 @@
-from django.test import TestCase
+import random
+from unittest import mock
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import CustomUser
+
+from . import availability
+from .availability import AvailabilityEngine, stay_mask
+from .pricing import RateEngine
+from .models import Booking, BookingGroup, GalleryCategory, NightlyRate, RateRule, GalleryImage, Room, RoomImage, RoomService, RoomType
+from . import cache as catalog_cache
+from .services import BookingService, RoomServices
+
+
+def make_catalog(rooms=5, images_per_room=2):
+    wifi = RoomService.objects.create(name="Wifi", icon="service_icons/wifi.png")
+    spa = RoomService.objects.create(name="Spa")
+    for t in range(2):
+        room_type = RoomType.objects.create(name=f"Type {t}", base_price=Decimal("100.00"), max_guests=2 + t)
+        room_type.room_service.set([wifi, spa])
+        for r in range(rooms):
+            room = Room.objects.create(room_number=f"{t}{r:03d}", room_type=room_type)
+            for i in range(images_per_room):
+                RoomImage.objects.create(room=room, image=f"room_images/{room.room_number}_{i}.jpg")
+
+
+@override_settings(BASE_URL="http://testserver")
+class RoomCatalogQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_get_all_rooms_query_count_is_constant(self):
+        make_catalog(rooms=2)
+        with self.assertNumQueries(3):
+            small = RoomServices.get_all_rooms()
+
+        extra = 40
+        room_type = RoomType.objects.first()
+        for r in range(extra):
+            room = Room.objects.create(room_number=f"x{r}", room_type=room_type)
+            RoomImage.objects.create(room=room, image=f"room_images/x{r}.jpg")
+        with self.assertNumQueries(3):
+            large = RoomServices.get_all_rooms()
+
+        self.assertEqual(len(large), len(small) + extra)
+        self.assertEqual(len(large[0]["room_type"]["services"]), 2)
+        self.assertTrue(large[0]["images"][0]["image"].startswith("http://testserver/"))
+
+    def test_get_room_by_id_query_count(self):
+        make_catalog(rooms=1)
+        room = Room.objects.first()
+        with self.assertNumQueries(3):
+            data = RoomServices.get_room_by_id(room.id)
+        self.assertEqual(data["room_number"], room.room_number)
+        self.assertEqual(len(data["images"]), 2)
+
+    def test_gallery_query_count(self):
+        for c in range(3):
+            category = GalleryCategory.objects.create(name=f"Cat {c}")
+            for i in range(3):
+                GalleryImage.objects.create(category=category, image=f"gallery_images/{c}_{i}.jpg")
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse("gallery-list"))
+        self.assertEqual(len(res.json()), 3)
+
+
+@override_settings(BASE_URL="http://testserver")
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(rooms=3)
+
+    def test_warm_requests_skip_the_database(self):
+        url = reverse("rooms-list")
+        first = self.client.get(url)
+        self.assertEqual(first["X-Cache"], "MISS")
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+
+    def test_catalog_writes_bump_the_version(self):
+        url = reverse("rooms-list")
+        self.client.get(url)
+        version = catalog_cache.get_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Room.objects.create(room_number="new", room_type=RoomType.objects.first())
+
+        self.assertEqual(catalog_cache.get_version(), version + 1)
+        res = self.client.get(url)
+        self.assertEqual(res["X-Cache"], "MISS")
+        self.assertIn("new", [room["room_number"] for room in res.json()])
+
+    def test_room_services_m2m_change_bumps_the_version(self):
+        version = catalog_cache.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            RoomType.objects.first().room_service.clear()
+        self.assertEqual(catalog_cache.get_version(), version + 1)
+
+    def test_missing_room_is_not_cached(self):
+        before = catalog_cache.stats()
+        res = self.client.get(reverse("room-detail", args=[999]))
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(catalog_cache.stats()["misses"], before["misses"] + 1)
+        self.assertIsNone(cache.get(catalog_cache.catalog_key("room:999")))
+
+
+@override_settings(BASE_URL="http://testserver")
+class CatalogConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(rooms=2)
+
+    def test_matching_etag_returns_304_without_payload(self):
+        url = reverse("rooms-list")
+        first = self.client.get(url)
+        etag = first["ETag"]
+        self.assertTrue(first.has_header("Last-Modified"))
+
+        with self.assertNumQueries(0):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b"")
+
+    def test_uncached_payload_is_built_before_answering_304(self):
+        url = reverse("rooms-list")
+        first = self.client.get(url)
+        cache.delete(catalog_cache.catalog_key("rooms"))
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(res.status_code, 304)
+        self.assertIsNotNone(cache.get(catalog_cache.catalog_key("rooms")))
+
+    def test_missing_room_is_404_despite_conditional_headers(self):
+        last_modified = self.client.get(reverse("rooms-list"))["Last-Modified"]
+        res = self.client.get(
+            reverse("room-detail", args=[999999]),
+            HTTP_IF_MODIFIED_SINCE=last_modified,
+        )
+        self.assertEqual(res.status_code, 404)
+
+    def test_if_modified_since_returns_304(self):
+        url = reverse("services-list")
+        RoomService.objects.update(icon="service_icons/x.png")
+        first = self.client.get(url)
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(res.status_code, 304)
+
+    def test_catalog_change_invalidates_etag(self):
+        url = reverse("gallery-list")
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            GalleryCategory.objects.create(name="Pool")
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+
+@override_settings(AVAILABILITY_CACHE=True)
+class AvailabilityEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(rooms=2, images_per_room=0)
+        self.user = CustomUser.objects.create_user(username="guest", email="guest@example.com", password="pw")
+        self.rooms = list(Room.objects.order_by("id"))
+        self.day = date.today() + timedelta(days=30)
+
+    def book(self, room, start, nights, status="confirmed"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                user=self.user, room=room, status=status,
+                check_in=self.day + timedelta(days=start),
+                check_out=self.day + timedelta(days=start + nights),
+            )
+
+    def free_ids(self, start, nights, guests=1):
+        check_in = self.day + timedelta(days=start)
+        rooms = AvailabilityEngine.free_rooms(check_in, check_in + timedelta(days=nights), guests)
+        return {room.id for room in rooms}
+
+    def test_stay_mask_spans_month_boundary(self):
+        self.assertEqual(stay_mask(date(2030, 1, 1), date(2030, 1, 30), date(2030, 2, 2)), 0b11 << 29)
+        self.assertEqual(stay_mask(date(2030, 2, 1), date(2030, 1, 30), date(2030, 2, 2)), 0b1)
+
+    def test_overlaps_block_and_back_to_back_stays_do_not(self):
+        room = self.rooms[0]
+        self.book(room, 5, 3)
+        self.assertNotIn(room.id, self.free_ids(6, 1))
+        self.assertNotIn(room.id, self.free_ids(0, 40))
+        self.assertIn(room.id, self.free_ids(8, 2))
+        self.assertIn(room.id, self.free_ids(3, 2))
+        self.assertFalse(AvailabilityEngine.room_is_available(room.id, self.day + timedelta(days=7), self.day + timedelta(days=9)))
+
+    def test_cancelled_and_checked_out_bookings_do_not_block(self):
+        self.book(self.rooms[0], 0, 2, status="cancelled")
+        self.book(self.rooms[1], 0, 2, status="checked_out")
+        self.assertTrue({self.rooms[0].id, self.rooms[1].id} <= self.free_ids(0, 2))
+
+    def test_status_change_refreshes_cached_months(self):
+        booking = self.book(self.rooms[0], 0, 2)
+        self.assertNotIn(self.rooms[0].id, self.free_ids(0, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = "cancelled"
+            booking.save()
+        self.assertIn(self.rooms[0].id, self.free_ids(0, 2))
+
+    def test_guests_filter_and_warm_query_count(self):
+        self.free_ids(0, 2)
+        with self.assertNumQueries(1):
+            free = self.free_ids(0, 2, guests=3)
+        self.assertEqual(free, {room.id for room in self.rooms if room.room_type.max_guests >= 3})
+
+    @override_settings(AVAILABILITY_CACHE=None)
+    def test_local_memory_cache_is_not_used(self):
+        # Another process (e.g. the IPN worker) could not bump this
+        # process's versions, so nothing may be cached here
+        self.assertFalse(availability.caching_enabled())
+        self.free_ids(0, 2)
+        Booking.objects.bulk_create([Booking(
+            user=self.user, room=self.rooms[0], check_in=self.day, check_out=self.day + timedelta(days=2),
+        )])
+        self.assertNotIn(self.rooms[0].id, self.free_ids(0, 2))
+
+
+@override_settings(AVAILABILITY_CACHE=True)
+class AvailabilityCalendarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(rooms=3, images_per_room=0)
+        self.user = CustomUser.objects.create_user(username="guest", email="guest@example.com", password="pw")
+        self.room_type = RoomType.objects.order_by("id").first()
+        self.room = Room.objects.filter(room_type=self.room_type).first()
+
+    def calendar(self):
+        return self.client.get(reverse("availability-calendar"), {
+            "room_type": self.room_type.id, "start": "2030-01", "months": 2,
+        })
+
+    def test_counts_free_rooms_per_night(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=self.user, room=self.room, check_in=date(2030, 1, 30), check_out=date(2030, 2, 2))
+
+        res = self.calendar()
+        self.assertEqual(res.status_code, 200)
+        january, february = res.json()["months"]
+        self.assertEqual(len(january["available"]), 31)
+        self.assertEqual(january["available"][28:], [3, 2, 2])
+        self.assertEqual(february["available"][:2], [2, 3])
+
+    def test_booking_change_invalidates_cached_months(self):
+        self.calendar()
+        with self.assertNumQueries(0):
+            self.calendar()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=self.user, room=self.room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+        self.assertEqual(self.calendar().json()["months"][0]["available"][0], 2)
+
+    def test_moving_a_booking_frees_the_old_nights(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(user=self.user, room=self.room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+        self.assertEqual(self.calendar().json()["months"][0]["available"][:3], [2, 3, 3])
+
+        booking = Booking.objects.get(pk=booking.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.check_in, booking.check_out = date(2030, 1, 3), date(2030, 1, 4)
+            with self.assertNumQueries(1):  # the UPDATE only; no room lookup
+                booking.save()
+        self.assertEqual(self.calendar().json()["months"][0]["available"][:3], [3, 3, 2])
+
+    def test_masks_built_before_a_commit_are_not_served(self):
+        january = date(2030, 1, 1)
+        versions = availability.month_versions([january])
+        stale = AvailabilityEngine.build_months([january])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=self.user, room=self.room, check_in=january, check_out=date(2030, 1, 2))
+
+        # The slow reader finishes after the invalidation
+        with mock.patch.object(AvailabilityEngine, "build_months", return_value=stale):
+            AvailabilityEngine.occupancy_for_months([january], versions)
+        self.assertEqual(self.calendar().json()["months"][0]["available"][0], 2)
+
+    def test_rejects_bad_params(self):
+        self.assertEqual(self.client.get(reverse("availability-calendar")).status_code, 400)
+        res = self.client.get(reverse("availability-calendar"), {"room_type": 1, "months": 40})
+        self.assertEqual(res.status_code, 400)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """
+    Hammer create_booking from many threads at once; the room lock must let
+    exactly one request win each night.
+    """
+
+    def setUp(self):
+        cache.clear()
+        make_catalog(rooms=2, images_per_room=0)
+        self.user = CustomUser.objects.create_user(username="guest", email="guest@example.com", password="pw")
+        self.rooms = list(Room.objects.order_by("id")[:2])
+        self.day = date.today() + timedelta(days=60)
+
+    def attempt(self, room, start, nights):
+        check_in = self.day + timedelta(days=start)
+        try:
+            BookingService.create_booking({
+                "room_id": room.id,
+                "check_in": check_in,
+                "check_out": check_in + timedelta(days=nights),
+            }, self.user)
+            return True
+        except ValidationError:
+            return False
+        finally:
+            connection.close()
+
+    def run_all(self, jobs):
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            return list(pool.map(lambda job: self.attempt(*job), jobs))
+
+    def test_exactly_one_winner_per_night(self):
+        jobs = [(self.rooms[0], night, 1) for night in range(10) for _ in range(20)]
+        random.shuffle(jobs)
+        results = self.run_all(jobs)
+
+        self.assertEqual(sum(results), 10)
+        nights = sorted(Booking.objects.filter(room=self.rooms[0]).values_list("check_in", flat=True))
+        self.assertEqual(nights, [self.day + timedelta(days=n) for n in range(10)])
+
+    def test_overlapping_stays_never_double_book(self):
+        rng = random.Random(6)
+        jobs = [(rng.choice(self.rooms), rng.randrange(14), rng.randint(1, 4)) for _ in range(200)]
+        self.run_all(jobs)
+
+        for room in self.rooms:
+            taken = set()
+            for check_in, check_out in Booking.objects.filter(room=room).values_list("check_in", "check_out"):
+                nights = {check_in + timedelta(days=n) for n in range((check_out - check_in).days)}
+                self.assertFalse(taken & nights)
+                taken |= nights
+
+
+class ExplainBookingQueriesTests(TestCase):
+    def test_hot_queries_use_their_indexes(self):
+        out = StringIO()
+        call_command("explain_booking_queries", bookings=3000, rooms=50, users=100, strict=True, stdout=out)
+        self.assertIn("uses booking_room_overlap_idx", out.getvalue())
+        self.assertFalse(Booking.objects.exists())
+
+
+class GroupBookingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(rooms=30, images_per_room=0)
+        self.user = CustomUser.objects.create_user(username="tour", email="tour@example.com", password="pw")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        self.room_type = RoomType.objects.order_by("id").first()
+        self.day = date.today() + timedelta(days=10)
+
+    def post(self, **body):
+        body.setdefault("check_in", self.day.isoformat())
+        body.setdefault("check_out", (self.day + timedelta(days=2)).isoformat())
+        return self.client.post(reverse("create-group-booking"), body, format="json")
+
+    def test_books_quantity_of_a_room_type(self):
+        res = self.post(room_type_id=self.room_type.id, quantity=12)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(len(res.json()["booking_ids"]), 12)
+        self.assertEqual(res.json()["amount"], "2400.00")
+        self.assertEqual(Booking.objects.filter(group_id=res.json()["group_id"]).count(), 12)
+
+    def test_all_or_nothing_when_a_room_is_taken(self):
+        rooms = list(Room.objects.filter(room_type=self.room_type).order_by("id")[:5])
+        Booking.objects.create(user=self.user, room=rooms[2], check_in=self.day, check_out=self.day + timedelta(days=1))
+
+        res = self.post(room_ids=[room.id for room in rooms])
+        self.assertEqual(res.status_code, 409)
+        self.assertIn(rooms[2].room_number, res.json()["error"])
+        self.assertEqual(Booking.objects.count(), 1)
+
+        res = self.post(room_type_id=self.room_type.id, quantity=30)
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_bad_input_is_400_and_conflicts_409(self):
+        room = Room.objects.filter(room_type=self.room_type).first()
+        self.assertEqual(self.post(room_type_id=self.room_type.id, quantity=51).status_code, 400)
+        self.assertEqual(self.post(room_ids=[room.id, 999999]).status_code, 400)
+        self.assertEqual(self.post(room_ids=[room.id], guests=0).status_code, 201)
+        self.assertEqual(self.post(room_type_id=self.room_type.id, quantity=3, guests=2).status_code, 400)
+
+        room.status = "maintenance"
+        room.save()
+        res = self.post(room_ids=[room.id], check_in=(self.day + timedelta(days=5)).isoformat(),
+                        check_out=(self.day + timedelta(days=6)).isoformat())
+        self.assertEqual(res.status_code, 409)
+        self.assertIn(room.room_number, res.json()["error"])
+
+    def test_guests_are_split_across_rooms(self):
+        res = self.post(room_type_id=self.room_type.id, quantity=3, guests=7)
+        self.assertEqual(res.status_code, 201)
+        group = BookingGroup.objects.get(pk=res.json()["group_id"])
+        self.assertEqual(group.guests, 7)
+        self.assertEqual(sorted(group.bookings.values_list("guests", flat=True)), [2, 2, 3])
+
+    def test_query_count_does_not_grow_with_group_size(self):
+        rooms = list(Room.objects.order_by("id"))
+
+        def book(chosen):
+            return BookingService.create_group_booking({
+                "room_ids": [room.id for room in chosen if room.room_type_id == self.room_type.id],
+                "check_in": self.day,
+                "check_out": self.day + timedelta(days=2),
+            }, self.user)
+
+        # savepoint, lock, occupancy, quote (rates, base price: none are
+        # materialized here), group, bulk insert, release
+        with self.assertNumQueries(8):
+            book(rooms[:2])
+        with self.assertNumQueries(8):
+            book(rooms[2:40])
+
+
+class RateEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room_type = RoomType.objects.create(name="Deluxe", base_price=Decimal("100.00"))
+        self.monday = date(2030, 6, 3)
+
+    def rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RateEngine.rebuild([self.room_type.id], start=self.monday, days=14)
+
+    def test_weekend_and_seasonal_rules(self):
+        RateRule.objects.create(name="Weekend", weekdays="4,5", multiplier=Decimal("1.50"))
+        RateRule.objects.create(
+            name="Peak", room_type=self.room_type, multiplier=Decimal("2.00"),
+            start_date=self.monday + timedelta(days=7), end_date=self.monday + timedelta(days=13),
+        )
+        self.rebuild()
+
+        prices = dict(NightlyRate.objects.values_list("date", "price"))
+        self.assertEqual(prices[self.monday], Decimal("100.00"))
+        self.assertEqual(prices[self.monday + timedelta(days=4)], Decimal("150.00"))
+        self.assertEqual(prices[self.monday + timedelta(days=11)], Decimal("300.00"))
+
+        # Mon-Mon: five weekdays at 100, Fri and Sat at 150
+        self.assertEqual(RateEngine.quote(self.room_type.id, self.monday, self.monday + timedelta(days=7)), Decimal("800.00"))
+
+    def test_quote_is_one_query_and_follows_rebuilds(self):
+        self.rebuild()
+        check_out = self.monday + timedelta(days=3)
+        with self.assertNumQueries(1):
+            self.assertEqual(RateEngine.quote(self.room_type.id, self.monday, check_out), Decimal("300.00"))
+
+        # e.g. another worker rebuilt: nothing memoized may hide it
+        NightlyRate.objects.filter(date=self.monday).update(price=Decimal("150.00"))
+        self.assertEqual(RateEngine.quote(self.room_type.id, self.monday, check_out), Decimal("350.00"))
+
+    def test_only_base_price_changes_rebuild_rates(self):
+        room_type = RoomType.objects.get(pk=self.room_type.pk)
+        with mock.patch.object(RateEngine, "rebuild") as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                room_type.description = "Sea view"
+                room_type.save()
+            rebuild.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                room_type.base_price = Decimal("120.00")
+                room_type.save()
+            rebuild.assert_called_once_with([room_type.id])
+
+    def test_nights_past_the_horizon_use_base_price(self):
+        self.rebuild()
+        last = self.monday + timedelta(days=13)
+        self.assertEqual(RateEngine.quote(self.room_type.id, last, last + timedelta(days=3)), Decimal("300.00"))
+
+    def test_occupancy_rule(self):
+        user = CustomUser.objects.create_user(username="guest", email="guest@example.com", password="pw")
+        rooms = [Room.objects.create(room_number=f"d{n}", room_type=self.room_type) for n in range(2)]
+        RateRule.objects.create(name="Busy", min_occupancy=Decimal("0.50"), multiplier=Decimal("1.20"))
+        Booking.objects.create(user=user, room=rooms[0], check_in=self.monday, check_out=self.monday + timedelta(days=1))
+        self.rebuild()
+
+        prices = dict(NightlyRate.objects.values_list("date", "price"))
+        self.assertEqual(prices[self.monday], Decimal("120.00"))
+        self.assertEqual(prices[self.monday + timedelta(days=1)], Decimal("100.00"))
+
+    def test_booking_is_priced_by_the_engine(self):
+        user = CustomUser.objects.create_user(username="guest", email="guest@example.com", password="pw")
+        room = Room.objects.create(room_number="d1", room_type=self.room_type)
+        RateRule.objects.create(name="Weekend", weekdays="4,5", multiplier=Decimal("1.50"))
+        self.rebuild()
+
+        booking = BookingService.create_booking({
+            "room_id": room.id,
+            "check_in": self.monday + timedelta(days=4),
+            "check_out": self.monday + timedelta(days=6),
+        }, user)
+        self.assertEqual(booking.total_price, Decimal("300.00"))
+
+
+class UserBookingHistoryTests(TestCase):
+    def setUp(self):
+        make_catalog(rooms=1, images_per_room=0)
+        self.user = CustomUser.objects.create_user(username="corp", email="corp@example.com", password="pw")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        room = Room.objects.first()
+        day = date(2030, 1, 1)
+        # bulk_create gives many rows the same `created`, exercising the id tie-break
+        Booking.objects.bulk_create([
+            Booking(
+                user=self.user, room=room,
+                check_in=day + timedelta(days=2 * n), check_out=day + timedelta(days=2 * n + 1),
+                status="cancelled" if n % 5 == 0 else "confirmed",
+            )
+            for n in range(45)
+        ])
+
+    def fetch_all(self, **params):
+        seen, cursor = [], None
+        while True:
+            query = dict(params, limit=10)
+            if cursor:
+                query["cursor"] = cursor
+            with self.assertNumQueries(2):  # user lookup + page
+                body = self.client.get(reverse("list-user-bookings"), query).json()
+            seen += body["results"]
+            cursor = body["next_cursor"]
+            if not cursor:
+                return seen
+
+    def test_walks_every_booking_once_newest_first(self):
+        rows = self.fetch_all()
+        ids = [row["id"] for row in rows]
+        self.assertEqual(len(ids), 45)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(rows[0]["room__room_type__name"], "Type 0")
+
+    def test_status_and_date_filters(self):
+        self.assertEqual(len(self.fetch_all(status="cancelled")), 9)
+        rows = self.fetch_all(**{"from": "2030-01-01", "to": "2030-01-11"})
+        self.assertEqual(len(rows), 5)
+
+    def test_bad_cursor(self):
+        res = self.client.get(reverse("list-user-bookings"), {"cursor": "nope"})
+        self.assertEqual(res.status_code, 400)
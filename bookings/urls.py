@@ -7,9 +7,12 @@ urlpatterns = [
     path("", views.RoomsListAPIView.as_view(), name="rooms-list"),
     path("<int:room_id>/", views.RoomDetailAPIView.as_view(), name="room-detail"),
     path("bookings/create/", views.CreateBookingView.as_view(), name="create-booking"),
+    path("bookings/group/", views.CreateGroupBookingView.as_view(), name="create-group-booking"),
     path("bookings/user/", views.ListUserBookingsView.as_view(), name="list-user-bookings"),
     path('auth/google-login/', views.GoogleLoginView.as_view(), name='google-login'),
     path('services/', views.ServicesListAPIView.as_view(), name='services-list'),
     path("reviews/", views.ReviewsAPIView.as_view(), name="reviews"),
+    path("quote/", views.QuoteView.as_view(), name="quote"),
+    path("availability/calendar/", views.AvailabilityCalendarView.as_view(), name="availability-calendar"),
 ]
 
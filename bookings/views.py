@@ -1,5 +1,9 @@
 # bookings/views.py
+import logging
+
 from payments.models import Payment
+from payments.services import PaymentService
+from payments import breaker as payment_breaker
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
@@ -7,14 +11,18 @@ from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from datetime import date, datetime
-from .models import GalleryCategory, Room, Booking, RoomReview, Subscription
-from .services import RoomServices, BookingService
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
-import requests
+from .models import GalleryCategory, Room, RoomType, RoomReview, Subscription
+from .services import RoomServices, BookingService, RoomsUnavailable
+from . import cache as catalog_cache
+from .availability import AvailabilityEngine, next_month
+from .pricing import RateEngine
+from accounts.authentication import ClaimsJWTAuthentication, UserRefreshToken
+from accounts import google
+from accounts.ratelimit import AvailabilityThrottle, SubscribeThrottle
 from django.db.models import Q
 from django.conf import settings
-from decimal import Decimal
+
+logger = logging.getLogger(__name__)
 
 
 User = get_user_model()
@@ -26,8 +34,7 @@ class RoomsListAPIView(APIView):
         """
         Return all rooms with images, room type, and services.
         """
-        rooms = RoomServices.get_all_rooms()
-        return Response(rooms, status=status.HTTP_200_OK)
+        return catalog_cache.catalog_response(request, "rooms", RoomServices.get_all_rooms)
 
 
 class RoomDetailAPIView(APIView):
@@ -37,10 +44,14 @@ class RoomDetailAPIView(APIView):
         """
         Return single room by id with images, services, and room type.
         """
-        room = RoomServices.get_room_by_id(room_id)
-        if "error" in room:
-            return Response(room, status=status.HTTP_404_NOT_FOUND)
-        return Response(room, status=status.HTTP_200_OK)
+        def build():
+            room = RoomServices.get_room_by_id(room_id)
+            return None if "error" in room else room
+
+        response = catalog_cache.catalog_response(request, f"room:{room_id}", build)
+        if response is None:
+            return Response({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
+        return response
 
 class ServicesListAPIView(APIView):
     permission_classes = [AllowAny]  # Public endpoint
@@ -50,8 +61,7 @@ class ServicesListAPIView(APIView):
         Return all room services.
         """
         try:
-            services = RoomServices.get_all_services()  # We'll create this in services.py
-            return Response(services, status=status.HTTP_200_OK)
+            return catalog_cache.catalog_response(request, "services", RoomServices.get_all_services)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -65,16 +75,14 @@ class GoogleLoginView(APIView):
         if not token:
             return Response({"error": "id_token is required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Verify token with Google
-        response = requests.get(
-            'https://oauth2.googleapis.com/tokeninfo',
-            params={'id_token': token}
-        )
-
-        if response.status_code != 200:
+        # Verify token locally against Google's cached signing keys
+        try:
+            data = google.verify(token)
+        except google.InvalidGoogleToken:
             return Response({"error": "Invalid Google token"}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        data = response.json()
+        except google.GoogleCertsUnavailable:
+            return Response({"error": "Google sign-in is unavailable, try again shortly"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
         email = data.get('email')
         if not email:
             return Response({"error": "Email not found in token"}, status=status.HTTP_400_BAD_REQUEST)
@@ -86,14 +94,14 @@ class GoogleLoginView(APIView):
         )
 
         # Issue JWT
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         return Response({
             "refresh": str(refresh),
             "access": str(refresh.access_token)
         })
 
 class CreateRoomTypeView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -134,8 +142,22 @@ class ListRoomsView(APIView):
         return Response(list(rooms), status=status.HTTP_200_OK)
 
 
+PAY_LATER_WARNING = "Online payment is temporarily unavailable. Your booking is held; pay later from your bookings."
+
+
+def pay_later(booking, amount):
+    return {
+        "message": "Booking created",
+        "booking_id": booking.id,
+        "room": booking.room_id,
+        "amount": str(amount),
+        "payment": "pay_later",
+        "warning": PAY_LATER_WARNING,
+    }
+
+
 class CreateBookingView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     def post(self, request):
         data = request.data
@@ -144,90 +166,173 @@ class CreateBookingView(APIView):
         try:
             room_id = int(data.get("room_id"))
             room = Room.objects.get(id=room_id)
-            check_in = data.get("check_in")
-            check_out = data.get("check_out")
+            check_in = date.fromisoformat(data.get("check_in"))
+            check_out = date.fromisoformat(data.get("check_out"))
             guests = int(data.get("guests") or 1)
         except Exception as e:
             return Response({"error": "Invalid data"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # availability check placeholder (you must implement actual availability logic)
-        # For now assume available.
+        if check_out <= check_in:
+            return Response({"error": "Check-out must be after check-in"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # calculate amount
-        nights = ( ( __import__("datetime").datetime.fromisoformat(check_out) - __import__("datetime").datetime.fromisoformat(check_in) ).days )
-        amount = Decimal(room.room_type.base_price) * max(1, nights)
+        # Availability check and insert happen under a lock on the room
+        try:
+            booking = BookingService.create_booking({
+                "room_id": room.id,
+                "check_in": check_in,
+                "check_out": check_out,
+                "guests": guests,
+                "special_requests": data.get("specialRequests", ""),
+            }, request.user)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_409_CONFLICT)
+
+        amount = booking.total_price
+
+        if data.get("paymentMethod") and payment_breaker.is_open():
+            # Gateway down: don't make the guest wait on it
+            return Response(pay_later(booking, amount), status=201)
 
         if data.get("paymentMethod"):
             print(data.get("paymentMethod"))
             try:
-                init_url = f"{settings.API_BASE_URL}/api/payments/init/"
-                
-                booking = Booking.objects.create(
-                        user=request.user,
-                        room=room,
-                        check_in=check_in,
-                        check_out=check_out,
-                        guests=guests,
-                        special_requests=data.get("specialRequests",""),
-                        total_price=amount
-                    )
-
-                # Call your PesapalInitView
-                pesapal_res = requests.post(init_url, json={
+                # In-process: no HTTP round trip to our own /api/payments/init/
+                pesapal_data = PaymentService.initiate_pesapal_payment(
+                    booking.id, amount, request.user.id, email=request.user.email,
+                )
+                return Response({
+                    "message": "Booking created",
                     "booking_id": booking.id,
                     "amount": str(amount),
-                    "user_id": request.user.id,
-                })
-
-                pesapal_data = pesapal_res.json()
-
-                if pesapal_res.status_code == 200 and "redirect_url" in pesapal_data:
-                    return Response({
-                        "message": "Booking created",
-                        "booking_id": booking.id,
-                        "amount": str(amount),
-                        "pesapal_url": pesapal_data["redirect_url"]
-                    }, status=201)
-
-                else:
-                    return Response({
-                        "message": "Booking created",
-                        "rom": room.id,
-                        "amount": str(amount),
-                        "warning": "Pesapal failed, complete payment manually."
-                    }, status=201)
+                    "pesapal_url": pesapal_data["redirect_url"]
+                }, status=201)
 
+            except payment_breaker.CircuitOpenError:
+                return Response(pay_later(booking, amount), status=201)
             except Exception as e:
                 print(e)
                 return Response({
                     "message": "Booking created",
+                    "booking_id": booking.id,
                     "room": room.id,
                     "amount": str(amount),
+                    "warning": "Pesapal failed, complete payment manually.",
                     "error": str(e)
                 }, status=201)
 
         # default return (no payment method)
         return Response({
             "message": "Booking created",
+            "booking_id": booking.id,
             "room": room.id,
             "amount": str(amount),
         }, status=201)
 
 
+class CreateGroupBookingView(APIView):
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Book several rooms at once, all or nothing, with one combined payment.
+        Body: check_in, check_out, and either room_ids (list) or
+        room_type_id + quantity. Optional: guests (the whole party, split across
+        the rooms), specialRequests, paymentMethod.
+        """
+        data = request.data
+        try:
+            check_in = date.fromisoformat(data.get("check_in"))
+            check_out = date.fromisoformat(data.get("check_out"))
+            guests = int(data["guests"]) if data.get("guests") else None
+            room_ids = [int(room_id) for room_id in data.get("room_ids") or []]
+            room_type_id = int(data["room_type_id"]) if not room_ids else None
+            quantity = int(data.get("quantity") or 0) if not room_ids else len(room_ids)
+        except Exception:
+            return Response({"error": "Invalid data"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if check_out <= check_in:
+            return Response({"error": "Check-out must be after check-in"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            group, bookings = BookingService.create_group_booking({
+                "room_ids": room_ids,
+                "room_type_id": room_type_id,
+                "quantity": quantity,
+                "check_in": check_in,
+                "check_out": check_out,
+                "guests": guests,
+                "special_requests": data.get("specialRequests", ""),
+            }, request.user)
+        except RoomsUnavailable as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_409_CONFLICT)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        booking_ids = [booking.id for booking in bookings]
+        if None in booking_ids:
+            # backends that cannot return ids from bulk_create
+            booking_ids = list(group.bookings.order_by("id").values_list("id", flat=True))
+
+        result = {
+            "message": "Group booking created",
+            "group_id": group.id,
+            "booking_ids": booking_ids,
+            "rooms": [booking.room_id for booking in bookings],
+            "amount": str(group.total_price),
+        }
+
+        if data.get("paymentMethod"):
+            # One payment for the whole group, attached to its first booking
+            try:
+                pesapal_data = PaymentService.initiate_pesapal_payment(
+                    booking_ids[0], group.total_price, request.user.id, email=request.user.email,
+                )
+                result["pesapal_url"] = pesapal_data["redirect_url"]
+            except payment_breaker.CircuitOpenError:
+                result["payment"] = "pay_later"
+                result["warning"] = PAY_LATER_WARNING
+            except Exception as e:
+                logger.exception("Pesapal payment for group %s failed", group.id)
+                result["warning"] = "Pesapal failed, complete payment manually."
+                result["error"] = str(e)
+
+        return Response(result, status=status.HTTP_201_CREATED)
+
+
 class ListUserBookingsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        bookings_qs = Booking.objects.filter(user=user).values(
-            "id",
-            "room__room_number",
-            "check_in",
-            "check_out",
-            "status",
-            "total_price"
-        )
-        return Response(list(bookings_qs), status=status.HTTP_200_OK)
+        """
+        The user's bookings, newest first, one page at a time.
+        Query params: cursor (from next_cursor), limit (1-100, default 20),
+        status, from / to (YYYY-MM-DD, bookings overlapping the range).
+        """
+        params = request.query_params
+        try:
+            limit = min(max(int(params.get("limit") or 20), 1), 100)
+            date_from = date.fromisoformat(params["from"]) if params.get("from") else None
+            date_to = date.fromisoformat(params["to"]) if params.get("to") else None
+        except ValueError:
+            return Response({"error": "Invalid limit or date"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            bookings, next_cursor = BookingService.user_bookings_page(
+                request.user,
+                cursor=params.get("cursor"),
+                limit=limit,
+                status=params.get("status"),
+                date_from=date_from,
+                date_to=date_to,
+            )
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "results": bookings,
+            "next_cursor": next_cursor,
+        }, status=status.HTTP_200_OK)
 
 class ReviewsAPIView(APIView):
     """
@@ -255,6 +360,8 @@ class ReviewsAPIView(APIView):
         return Response(data, status=status.HTTP_200_OK)
 
 class Subscribe(APIView):
+    throttle_classes = [SubscribeThrottle]
+
     def post(self, request, *args, **kwargs):
 
         name = request.data.get('name')
@@ -274,6 +381,8 @@ class Subscribe(APIView):
 
 
 class CheckAvailability(APIView):
+    throttle_classes = [AvailabilityThrottle]
+
     def post(self, request):
         data = request.data
         check_in = data.get("check_in")
@@ -303,13 +412,7 @@ class CheckAvailability(APIView):
             return Response({"error": "Guests must be a positive number"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Filter rooms
-        available_rooms = Room.objects.filter(
-            room_type__max_guests__gte=guests,
-            status='available'
-        ).exclude(
-            booking__check_in__lt=check_out_date,
-            booking__check_out__gt=check_in_date
-        ).distinct()
+        available_rooms = AvailabilityEngine.free_rooms(check_in_date, check_out_date, guests)
 
         rooms_list = [
             {
@@ -325,9 +428,77 @@ class CheckAvailability(APIView):
 
         return Response({"available_rooms": rooms_list}, status=status.HTTP_200_OK)
     
+class AvailabilityCalendarView(APIView):
+    permission_classes = [AllowAny]  # Public endpoint
+
+    def get(self, request):
+        """
+        Free rooms per night for a room type over a range of months.
+        Query params: room_type (id), start (YYYY-MM, default this month),
+        months (1-12, default 1).
+        """
+        try:
+            room_type_id = int(request.query_params.get("room_type"))
+        except (TypeError, ValueError):
+            return Response({"error": "room_type is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start = request.query_params.get("start")
+            first = date.fromisoformat(f"{start}-01") if start else date.today().replace(day=1)
+            count = int(request.query_params.get("months") or 1)
+            if not 1 <= count <= 12:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "start must be YYYY-MM and months 1-12"}, status=status.HTTP_400_BAD_REQUEST)
+
+        months = [first]
+        while len(months) < count:
+            months.append(next_month(months[-1]))
+
+        calendar = AvailabilityEngine.calendar(room_type_id, months)
+        return Response({
+            "room_type": room_type_id,
+            "months": [
+                {"month": f"{month:%Y-%m}", "available": calendar[month]}
+                for month in months
+            ],
+        }, status=status.HTTP_200_OK)
+
+class QuoteView(APIView):
+    permission_classes = [AllowAny]  # Public endpoint
+
+    def get(self, request):
+        """
+        Price a stay. Query params: room_type (id), check_in, check_out.
+        """
+        try:
+            room_type_id = int(request.query_params.get("room_type"))
+            check_in = date.fromisoformat(request.query_params.get("check_in"))
+            check_out = date.fromisoformat(request.query_params.get("check_out"))
+        except (TypeError, ValueError):
+            return Response({"error": "room_type, check_in and check_out are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if check_out <= check_in:
+            return Response({"error": "Check-out must be after check-in"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            total = RateEngine.quote(room_type_id, check_in, check_out)
+        except RoomType.DoesNotExist:
+            return Response({"error": "Room type not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "room_type": room_type_id,
+            "nights": (check_out - check_in).days,
+            "total_price": str(total),
+        }, status=status.HTTP_200_OK)
+
 class GalleryListView(APIView):
     def get(self, request):
-        categories = GalleryCategory.objects.all()
+        return catalog_cache.catalog_response(request, "gallery", self.build)
+
+    @staticmethod
+    def build():
+        categories = GalleryCategory.objects.prefetch_related("images")
         data = []
         for category in categories:
             images = category.images.all()
@@ -337,5 +508,4 @@ class GalleryListView(APIView):
                 "description": category.description,
                 "images": [f"{settings.BASE_URL}{img.image.url}" for img in images],  # return image URLs
             })
-        return Response(data)
-    
+        return data
\ No newline at end of file
@@ -1,6 +1,27 @@
 from django.contrib import admin
 
-from payments.models import Payment, PaymentLog
+from payments.models import IPNInbox, Payment, PaymentLog
 
 # Register your models here.
-admin.site.register([Payment, PaymentLog])
\ No newline at end of file
+admin.site.register(Payment)
+
+
+@admin.register(PaymentLog)
+class PaymentLogAdmin(admin.ModelAdmin):
+    list_display = ("payment", "status", "message", "timestamp")
+    list_filter = ("status",)
+    date_hierarchy = "timestamp"
+
+    # Append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(IPNInbox)
+class IPNInboxAdmin(admin.ModelAdmin):
+    list_display = ("tracking_id", "merchant_reference", "status", "result", "attempts", "duplicates", "received")
+    list_filter = ("status", "result")
+    search_fields = ("tracking_id", "merchant_reference")
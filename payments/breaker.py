@@ -0,0 +1,126 @@
+# payments/breaker.py
+
+"""
+Circuit breaker for the payment gateway.
+
+Every Pesapal call goes through http_client.request(), which asks allow()
+first and reports the outcome afterwards. After FAILURE_THRESHOLD
+consecutive failures (connection errors, timeouts, 5xx) the circuit opens
+and calls fail fast with CircuitOpenError instead of waiting on a dead
+upstream. After COOLDOWN seconds it is half-open: one caller gets to probe
+the gateway while the rest keep failing fast, and the probe's outcome
+closes or re-opens the circuit. The state lives in the cache, so all
+workers share it.
+"""
+
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+OPENED_KEY = "pesapal:breaker:opened"
+FAILURES_KEY = "pesapal:breaker:failures"
+PROBE_KEY = "pesapal:breaker:probe"
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_stats = {"opened": 0, "half_opened": 0, "closed": 0, "rejected": 0}
+_stats_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    The gateway is considered down; the call was not attempted.
+    """
+
+
+def _setting(name, default):
+    return getattr(settings, f"PAYMENTS_BREAKER_{name}", default)
+
+
+def failure_threshold():
+    return _setting("FAILURE_THRESHOLD", 5)
+
+
+def cooldown():
+    return _setting("COOLDOWN", 30)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    """
+    Breaker transitions and fast failures seen by this worker process, plus
+    the shared current state.
+    """
+    with _stats_lock:
+        return dict(_stats, state=state())
+
+
+def state():
+    opened = cache.get(OPENED_KEY)
+    if opened is None:
+        return CLOSED
+    if time.time() - opened < cooldown():
+        return OPEN
+    return HALF_OPEN
+
+
+def is_open():
+    """
+    True while calls would be rejected without a probe slot; lets callers
+    degrade before building a request.
+    """
+    return state() == OPEN
+
+
+def allow():
+    current = state()
+    if current == CLOSED:
+        return True
+    # Probe lease outlives the slowest call, in case the prober dies
+    if current == HALF_OPEN and cache.add(PROBE_KEY, 1, timeout=cooldown()):
+        _count("half_opened")
+        return True
+    _count("rejected")
+    return False
+
+
+def check():
+    if not allow():
+        raise CircuitOpenError("Payment gateway circuit is open")
+
+
+def record_success():
+    if cache.get(OPENED_KEY) is not None:
+        cache.delete_many([OPENED_KEY, PROBE_KEY, FAILURES_KEY])
+        _count("closed")
+    elif cache.get(FAILURES_KEY):
+        cache.delete(FAILURES_KEY)
+
+
+def record_failure():
+    if cache.get(OPENED_KEY) is not None:
+        if cache.get(PROBE_KEY):
+            # The half-open probe failed: start another cooldown
+            cache.set(OPENED_KEY, time.time(), timeout=None)
+            cache.delete(PROBE_KEY)
+            _count("opened")
+        return
+
+    cache.add(FAILURES_KEY, 0, timeout=None)
+    try:
+        failures = cache.incr(FAILURES_KEY)
+    except ValueError:
+        failures = 1
+    if failures >= failure_threshold() and cache.add(OPENED_KEY, time.time(), timeout=None):
+        _count("opened")
+
+
+def reset():
+    cache.delete_many([OPENED_KEY, PROBE_KEY, FAILURES_KEY])
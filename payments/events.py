@@ -0,0 +1,109 @@
+# payments/events.py
+
+"""
+Append-only payment event log.
+
+Inside a transaction, record() only buffers the event: it registers a
+callback with transaction.on_commit, so Django drops it along with the
+atomic block (transaction or savepoint) it was recorded in if that block
+rolls back. When the transaction commits, the first of its callbacks to run
+writes every event still scheduled with one bulk_create, so a
+reconciliation batch that settles hundreds of payments adds one insert,
+not hundreds. Outside a transaction the event is written at once.
+"""
+
+import itertools
+import threading
+import weakref
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PaymentLog
+
+BATCH_SIZE = 500
+
+# Pesapal / Payment.status -> PaymentLog.status
+LOG_STATUS = {
+    "PENDING": "pending",
+    "COMPLETED": "success",
+    "FAILED": "failed",
+    "INVALID": "failed",
+    "REVERSED": "refunded",
+}
+
+_local = threading.local()
+
+
+def log_status(payment_status):
+    return LOG_STATUS.get((payment_status or "").upper(), "processing")
+
+
+class _Pending:
+    """
+    on_commit callback for one event. Only Django's on_commit queue holds
+    it, so a callback dropped by a rollback is gone from _scheduled() too.
+    """
+
+    _order = itertools.count()
+
+    def __init__(self, event):
+        self.event = event
+        self.seq = next(self._order)
+        self.written = False
+
+    def __call__(self):
+        if self.written:
+            return
+        batch = sorted((p for p in _scheduled() if not p.written), key=lambda p: p.seq)
+        for pending in batch:
+            pending.written = True
+        _write([pending.event for pending in batch])
+
+
+def _scheduled():
+    # This thread's callbacks that Django still holds
+    if not hasattr(_local, "scheduled"):
+        _local.scheduled = weakref.WeakSet()
+    return _local.scheduled
+
+
+def _write(events):
+    if events:
+        PaymentLog.objects.bulk_create(events, batch_size=BATCH_SIZE)
+
+
+def record(payment, status, message=""):
+    """
+    Append one event for `payment` (a Payment or its id).
+    """
+    event = PaymentLog(
+        payment_id=getattr(payment, "pk", payment),
+        status=status,
+        message=message,
+        timestamp=timezone.now(),
+    )
+
+    if connection.in_atomic_block:
+        pending = _Pending(event)
+        _scheduled().add(pending)
+        transaction.on_commit(pending)
+        return
+
+    _write([event])
+
+
+
+EXPORT_FIELDS = ("id", "payment_id", "tracking_id", "status", "message", "timestamp")
+
+
+def export_rows(start, end, chunk_size=2000):
+    """
+    Events with start <= timestamp < end, oldest first, read from the
+    database `chunk_size` rows at a time.
+    """
+    return PaymentLog.objects.filter(
+        timestamp__gte=start, timestamp__lt=end,
+    ).order_by("timestamp", "id").values_list(
+        "id", "payment_id", "payment__pesapal_order_tracking_id", "status", "message", "timestamp",
+    ).iterator(chunk_size=chunk_size)
@@ -0,0 +1,144 @@
+# payments/http_client.py
+
+"""
+HTTP client for every outbound payment-gateway call.
+
+One keep-alive session per worker process reuses TCP+TLS connections to
+Pesapal instead of handshaking on every call. Each logical endpoint has
+its own (connect, read) timeout so a slow gateway cannot hold a worker for
+gunicorn's whole --timeout, and idempotent endpoints (status lookups) are
+retried a bounded number of times with exponential backoff. Per-endpoint
+latency is recorded and exposed through stats(). Calls pass through the
+circuit breaker in breaker.py, so they fail fast while the gateway is down.
+"""
+
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import breaker
+
+# Production gateway. Point PESAPAL_BASE_URL at the sandbox or at
+# payments.simulator for tests and load tests; nothing else names a host.
+DEFAULT_BASE_URL = "https://pay.pesapal.com/v3"
+
+# endpoint -> (connect timeout, read timeout) in seconds
+TIMEOUTS = {
+    "token": (3.05, 10),
+    "submit_order": (3.05, 20),
+    "status": (3.05, 10),
+    "default": (3.05, 15),
+}
+
+# endpoint -> extra attempts; only for calls that are safe to repeat
+RETRIES = {
+    "status": 2,
+}
+
+BACKOFF = 0.25
+RETRY_STATUSES = (502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def base_url():
+    return getattr(settings, "PESAPAL_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+
+
+def gateway_url(path):
+    """
+    Absolute URL of a Pesapal API path, e.g. gateway_url("api/Auth/RequestToken").
+    """
+    return f"{base_url()}/{path.lstrip('/')}"
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                pool = getattr(settings, "PAYMENTS_HTTP_POOL_SIZE", 20)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _timeout(endpoint):
+    timeouts = dict(TIMEOUTS, **getattr(settings, "PAYMENTS_HTTP_TIMEOUTS", {}))
+    return timeouts.get(endpoint, timeouts["default"])
+
+
+def _record(endpoint, seconds, failed):
+    ms = seconds * 1000
+    with _stats_lock:
+        entry = _stats.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["calls"] += 1
+        entry["errors"] += int(failed)
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+
+
+def _count_retry(endpoint):
+    with _stats_lock:
+        _stats[endpoint]["retries"] += 1
+
+
+def stats():
+    """
+    Per-endpoint call counts and latency for this worker process.
+    """
+    with _stats_lock:
+        result = {}
+        for endpoint, entry in _stats.items():
+            result[endpoint] = dict(entry, avg_ms=round(entry["total_ms"] / entry["calls"], 1) if entry["calls"] else 0.0)
+        return result
+
+
+def request(endpoint, method, url, **kwargs):
+    """
+    Send one request through the shared session. `endpoint` names the call
+    for timeouts, retries and latency stats.
+    """
+    breaker.check()
+    kwargs.setdefault("timeout", _timeout(endpoint))
+    attempts = 1 + RETRIES.get(endpoint, 0)
+
+    for attempt in range(attempts):
+        started = time.monotonic()
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            _record(endpoint, time.monotonic() - started, failed=True)
+            if attempt + 1 == attempts:
+                breaker.record_failure()
+                raise
+        else:
+            retry = response.status_code in RETRY_STATUSES and attempt + 1 < attempts
+            _record(endpoint, time.monotonic() - started, failed=response.status_code >= 500)
+            if not retry:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                return response
+
+        _count_retry(endpoint)
+        time.sleep(BACKOFF * (2 ** attempt))
+
+
+def get(endpoint, url, **kwargs):
+    return request(endpoint, "GET", url, **kwargs)
+
+
+def post(endpoint, url, **kwargs):
+    return request(endpoint, "POST", url, **kwargs)
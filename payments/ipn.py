@@ -0,0 +1,147 @@
+# payments/ipn.py
+
+"""
+IPN inbox: receive fast, verify later.
+
+The IPN endpoint only records the notification and acknowledges it.
+`manage.py process_ipn_inbox` drains the inbox, verifying each order with
+Pesapal once and applying the result. Pesapal retries IPNs in bursts;
+repeats for an order that is still queued or already settled are dropped
+at receipt, before any network call. A failed verification is retried
+with exponential backoff; after MAX_ATTEMPTS the row is parked as failed
+until Pesapal sends the IPN again.
+"""
+
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import breaker
+from .models import IPNInbox, Payment
+from .services import PaymentService
+from .utils import verify_pesapal_transaction
+
+# Payment states that no later IPN can change
+FINAL_RESULTS = ("COMPLETED", "FAILED", "REVERSED", "INVALID")
+
+MAX_ATTEMPTS = 5
+# Wait before retry n (1-based): RETRY_DELAY * 2**(n-1), at most MAX_RETRY_DELAY
+RETRY_DELAY = timedelta(seconds=30)
+MAX_RETRY_DELAY = timedelta(hours=1)
+# A row left "processing" this long belonged to a worker that died
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def enqueue(tracking_id, merchant_reference, notification_type="", payload=None):
+    """
+    Store an IPN. Returns (row, created); created is False for a dropped
+    duplicate.
+    """
+    entry, created = IPNInbox.objects.get_or_create(
+        tracking_id=tracking_id,
+        merchant_reference=merchant_reference,
+        defaults={"notification_type": notification_type or "", "payload": payload or {}},
+    )
+    if created:
+        return entry, True
+
+    # A settled order cannot change, but one that was still pending, or
+    # whose IPN ran out of attempts, may have news
+    requeue = entry.status == "failed" or (entry.status == "done" and entry.result not in FINAL_RESULTS)
+    updated = IPNInbox.objects.filter(pk=entry.pk)
+    if requeue:
+        updated.filter(status__in=("done", "failed")).update(
+            status="pending", attempts=0, next_attempt_at=None, payload=payload or {},
+        )
+    else:
+        updated.update(duplicates=F("duplicates") + 1)
+    return entry, requeue
+
+
+def retry_delay(attempt):
+    """
+    How long to wait after failed attempt number `attempt` (1-based).
+    """
+    return min(RETRY_DELAY * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+
+
+def claim(limit=20):
+    """
+    Mark up to `limit` pending rows that are due (or abandoned rows) as
+    processing and return them. Uses SKIP LOCKED where available so
+    several workers can drain the inbox side by side.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+        queue = IPNInbox.objects.filter(due, status="pending") | IPNInbox.objects.filter(
+            status="processing", claimed_at__lt=now - CLAIM_TIMEOUT,
+        )
+        queue = queue.order_by("received")
+        if connection.features.has_select_for_update_skip_locked:
+            queue = queue.select_for_update(skip_locked=True)
+        rows = list(queue[:limit])
+        IPNInbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+            status="processing", claimed_at=now, attempts=F("attempts") + 1,
+        )
+    return rows
+
+
+def process(entry):
+    """
+    Verify one IPN with Pesapal and apply the result to its payment.
+    """
+    try:
+        payment = PaymentService.find_by_tracking_id(entry.tracking_id)
+        if payment is None:
+            raise Payment.DoesNotExist(f"No payment for tracking id {entry.tracking_id}")
+
+        status_data = verify_pesapal_transaction(entry.tracking_id)
+        if status_data.get("status") == "ERROR":
+            raise Exception(f"Unreadable status response: {status_data.get('raw')}")
+
+        result = PaymentService.apply_transaction_status(payment, status_data["data"])
+    except breaker.CircuitOpenError:
+        # Not the IPN's fault: requeue without using up an attempt
+        IPNInbox.objects.filter(pk=entry.pk).update(status="pending", attempts=F("attempts") - 1)
+        return None
+    except Exception as e:
+        # entry.attempts was read before claim() counted this attempt
+        attempt = entry.attempts + 1
+        failed = attempt >= MAX_ATTEMPTS
+        IPNInbox.objects.filter(pk=entry.pk).update(
+            status="failed" if failed else "pending",
+            last_error=str(e),
+            next_attempt_at=None if failed else timezone.now() + retry_delay(attempt),
+        )
+        return None
+
+    IPNInbox.objects.filter(pk=entry.pk).update(
+        status="done", result=result, last_error="", processed_at=timezone.now(),
+    )
+    return result
+
+
+def drain(limit=20):
+    """
+    Process one batch. Returns how many rows were claimed.
+    """
+    if breaker.is_open():
+        # Leave the inbox alone rather than burn attempts on a dead gateway
+        return 0
+    rows = claim(limit)
+    for entry in rows:
+        process(entry)
+    return len(rows)
+
+
+def counts():
+    """
+    Inbox rows per status, for the payments metrics endpoint.
+    """
+    return {
+        row["status"]: row["total"]
+        for row in IPNInbox.objects.values("status").annotate(total=Count("id")).order_by()
+    }
@@ -0,0 +1,92 @@
+# payments/management/commands/bench_payment_init.py
+
+import threading
+import time
+from datetime import date, timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+
+from accounts.models import CustomUser
+from bookings.models import Booking, Room, RoomType
+from payments.services import PaymentService
+from payments.simulator import PesapalSimulator
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class QuietHandler(WSGIRequestHandler):
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare payment initiation in-process against the old HTTP self-call "
+        "to /api/payments/init/, both against a local Pesapal simulator. "
+        "Creates and then deletes throwaway rows; use a development database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--latency", type=float, default=0.05, help="Simulated gateway latency in seconds")
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+
+        user = CustomUser.objects.create_user(username="bench-payments", email="bench-payments@example.invalid", password=None)
+        room_type = RoomType.objects.create(name="bench-payments", base_price=100)
+        room = Room.objects.create(room_number="bench-payments", room_type=room_type)
+        check_in = date.today() + timedelta(days=3650)
+        booking = Booking.objects.create(user=user, room=room, check_in=check_in, check_out=check_in + timedelta(days=1), total_price=100)
+
+        app_server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler)
+        app_server.set_app(get_wsgi_application())
+        threading.Thread(target=app_server.serve_forever, daemon=True).start()
+        app_url = f"http://127.0.0.1:{app_server.server_port}"
+
+        try:
+            with PesapalSimulator(latency=options["latency"]) as gateway, \
+                    override_settings(PESAPAL_BASE_URL=gateway.url, ALLOWED_HOSTS=["*"]):
+
+                def in_process():
+                    PaymentService.initiate_pesapal_payment(booking.id, booking.total_price, user.id)
+
+                def self_call():
+                    res = requests.post(f"{app_url}/api/payments/init/", json={
+                        "booking_id": booking.id,
+                        "amount": str(booking.total_price),
+                        "user_id": user.id,
+                    }, timeout=30)
+                    res.raise_for_status()
+
+                # warm up token cache and connection pools
+                in_process()
+                self_call()
+
+                for label, call in (("in-process", in_process), ("HTTP self-call", self_call)):
+                    samples = []
+                    for _ in range(iterations):
+                        started = time.perf_counter()
+                        call()
+                        samples.append((time.perf_counter() - started) * 1000)
+                    self.stdout.write(
+                        f"{label:>15}: mean {sum(samples) / len(samples):7.1f} ms  "
+                        f"p50 {percentile(samples, 50):7.1f} ms  p95 {percentile(samples, 95):7.1f} ms"
+                    )
+        finally:
+            app_server.shutdown()
+            app_server.server_close()
+            booking.delete()
+            room.delete()
+            room_type.delete()
+            user.delete()
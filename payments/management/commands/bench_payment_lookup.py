@@ -0,0 +1,96 @@
+# payments/management/commands/bench_payment_lookup.py
+
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts.models import CustomUser
+from bookings.models import Booking, Room, RoomType
+from payments.management.commands.bench_payment_init import percentile
+from payments.models import Payment
+from payments.services import PaymentService
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the callback/IPN payment lookup on a seeded payments table "
+        "(default one million rows) and show its query plan. Seed rows are "
+        "rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payments", type=int, default=1_000_000, help="Payments to seed")
+        parser.add_argument("--lookups", type=int, default=2000)
+        parser.add_argument("--scans", type=int, default=5, help="Unindexed lookups to time for comparison")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                tracking_ids = self.seed(options["payments"])
+                self.bench(tracking_ids, options["lookups"], options["scans"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        user = CustomUser.objects.create_user(username="bench-lookup", email="bench-lookup@example.invalid", password=None)
+        room = Room.objects.create(room_number="bench-lookup", room_type=RoomType.objects.create(name="bench-lookup", base_price=100))
+        booking = Booking.objects.create(user=user, room=room, total_price=100)
+
+        started = time.perf_counter()
+        tracking_ids = []
+        batch = []
+        for n in range(count):
+            tracking_id = str(uuid.uuid4())
+            if n % max(count // 1000, 1) == 0:
+                tracking_ids.append(tracking_id)
+            batch.append(Payment(
+                booking=booking, user=user, amount=100,
+                pesapal_order_tracking_id=tracking_id,
+                pesapal_merchant_reference=str(n),
+            ))
+            if len(batch) == 5000:
+                Payment.objects.bulk_create(batch)
+                batch = []
+        Payment.objects.bulk_create(batch)
+
+        if connection.vendor in ("postgresql", "sqlite"):
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Payment._meta.db_table}")
+        self.stdout.write(f"Seeded {count} payments in {time.perf_counter() - started:.1f}s")
+        return tracking_ids
+
+    def timed(self, label, lookups, find):
+        samples = []
+        for n in range(lookups):
+            started = time.perf_counter()
+            find(n)
+            samples.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f"{label:>28}: p50 {percentile(samples, 50):8.3f} ms  p95 {percentile(samples, 95):8.3f} ms  "
+            f"p99 {percentile(samples, 99):8.3f} ms"
+        )
+
+    def bench(self, tracking_ids, lookups, scans):
+        def by_tracking_id(n):
+            assert PaymentService.find_by_tracking_id(tracking_ids[n % len(tracking_ids)]) is not None
+
+        def by_merchant_reference(n):
+            Payment.objects.filter(pesapal_merchant_reference=str(n * 997)).first()
+
+        def table_scan(n):
+            # What every callback paid before the index: the same match, unindexed.
+            # Newest payments first, as callbacks mostly are.
+            Payment.objects.filter(pesapal_order_tracking_id__endswith=tracking_ids[-1 - n % len(tracking_ids)]).first()
+
+        self.stdout.write(Payment.objects.filter(pesapal_order_tracking_id=tracking_ids[0]).explain())
+        self.timed("tracking id (unique index)", lookups, by_tracking_id)
+        self.timed("merchant reference (index)", lookups, by_merchant_reference)
+        if scans:
+            self.timed("tracking id (table scan)", scans, table_scan)
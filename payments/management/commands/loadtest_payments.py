@@ -0,0 +1,176 @@
+# payments/management/commands/loadtest_payments.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import CustomUser
+from bookings.models import Booking, Room, RoomType
+from payments import ipn
+from payments.management.commands.bench_payment_init import QuietHandler, percentile
+from payments.models import IPNInbox
+from payments.simulator import PesapalSimulator
+
+STEPS = ("booking", "init", "callback", "ipn")
+PREFIX = "loadtest-payments"
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the payment funnel (booking -> init -> callback -> IPN) at a "
+        "target rate against an in-process app server and the local Pesapal "
+        "simulator, and report throughput and latency percentiles per step. "
+        "Creates and then deletes throwaway rows; use a development database. "
+        "On SQLite set OPTIONS transaction_mode=IMMEDIATE, or concurrent "
+        "writers fail with 'database is locked'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rps", type=float, default=10, help="Funnels started per second")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds to keep starting funnels")
+        parser.add_argument("--concurrency", type=int, default=64, help="Most funnels in flight at once")
+        parser.add_argument("--rooms", type=int, default=50)
+        parser.add_argument("--latency", type=float, default=0.05, help="Simulated gateway latency in seconds")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of gateway calls that fail")
+
+    def handle(self, *args, **options):
+        total = int(options["rps"] * options["duration"])
+        self.samples = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.lock = threading.Lock()
+
+        user = CustomUser.objects.create_user(username=PREFIX, email=f"{PREFIX}@example.invalid", password=None)
+        room_type = RoomType.objects.create(name=PREFIX, base_price=100)
+        rooms = [
+            Room.objects.create(room_number=f"{PREFIX}-{i}", room_type=room_type)
+            for i in range(options["rooms"])
+        ]
+        self.room_count = len(rooms)
+        self.token = str(RefreshToken.for_user(user).access_token)
+        self.user = user
+        # Far enough ahead not to collide with real bookings
+        self.first_night = date.today() + timedelta(days=3650)
+
+        app_server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler)
+        app_server.set_app(get_wsgi_application())
+        threading.Thread(target=app_server.serve_forever, daemon=True).start()
+        self.app_url = f"http://127.0.0.1:{app_server.server_port}"
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=options["concurrency"]))
+
+        try:
+            with PesapalSimulator(latency=options["latency"], error_rate=options["error_rate"]) as gateway, \
+                    override_settings(
+                        PESAPAL_BASE_URL=gateway.url,
+                        PESAPAL_CALLBACK_URL=f"{self.app_url}/api/payments/pesapal/callback/",
+                        ALLOWED_HOSTS=["*"],
+                    ):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                    for i in range(total):
+                        # Open loop: start funnels on schedule, however slow the server is
+                        delay = started + i / options["rps"] - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                        pool.submit(self.funnel, i, rooms[i % len(rooms)])
+                elapsed = time.perf_counter() - started
+
+                drain_started = time.perf_counter()
+                processed = 0
+                while True:
+                    claimed = ipn.drain(50)
+                    if not claimed:
+                        break
+                    processed += claimed
+                drain_elapsed = time.perf_counter() - drain_started
+
+            self.report(total, elapsed, processed, drain_elapsed, gateway.calls)
+        finally:
+            app_server.shutdown()
+            app_server.server_close()
+            bookings = Booking.objects.filter(room__room_type=room_type)
+            IPNInbox.objects.filter(merchant_reference__in=[str(pk) for pk in bookings.values_list("id", flat=True)]).delete()
+            bookings.delete()
+            Room.objects.filter(room_type=room_type).delete()
+            room_type.delete()
+            user.delete()
+
+    def timed(self, step, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            res = self.session.request(method, url, timeout=30, allow_redirects=False, **kwargs)
+        except requests.RequestException:
+            res = None
+        ms = (time.perf_counter() - started) * 1000
+        ok = res is not None and res.status_code < 400
+        with self.lock:
+            self.samples[step].append(ms)
+            self.errors[step] += int(not ok)
+        return res if ok else None
+
+    def funnel(self, i, room):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        # Funnel i books room i % rooms; later rounds move on to later nights
+        check_in = self.first_night + timedelta(days=2 * (i // self.room_count))
+        res = self.timed("booking", "POST", f"{self.app_url}/api/rooms/bookings/create/", headers=headers, json={
+            "room_id": room.id,
+            "check_in": check_in.isoformat(),
+            "check_out": (check_in + timedelta(days=1)).isoformat(),
+        })
+        if res is None:
+            return
+        booking = res.json()
+
+        res = self.timed("init", "POST", f"{self.app_url}/api/payments/init/", json={
+            "booking_id": booking["booking_id"],
+            "amount": booking["amount"],
+            "user_id": self.user.id,
+        })
+        if res is None:
+            return
+        order = res.json()
+
+        # The customer pays on the simulator's page and is redirected back
+        try:
+            callback_url = self.session.get(order["redirect_url"], allow_redirects=False, timeout=30).headers["Location"]
+        except (requests.RequestException, KeyError):
+            with self.lock:
+                self.errors["callback"] += 1
+            return
+        if self.timed("callback", "GET", callback_url) is None:
+            return
+
+        self.timed("ipn", "POST", f"{self.app_url}/api/payments/pesapal/ipn/", json={
+            "OrderNotificationType": "IPNCHANGE",
+            "OrderTrackingId": order["tracking_id"],
+            "OrderMerchantReference": str(booking["booking_id"]),
+        })
+
+    def report(self, total, elapsed, processed, drain_elapsed, gateway_calls):
+        completed = len(self.samples["ipn"]) - self.errors["ipn"]
+        self.stdout.write(
+            f"{total} funnels started in {elapsed:.1f}s, {completed} completed: "
+            f"{completed / elapsed:.1f} funnels/s"
+        )
+        self.stdout.write(f"{'step':>10} {'count':>6} {'errors':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+        for step in STEPS:
+            samples = self.samples[step]
+            if not samples:
+                self.stdout.write(f"{step:>10} {0:>6} {self.errors[step]:>6}")
+                continue
+            self.stdout.write(
+                f"{step:>10} {len(samples):>6} {self.errors[step]:>6} {len(samples) / elapsed:>7.1f} "
+                f"{percentile(samples, 50):>6.1f}ms {percentile(samples, 95):>6.1f}ms "
+                f"{percentile(samples, 99):>6.1f}ms {max(samples):>6.1f}ms"
+            )
+        if processed:
+            self.stdout.write(f"IPN inbox: {processed} processed in {drain_elapsed:.1f}s ({processed / drain_elapsed:.1f}/s)")
+        self.stdout.write(f"Gateway calls: {gateway_calls}")
@@ -0,0 +1,42 @@
+# payments/management/commands/pesapal_simulator.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.simulator import PesapalSimulator
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the local Pesapal simulator. Point PESAPAL_BASE_URL of the "
+        "server under test at the printed URL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8900)
+        parser.add_argument("--latency", type=float, default=0.05, help="Seconds before each API response")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API calls that fail")
+        parser.add_argument("--error-status", type=int, default=500)
+        parser.add_argument("--ipn-url", default=None, help="Where to POST IPNs for paid orders")
+        parser.add_argument("--ipn-delay", type=float, default=1.0, help="Seconds between payment and its IPN")
+        parser.add_argument("--auto-pay", action="store_true", help="Send the IPN as soon as an order is submitted")
+
+    def handle(self, *args, **options):
+        simulator = PesapalSimulator(
+            port=options["port"],
+            latency=options["latency"],
+            error_rate=options["error_rate"],
+            error_status=options["error_status"],
+            ipn_url=options["ipn_url"],
+            ipn_delay=options["ipn_delay"],
+            auto_pay=options["auto_pay"],
+        )
+        with simulator:
+            self.stdout.write(self.style.SUCCESS(f"Pesapal simulator listening on {simulator.url} (Ctrl+C to stop)"))
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(f"Calls served: {simulator.calls}")
@@ -0,0 +1,32 @@
+# payments/management/commands/process_ipn_inbox.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments import ipn
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify queued Pesapal IPNs and apply them to their payments. Run "
+        "with --loop as a worker process; several workers may run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=20, help="IPNs claimed per round")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when the inbox is empty")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds to sleep when the inbox is empty")
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            claimed = ipn.drain(options["batch"])
+            processed += claimed
+            if claimed:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} IPNs"))
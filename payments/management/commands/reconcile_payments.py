@@ -0,0 +1,36 @@
+# payments/management/commands/reconcile_payments.py
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payments.reconcile import BATCH_SIZE, MIN_AGE, default_workers, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Ask Pesapal for the status of every payment still PENDING and apply "
+        "the answers. Schedule it (e.g. every 15 minutes) to recover payments "
+        "whose callback and IPN were lost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="Rows read and written per batch")
+        parser.add_argument("--workers", type=int, default=None, help=f"Concurrent status lookups (default {default_workers()})")
+        parser.add_argument(
+            "--min-age", type=int, default=int(MIN_AGE.total_seconds() // 60),
+            help="Only payments created at least this many minutes ago",
+        )
+
+    def handle(self, *args, **options):
+        totals = reconcile(
+            batch_size=options["batch"],
+            workers=options["workers"],
+            min_age=timedelta(minutes=options["min_age"]),
+        )
+        if totals["aborted"]:
+            self.stdout.write(self.style.WARNING("Payment gateway circuit is open; stopped early"))
+        self.stdout.write(self.style.SUCCESS(
+            "Checked {checked} pending payments in {seconds}s: {updated} updated, "
+            "{completed} completed, {bookings_confirmed} bookings confirmed, {errors} lookups failed".format(**totals)
+        ))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_transaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IPNInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tracking_id', models.CharField(max_length=255)),
+                ('merchant_reference', models.CharField(max_length=255)),
+                ('notification_type', models.CharField(blank=True, default='', max_length=50)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('result', models.CharField(blank=True, default='', max_length=50)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('duplicates', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('received', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'received'], name='ipn_inbox_queue_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tracking_id', 'merchant_reference'), name='ipn_inbox_unique_event')],
+            },
+        ),
+    ]
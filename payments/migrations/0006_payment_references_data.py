@@ -0,0 +1,78 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:12
+
+from django.db import migrations
+from django.db.models import CharField, Count, Max, Q
+from django.db.models.functions import Cast
+
+
+# Prefix of the PaymentLog notes that keep cleared tracking ids
+CLEARED = "Duplicate pesapal_order_tracking_id cleared by migration 0006: "
+
+
+def normalize_references(apps, schema_editor):
+    """
+    Prepare Payment references for their unique/indexed columns:
+    - empty tracking ids become NULL, so they do not collide;
+    - a tracking id recorded on several payments stays on the newest one,
+      and each older payment gets a PaymentLog note with the id it lost,
+      so reconciliation and audits can still find it (and the reverse
+      migration can put it back);
+    - payments without a merchant reference get the one Pesapal was sent,
+      the booking id.
+    """
+    Payment = apps.get_model("payments", "Payment")
+    PaymentLog = apps.get_model("payments", "PaymentLog")
+
+    Payment.objects.filter(pesapal_order_tracking_id="").update(pesapal_order_tracking_id=None)
+
+    duplicates = (
+        Payment.objects.exclude(pesapal_order_tracking_id=None)
+        .values("pesapal_order_tracking_id")
+        .annotate(copies=Count("id"), newest=Max("id"))
+        .filter(copies__gt=1)
+    )
+    for row in duplicates:
+        older = Payment.objects.filter(
+            pesapal_order_tracking_id=row["pesapal_order_tracking_id"],
+        ).exclude(id=row["newest"])
+        PaymentLog.objects.bulk_create([
+            PaymentLog(
+                payment_id=payment_id,
+                status="processing",
+                message=f"{CLEARED}{row['pesapal_order_tracking_id']} (kept on payment #{row['newest']})",
+            )
+            for payment_id in older.values_list("id", flat=True)
+        ])
+        older.update(pesapal_order_tracking_id=None)
+
+    Payment.objects.filter(Q(pesapal_merchant_reference=None) | Q(pesapal_merchant_reference="")).update(
+        pesapal_merchant_reference=Cast("booking_id", CharField(max_length=255)),
+    )
+
+
+def restore_references(apps, schema_editor):
+    """
+    Put cleared tracking ids back from the notes. Empty ids stay NULL and
+    filled-in merchant references stay filled in.
+    """
+    Payment = apps.get_model("payments", "Payment")
+    PaymentLog = apps.get_model("payments", "PaymentLog")
+
+    notes = PaymentLog.objects.filter(message__startswith=CLEARED)
+    for payment_id, message in notes.values_list("payment_id", "message"):
+        tracking_id = message[len(CLEARED):].rsplit(" (kept on", 1)[0]
+        Payment.objects.filter(id=payment_id, pesapal_order_tracking_id=None).update(
+            pesapal_order_tracking_id=tracking_id,
+        )
+    notes.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_ipninbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_references, restore_references),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_payment_references_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='pesapal_merchant_reference',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='pesapal_order_tracking_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_payment_reference_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='paymentlog',
+            index=models.Index(fields=['timestamp'], name='paymentlog_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentlog',
+            index=models.Index(fields=['payment', 'timestamp'], name='paymentlog_payment_time_idx'),
+        ),
+    ]
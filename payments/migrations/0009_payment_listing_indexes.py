@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_rates'),
+        ('payments', '0008_paymentlog_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'created'], name='payment_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created'], name='payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['created'], name='transaction_created_idx'),
+        ),
+    ]
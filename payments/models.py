@@ -5,6 +5,7 @@ from django.contrib.auth.models import User
 from accounts.models import CustomUser
 from bookings.models import Booking
 from django.conf import settings
+from django.utils import timezone
 
 
 PAYMENT_METHODS = (
@@ -36,21 +37,45 @@ class Payment(models.Model):
         related_name="payments"
     )
 
-    pesapal_order_tracking_id = models.CharField(max_length=255, blank=True, null=True)
-    pesapal_merchant_reference = models.CharField(max_length=255, blank=True, null=True)
+    # Callbacks and IPNs look payments up by these; see PaymentService.find_by_tracking_id
+    pesapal_order_tracking_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    pesapal_merchant_reference = models.CharField(max_length=255, blank=True, null=True, db_index=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=50, default="PENDING")
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # a user's payments, newest first (PaymentService.user_payments_page)
+            models.Index(fields=["user", "created"], name="payment_user_created_idx"),
+            # finance exports by period
+            models.Index(fields=["created"], name="payment_created_idx"),
+        ]
+
     def __str__(self):
         return f"Payment {self.id} - {self.status}"
 
 
 class PaymentLog(models.Model):
+    """
+    Append-only: write events through payments.events.record(), never edit them.
+    """
     payment = models.ForeignKey(Payment, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS)
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # When the event happened, not when its buffer was written
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["timestamp"], name="paymentlog_time_idx"),
+            models.Index(fields=["payment", "timestamp"], name="paymentlog_payment_time_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("PaymentLog entries are append-only")
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Log for Payment #{self.payment.id}"
@@ -69,5 +94,52 @@ class Transaction(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created"], name="transaction_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.booking} — {self.status}"
+
+
+IPN_STATUS = (
+    ("pending", "Pending"),
+    ("processing", "Processing"),
+    ("done", "Done"),
+    ("failed", "Failed"),
+)
+
+
+class IPNInbox(models.Model):
+    """
+    Pesapal IPNs as received, drained by `manage.py process_ipn_inbox`.
+    One row per (tracking_id, merchant_reference); repeats are counted in
+    `duplicates` instead of being verified again.
+    """
+    tracking_id = models.CharField(max_length=255)
+    merchant_reference = models.CharField(max_length=255)
+    notification_type = models.CharField(max_length=50, blank=True, default="")
+    payload = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=20, choices=IPN_STATUS, default="pending")
+    result = models.CharField(max_length=50, blank=True, default="")  # payment status found when processed
+    attempts = models.PositiveIntegerField(default=0)
+    duplicates = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    received = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(blank=True, null=True)  # backoff after a failed attempt
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tracking_id", "merchant_reference"], name="ipn_inbox_unique_event"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "received"], name="ipn_inbox_queue_idx"),
+        ]
+
     def __str__(self):
-        return f"{self.booking} — {self.status}"
\ No newline at end of file
+        return f"IPN {self.tracking_id} - {self.status}"
@@ -0,0 +1,129 @@
+# payments/reconcile.py
+
+"""
+Reconciliation of payments whose callback and IPN never arrived.
+
+Pending Payment and Transaction rows are read in keyset batches (id order,
+so each row is visited once even as earlier ones leave PENDING). Each
+batch's GetTransactionStatus lookups run on a bounded thread pool, so the
+gateway sees at most `workers` requests at a time, and the results are
+written back with one bulk_update per model plus one bulk booking update.
+Worker threads only do HTTP; all database work stays on the calling thread.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import breaker, events
+from .models import Payment, Transaction
+from .services import PaymentService
+from .utils import verify_pesapal_transaction
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+# Payments younger than this may still get their callback
+MIN_AGE = timedelta(minutes=15)
+
+
+def default_workers():
+    # Never more threads than pooled connections to the gateway
+    return min(
+        getattr(settings, "PAYMENTS_RECONCILE_WORKERS", 8),
+        getattr(settings, "PAYMENTS_HTTP_POOL_SIZE", 20),
+    )
+
+
+def lookup(tracking_id):
+    """
+    (tracking_id, normalized status or None on error).
+    """
+    try:
+        result = verify_pesapal_transaction(tracking_id)
+    except Exception:
+        logger.warning("Reconcile: status lookup failed for %s", tracking_id, exc_info=True)
+        return tracking_id, None
+    if result.get("status") == "ERROR":
+        return tracking_id, None
+    return tracking_id, PaymentService.payment_status_from(result["data"])
+
+
+def pending_batches(model, reference_field, batch_size, cutoff):
+    """
+    Yield lists of pending rows of `model`, keyset-paginated by id.
+    """
+    last_id = 0
+    while True:
+        batch = list(
+            model.objects.filter(
+                status="PENDING", created__lt=cutoff, id__gt=last_id,
+                **{f"{reference_field}__isnull": False},
+            ).exclude(**{reference_field: ""}).only("id", "booking_id", "status", reference_field).order_by("id")[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def reconcile_batch(model, reference_field, batch, pool, totals):
+    references = [getattr(row, reference_field) for row in batch]
+    statuses = dict(pool.map(lookup, references))
+
+    changed, paid_bookings = [], []
+    for row in batch:
+        new_status = statuses.get(getattr(row, reference_field))
+        if new_status is None:
+            totals["errors"] += 1
+            continue
+        if new_status == row.status:
+            continue
+        row.status = new_status
+        changed.append(row)
+        if new_status == "COMPLETED":
+            paid_bookings.append(row.booking_id)
+
+    with transaction.atomic():
+        model.objects.bulk_update(changed, ["status"])
+        if model is Payment:
+            for row in changed:
+                events.record(row, events.log_status(row.status), f"Reconciled: Pesapal status {row.status}")
+        if paid_bookings:
+            totals["bookings_confirmed"] += PaymentService.confirm_bookings(paid_bookings)
+
+    totals["checked"] += len(batch)
+    totals["updated"] += len(changed)
+    totals["completed"] += len(paid_bookings)
+
+
+def reconcile(batch_size=BATCH_SIZE, workers=None, min_age=MIN_AGE):
+    """
+    Re-check every PENDING payment and transaction older than `min_age`
+    with Pesapal. Returns counters.
+    """
+    started = time.monotonic()
+    cutoff = timezone.now() - min_age
+    totals = {"checked": 0, "updated": 0, "completed": 0, "bookings_confirmed": 0, "errors": 0, "aborted": False}
+
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as pool:
+        for model, reference_field in (
+            (Payment, "pesapal_order_tracking_id"),
+            (Transaction, "pesapal_reference"),
+        ):
+            for batch in pending_batches(model, reference_field, batch_size, cutoff):
+                if breaker.is_open():
+                    # Gateway down: stop; the next scheduled run picks up
+                    totals["aborted"] = True
+                    break
+                reconcile_batch(model, reference_field, batch, pool, totals)
+            if totals["aborted"]:
+                break
+
+    totals["seconds"] = round(time.monotonic() - started, 2)
+    return totals
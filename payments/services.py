@@ -1,9 +1,37 @@
 # payments/services.py
 
 from django.db import transaction
-from .models import Payment, PaymentLog
+from django.db.models import Q
+from .models import Payment, Transaction
 from bookings.models import Booking
+from bookings.services import BookingService
 from django.core.exceptions import ValidationError
+from django.conf import settings
+
+from . import breaker, events, http_client, tokens
+
+
+class PesapalError(Exception):
+    pass
+
+
+# GetTransactionStatus status_code values
+PESAPAL_STATUS_CODES = {
+    0: "INVALID",
+    1: "COMPLETED",
+    2: "FAILED",
+    3: "REVERSED",
+}
+
+
+PAYMENT_EXPORT_FIELDS = (
+    "id", "created", "user_id", "user_email", "booking_id", "amount", "status",
+    "pesapal_order_tracking_id", "pesapal_merchant_reference",
+)
+TRANSACTION_EXPORT_FIELDS = (
+    "id", "created", "updated", "user_id", "booking_id", "amount", "status",
+    "payment_method", "pesapal_reference", "merchant_reference",
+)
 
 
 class PaymentService:
@@ -26,11 +54,7 @@ class PaymentService:
             reference=data.get("reference", "")
         )
 
-        PaymentLog.objects.create(
-            payment=payment,
-            status="pending",
-            message="Payment initiated"
-        )
+        events.record(payment, "pending", "Payment initiated")
 
         return payment
 
@@ -43,11 +67,7 @@ class PaymentService:
         payment.transaction_id = transaction_id
         payment.save()
 
-        PaymentLog.objects.create(
-            payment=payment,
-            status="success",
-            message="Payment confirmed"
-        )
+        events.record(payment, "success", "Payment confirmed")
 
         # Update booking status
         booking = payment.booking
@@ -56,27 +76,170 @@ class PaymentService:
 
         return payment
 
-# pesapal_service.py
+    @staticmethod
+    def find_by_tracking_id(tracking_id):
+        """
+        The payment for a Pesapal order, or None. The redirect callback and
+        the IPN worker both come through here: one lookup on the unique
+        tracking id index.
+        """
+        try:
+            return Payment.objects.select_related("booking").get(pesapal_order_tracking_id=tracking_id)
+        except Payment.DoesNotExist:
+            return None
 
-import requests
-from django.conf import settings
+    @staticmethod
+    def user_payments_page(user_id, cursor=None, limit=20, status=None):
+        """
+        One page of a user's payments, newest first, keyset-paginated on
+        (created, id) like the booking history. Returns (rows, next_cursor).
+        """
+        payments = Payment.objects.filter(user_id=user_id)
+        if status:
+            payments = payments.filter(status=status)
+        if cursor:
+            created, pk = BookingService.decode_cursor(cursor)
+            payments = payments.filter(Q(created__lt=created) | Q(created=created, id__lt=pk))
 
-def pesapal_get_token():
-    url = f"{settings.PESAPAL_BASE_URL}/api/Auth/RequestToken"
-    payload = {
-        "consumer_key": settings.PESAPAL_CONSUMER_KEY,
-        "consumer_secret": settings.PESAPAL_CONSUMER_SECRET
-    }
+        rows = list(payments.order_by("-created", "-id").values(
+            "id",
+            "booking_id",
+            "amount",
+            "status",
+            "pesapal_order_tracking_id",
+            "created",
+        )[:limit + 1])
 
-    try:
-        res = requests.post(url, json=payload, timeout=15)
-        data = res.json()
+        next_cursor = BookingService.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    @staticmethod
+    def payment_export_rows(start, end, chunk_size=2000):
+        """
+        Payments created in [start, end) as tuples in PAYMENT_EXPORT_FIELDS
+        order. .iterator() reads them through a server-side cursor where the
+        database has one, chunk_size rows at a time.
+        """
+        return Payment.objects.filter(created__gte=start, created__lt=end).order_by("created", "id").values_list(
+            "id", "created", "user_id", "user__email", "booking_id", "amount", "status",
+            "pesapal_order_tracking_id", "pesapal_merchant_reference",
+        ).iterator(chunk_size=chunk_size)
+
+    @staticmethod
+    def transaction_export_rows(start, end, chunk_size=2000):
+        """
+        Transactions created in [start, end), in TRANSACTION_EXPORT_FIELDS order.
+        """
+        return Transaction.objects.filter(created__gte=start, created__lt=end).order_by("created", "id").values_list(
+            *TRANSACTION_EXPORT_FIELDS,
+        ).iterator(chunk_size=chunk_size)
+
+    @staticmethod
+    def payment_status_from(data):
+        """
+        Normalize a GetTransactionStatus response to COMPLETED / FAILED /
+        REVERSED / INVALID / PENDING.
+        """
+        description = (data.get("payment_status_description") or "").upper()
+        if description:
+            return description
+        return PESAPAL_STATUS_CODES.get(data.get("status_code"), "PENDING")
+
+    @staticmethod
+    @transaction.atomic
+    def apply_transaction_status(payment, data):
+        """
+        Record a Pesapal status on the payment and, once it is COMPLETED,
+        confirm its booking (every booking of a group booking).
+        """
+        status = PaymentService.payment_status_from(data)
+        if status != payment.status:
+            events.record(payment, events.log_status(status), f"Pesapal status {status}")
+        payment.status = status
+        payment.save(update_fields=["status"])
+
+        if status == "COMPLETED":
+            PaymentService.confirm_bookings([payment.booking_id])
+
+        return status
+
+    @staticmethod
+    def confirm_bookings(booking_ids):
+        """
+        Confirm the pending bookings that were paid for, plus the other
+        bookings of any group booking among them. Confirming keeps the rooms
+        blocked, so availability caches need no invalidation.
+        """
+        group_ids = set(
+            Booking.objects.filter(id__in=booking_ids, group__isnull=False).values_list("group_id", flat=True)
+        )
+        return Booking.objects.filter(
+            Q(id__in=booking_ids) | Q(group_id__in=group_ids), status="pending",
+        ).update(status="confirmed")
+
+    @staticmethod
+    def initiate_pesapal_payment(booking_id, amount, user_id, email=""):
+        """
+        Submit the order to Pesapal and record the pending Payment.
+        Runs in the caller's request: booking creation no longer POSTs to
+        our own /api/payments/init/ and ties up a second worker.
+        Returns {"redirect_url", "tracking_id"}; raises PesapalError, or
+        breaker.CircuitOpenError at once while the gateway is down.
+        """
+        try:
+            access_token = tokens.get_token()
+        except breaker.CircuitOpenError:
+            raise
+        except Exception as e:
+            raise PesapalError(f"Failed to get Pesapal token: {e}")
 
-        if "token" not in data:
-            raise Exception(data)
+        order_url = http_client.gateway_url("api/Transactions/SubmitOrderRequest")
+        order_payload = {
+            "id": str(booking_id),
+            "currency": "UGX",
+            "amount": str(amount),
+            "description": "Room Booking Payment",
+            "callback_url": settings.PESAPAL_CALLBACK_URL,
+            "billing_address": {
+                "email_address": email,
+                "phone_number": "",
+                "country_code": "UG",
+                "first_name": "",
+                "last_name": "",
+            }
+        }
 
-        return data["token"]
+        headers = {"Authorization": f"Bearer {access_token}"}
+        order_res = http_client.post("submit_order", order_url, json=order_payload, headers=headers)
 
+        try:
+            order_data = order_res.json()
+        except ValueError:
+            raise PesapalError(f"Pesapal returned {order_res.status_code}")
+        if order_res.status_code != 200 or not order_data.get("redirect_url"):
+            raise PesapalError(f"Pesapal order failed: {order_data}")
+
+        tracking_id = order_data["order_tracking_id"]
+
+        payment = Payment.objects.create(
+            booking_id=booking_id,
+            user_id=user_id,
+            amount=amount,
+            pesapal_order_tracking_id=tracking_id,
+            pesapal_merchant_reference=order_data.get("merchant_reference", str(booking_id)),
+        )
+        events.record(payment, "pending", f"Order submitted to Pesapal, tracking id {tracking_id}")
+
+        return {
+            "redirect_url": order_data["redirect_url"],
+            "tracking_id": tracking_id,
+        }
+
+# pesapal_service.py
+
+def pesapal_get_token():
+    try:
+        return tokens.get_token()
     except Exception as e:
         raise Exception(f"Pesapal token error: {str(e)}")
 
@@ -85,7 +248,7 @@ class PesapalAPI:
     def __init__(self):
         self.consumer_key = settings.PESAPAL_CONSUMER_KEY
         self.consumer_secret = settings.PESAPAL_CONSUMER_SECRET
-        self.base_url = "https://pay.pesapal.com/v3"
+        self.base_url = http_client.base_url()
 
         # placeholders (we fill these in next steps)
         self.token = None
@@ -0,0 +1,219 @@
+# payments/simulator.py
+
+"""
+Local stand-in for the Pesapal v3 API, for tests, benchmarks and load tests.
+Point PESAPAL_BASE_URL at `simulator.url` (or run `manage.py
+pesapal_simulator`). Never point production settings at it.
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+
+
+class PesapalSimulator:
+    """
+    Serves RequestToken, SubmitOrderRequest and GetTransactionStatus on
+    127.0.0.1, answering each request after `latency` seconds.
+
+    - `error_rate`: fraction of API calls answered with `error_status`
+      instead of a result (token calls included).
+    - The redirect_url of an order is a payment page that redirects to the
+      order's callback_url the way Pesapal does once the customer has paid.
+    - `ipn_url`: when set, every paid order is also announced by POSTing an
+      IPN there `ipn_delay` seconds after the payment page is visited (or
+      after the order is submitted when `auto_pay` is set).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, error_status=500,
+                 ipn_url=None, ipn_delay=0.0, auto_pay=False, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.ipn_url = ipn_url
+        self.ipn_delay = ipn_delay
+        self.auto_pay = auto_pay
+        self.orders = {}
+        self.calls = {}
+        # Most requests in flight at once
+        self.peak = 0
+        self._active = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _enter(self):
+        with self._lock:
+            self._active += 1
+            self.peak = max(self.peak, self._active)
+
+    def _leave(self):
+        with self._lock:
+            self._active -= 1
+
+    def _fails(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def token(self, body):
+        self._count("token")
+        expires = datetime.now(timezone.utc) + timedelta(minutes=5)
+        return 200, {
+            "token": uuid.uuid4().hex,
+            "expiryDate": expires.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "status": "200",
+        }
+
+    def submit_order(self, body):
+        self._count("submit_order")
+        tracking_id = str(uuid.uuid4())
+        with self._lock:
+            self.orders[tracking_id] = body
+        if self.auto_pay:
+            self.send_ipn(tracking_id)
+        return 200, {
+            "order_tracking_id": tracking_id,
+            "merchant_reference": body.get("id"),
+            "redirect_url": f"{self.url}/pay/{tracking_id}",
+            "status": "200",
+        }
+
+    def transaction_status(self, query):
+        self._count("status")
+        tracking_id = (query.get("orderTrackingId") or [""])[0]
+        with self._lock:
+            order = self.orders.get(tracking_id)
+        if order is None:
+            return 200, {"status_code": 0, "payment_status_description": "INVALID", "status": "500"}
+        return 200, {
+            "status_code": 1,
+            "payment_status_description": "Completed",
+            "amount": order.get("amount"),
+            "merchant_reference": order.get("id"),
+            "confirmation_code": uuid.uuid4().hex[:10],
+            "status": "200",
+        }
+
+    def notification(self, tracking_id, notification_type):
+        with self._lock:
+            order = self.orders[tracking_id]
+        return {
+            "OrderNotificationType": notification_type,
+            "OrderTrackingId": tracking_id,
+            "OrderMerchantReference": order.get("id"),
+        }
+
+    def pay(self, tracking_id):
+        """
+        The hosted payment page: the customer pays and is sent back to the
+        merchant's callback_url.
+        """
+        self._count("pay")
+        with self._lock:
+            order = self.orders.get(tracking_id)
+        if order is None:
+            return 404, {"error": "unknown order"}
+        self.send_ipn(tracking_id)
+        query = urlencode(self.notification(tracking_id, "CALLBACKURL"))
+        return 302, {"location": f"{order.get('callback_url', '')}?{query}"}
+
+    def send_ipn(self, tracking_id):
+        if not self.ipn_url:
+            return
+
+        def deliver():
+            try:
+                res = requests.post(self.ipn_url, json=self.notification(tracking_id, "IPNCHANGE"), timeout=10)
+                self._count("ipn" if res.status_code == 200 else "ipn_errors")
+            except requests.RequestException:
+                self._count("ipn_errors")
+
+        timer = threading.Timer(self.ipn_delay, deliver)
+        timer.daemon = True
+        timer.start()
+
+    def route(self, method, path, query, body):
+        if method == "GET" and path.startswith("/pay/"):
+            return self.pay(path.rsplit("/", 1)[-1])
+        if self._fails():
+            self._count("errors")
+            return self.error_status, {"error": {"code": "simulated_failure"}, "status": str(self.error_status)}
+        if method == "POST" and path.endswith("/api/Auth/RequestToken"):
+            return self.token(body)
+        if method == "POST" and path.endswith("/api/Transactions/SubmitOrderRequest"):
+            return self.submit_order(body)
+        if path.endswith("/api/Transactions/GetTransactionStatus"):
+            return self.transaction_status(query)
+        return 404, {"error": "not found"}
+
+    def _handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send headers and body in one segment; otherwise Nagle plus
+            # delayed ACKs add ~40 ms to every keep-alive response.
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def _reply(self):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {}
+
+                simulator._enter()
+                try:
+                    if simulator.latency:
+                        time.sleep(simulator.latency)
+                    status, payload = simulator.route(self.command, parsed.path, parse_qs(parsed.query), body)
+                finally:
+                    simulator._leave()
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                if status == 302:
+                    self.send_header("Location", payload["location"])
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -1,3 +1,766 @@
-from django.test import TestCase
+import importlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qsl, urlparse
 
-# Create your tests here.
+import requests
+from datetime import date, datetime, timedelta
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import CustomUser
+from bookings.models import Booking, BookingGroup, Room, RoomType
+from payments import breaker, events, http_client, ipn, tokens
+from payments.models import IPNInbox, Payment, PaymentLog
+from payments.reconcile import reconcile
+from payments.services import PaymentService, PesapalError
+from payments.simulator import PesapalSimulator
+
+
+class LocalServer:
+    """
+    Minimal HTTP server on a free local port; `handler(path)` returns
+    (status, body dict, delay seconds).
+    """
+
+    def __init__(self, handler):
+        outer = self
+        self.hits = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self):
+                outer.hits.append(self.path)
+                status, body, delay = handler(self.path)
+                time.sleep(delay)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except BrokenPipeError:
+                    pass  # client gave up (timeout tests)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PesapalTokenProviderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_token_is_cached_until_refresh_is_needed(self):
+        with mock.patch.object(tokens, "request_token", return_value=("tok-1", 300)) as fetch:
+            self.assertEqual(tokens.get_token(), "tok-1")
+            self.assertEqual(tokens.get_token(), "tok-1")
+            self.assertEqual(fetch.call_count, 1)
+
+            tokens.invalidate()
+            fetch.return_value = ("tok-2", 300)
+            self.assertEqual(tokens.get_token(), "tok-2")
+            self.assertEqual(fetch.call_count, 2)
+
+    def test_concurrent_refreshes_collapse_into_one(self):
+        def slow_fetch():
+            time.sleep(0.2)
+            return "tok", 300
+
+        results = []
+        with mock.patch.object(tokens, "request_token", side_effect=slow_fetch) as fetch:
+            threads = [threading.Thread(target=lambda: results.append(tokens.get_token())) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(results, ["tok"] * 20)
+
+    def test_waits_for_a_refresh_in_another_worker(self):
+        cache.add(tokens.LEASE_KEY, 1)
+        threading.Timer(0.1, lambda: cache.set(tokens.TOKEN_KEY, "from-other-worker")).start()
+        with mock.patch.object(tokens, "request_token") as fetch:
+            self.assertEqual(tokens.get_token(), "from-other-worker")
+        fetch.assert_not_called()
+
+    @mock.patch.object(tokens, "LEASE_SECONDS", 0.2)
+    def test_never_refreshes_under_another_workers_lease(self):
+        cache.set(tokens.LEASE_KEY, "other-worker", None)
+        with mock.patch.object(tokens, "request_token") as fetch:
+            with self.assertRaises(tokens.TokenUnavailable):
+                tokens.get_token()
+        fetch.assert_not_called()
+        self.assertEqual(cache.get(tokens.LEASE_KEY), "other-worker")
+
+    @mock.patch.object(tokens, "LEASE_SECONDS", 0.2)
+    def test_refreshes_once_a_dead_workers_lease_lapses(self):
+        cache.add(tokens.LEASE_KEY, "dead-worker", 0.3)
+        with mock.patch.object(tokens, "request_token", return_value=("tok", 300)) as fetch:
+            self.assertEqual(tokens.get_token(), "tok")
+        fetch.assert_called_once()
+        self.assertIsNone(cache.get(tokens.LEASE_KEY))
+
+    def test_lifetime_from_expiry_date(self):
+        self.assertEqual(tokens._lifetime(None), tokens.DEFAULT_LIFETIME)
+        self.assertEqual(tokens._lifetime("2001-01-01T00:00:00.1234567Z"), tokens.DEFAULT_LIFETIME)
+        self.assertGreater(tokens._lifetime("2999-01-01T00:00:00.1234567Z"), tokens.DEFAULT_LIFETIME)
+
+
+@mock.patch.object(http_client, "BACKOFF", 0.01)
+class PaymentsHttpClientTests(SimpleTestCase):
+    def setUp(self):
+        breaker.reset()
+
+    def test_status_calls_retry_on_gateway_errors(self):
+        replies = iter([(503, {}, 0), (503, {}, 0), (200, {"ok": True}, 0)])
+        with LocalServer(lambda path: next(replies)) as server:
+            res = http_client.get("status", f"{server.url}/status")
+        self.assertEqual(res.json(), {"ok": True})
+        self.assertEqual(len(server.hits), 3)
+        self.assertGreaterEqual(http_client.stats()["status"]["retries"], 2)
+
+    def test_non_idempotent_calls_are_not_retried(self):
+        with LocalServer(lambda path: (503, {}, 0)) as server:
+            res = http_client.post("submit_order", f"{server.url}/order", json={})
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(len(server.hits), 1)
+
+    def test_read_timeout_is_bounded(self):
+        with LocalServer(lambda path: (200, {}, 0.5)) as server:
+            with mock.patch.dict(http_client.TIMEOUTS, {"slow": (1, 0.1)}):
+                started = time.monotonic()
+                with self.assertRaises(requests.Timeout):
+                    http_client.get("slow", f"{server.url}/slow")
+                elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(http_client.stats()["slow"]["errors"], 1)
+
+
+class PaymentInitiationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.gateway = PesapalSimulator().start()
+        self.addCleanup(self.gateway.stop)
+        overrides = override_settings(PESAPAL_BASE_URL=self.gateway.url, PESAPAL_CALLBACK_URL="http://testserver/cb")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room_type = RoomType.objects.create(name="Std", base_price=100)
+        self.room = Room.objects.create(room_number="101", room_type=room_type)
+
+    def test_booking_with_payment_method_initiates_in_process(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        check_in = date.today() + timedelta(days=5)
+
+        with mock.patch("requests.post", side_effect=AssertionError("no HTTP self-call")):
+            res = client.post(reverse("create-booking"), {
+                "room_id": self.room.id,
+                "check_in": check_in.isoformat(),
+                "check_out": (check_in + timedelta(days=2)).isoformat(),
+                "paymentMethod": "pesapal",
+            }, format="json")
+
+        self.assertEqual(res.status_code, 201)
+        self.assertTrue(res.json()["pesapal_url"].startswith(self.gateway.url))
+        payment = Payment.objects.get()
+        self.assertEqual(payment.booking_id, res.json()["booking_id"])
+        self.assertEqual(payment.amount, 200)
+        self.assertEqual(self.gateway.calls, {"token": 1, "submit_order": 1})
+
+    def test_gateway_failure_keeps_the_booking(self):
+        self.gateway.stop()
+        booking = Booking.objects.create(user=self.user, room=self.room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+        with self.assertRaises(Exception):
+            PaymentService.initiate_pesapal_payment(booking.id, 100, self.user.id)
+        self.assertFalse(Payment.objects.exists())
+
+
+class IPNInboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.gateway = PesapalSimulator(latency=0.05).start()
+        self.addCleanup(self.gateway.stop)
+        overrides = override_settings(
+            PESAPAL_BASE_URL=self.gateway.url,
+            PESAPAL_CALLBACK_URL="http://testserver/cb",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room_type = RoomType.objects.create(name="Std", base_price=100)
+        room = Room.objects.create(room_number="101", room_type=room_type)
+        self.booking = Booking.objects.create(user=self.user, room=room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+        self.order = PaymentService.initiate_pesapal_payment(self.booking.id, 100, self.user.id)
+        self.gateway.calls.clear()
+
+    def notify(self, method="post"):
+        params = {
+            "OrderNotificationType": "IPNCHANGE",
+            "OrderTrackingId": self.order["tracking_id"],
+            "OrderMerchantReference": str(self.booking.id),
+        }
+        return getattr(APIClient(), method)(reverse("pesapal-ipn"), params, format="json" if method == "post" else None)
+
+    def test_ipn_is_acknowledged_without_calling_the_gateway(self):
+        started = time.monotonic()
+        res = self.notify()
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {
+            "orderNotificationType": "IPNCHANGE",
+            "orderTrackingId": self.order["tracking_id"],
+            "orderMerchantReference": str(self.booking.id),
+            "status": 200,
+        })
+        self.assertLess(elapsed, self.gateway.latency)
+        self.assertEqual(self.gateway.calls, {})
+        self.assertEqual(IPNInbox.objects.get().status, "pending")
+
+    def test_missing_fields_are_rejected(self):
+        res = APIClient().post(reverse("pesapal-ipn"), {"OrderTrackingId": "x"}, format="json")
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(IPNInbox.objects.exists())
+
+    def test_drain_completes_payment_and_confirms_booking(self):
+        self.notify()
+        self.notify(method="get")
+
+        self.assertEqual(ipn.drain(), 1)
+
+        entry = IPNInbox.objects.get()
+        self.assertEqual((entry.status, entry.result, entry.duplicates), ("done", "COMPLETED", 1))
+        self.assertEqual(Payment.objects.get().status, "COMPLETED")
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "confirmed")
+        self.assertEqual(self.gateway.calls, {"status": 1})
+
+    def test_repeats_after_completion_are_dropped(self):
+        self.notify()
+        ipn.drain()
+        for _ in range(5):
+            self.notify()
+
+        self.assertEqual(ipn.drain(), 0)
+        self.assertEqual(IPNInbox.objects.get().duplicates, 5)
+        self.assertEqual(self.gateway.calls, {"status": 1})
+
+    def test_failed_verification_is_retried_with_backoff_then_parked(self):
+        self.notify()
+        delays = []
+        with mock.patch("payments.ipn.verify_pesapal_transaction", side_effect=requests.ConnectionError("gateway down")):
+            for attempt in range(1, ipn.MAX_ATTEMPTS + 1):
+                before = timezone.now()
+                self.assertEqual(ipn.drain(), 1)
+                entry = IPNInbox.objects.get()
+                if attempt < ipn.MAX_ATTEMPTS:
+                    # Not due yet: the next drain leaves it alone
+                    self.assertEqual(ipn.drain(), 0)
+                    delays.append(round((entry.next_attempt_at - before).total_seconds()))
+                    IPNInbox.objects.update(next_attempt_at=timezone.now())
+
+        self.assertEqual(delays, [30, 60, 120, 240])
+        entry = IPNInbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ("failed", ipn.MAX_ATTEMPTS))
+        self.assertIsNone(entry.next_attempt_at)
+        self.assertTrue(entry.last_error)
+        self.assertEqual(Payment.objects.get().status, "PENDING")
+
+        # Pesapal's next retry of the same IPN revives the parked row
+        self.notify()
+        entry = IPNInbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ("pending", 0))
+        self.assertEqual(ipn.drain(), 1)
+        self.assertEqual(IPNInbox.objects.get().status, "done")
+
+
+class PaymentReconciliationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.gateway = PesapalSimulator(latency=0.02).start()
+        self.addCleanup(self.gateway.stop)
+        overrides = override_settings(PESAPAL_BASE_URL=self.gateway.url)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room_type = RoomType.objects.create(name="Std", base_price=100)
+        self.room = Room.objects.create(room_number="101", room_type=room_type)
+
+    def make_payment(self, day, paid, group=None):
+        check_in = date(2030, 1, 1) + timedelta(days=day)
+        booking = Booking.objects.create(
+            user=self.user, room=self.room, check_in=check_in, check_out=check_in + timedelta(days=1), group=group,
+        )
+        tracking_id = f"order-{day}"
+        if paid:
+            self.gateway.orders[tracking_id] = {"id": str(booking.id), "amount": "100"}
+        Payment.objects.create(booking=booking, user=self.user, amount=100, pesapal_order_tracking_id=tracking_id)
+        return booking
+
+    def test_pending_payments_are_reconciled_in_bounded_batches(self):
+        for day in range(60):
+            self.make_payment(day, paid=day % 3 != 0)
+        Payment.objects.create(booking=Booking.objects.first(), user=self.user, amount=100)  # never submitted
+
+        totals = reconcile(batch_size=25, workers=4, min_age=timedelta(0))
+
+        self.assertEqual(self.gateway.calls["status"], 60)
+        self.assertLessEqual(self.gateway.peak, 4)
+        self.assertEqual((totals["checked"], totals["updated"], totals["completed"], totals["errors"]), (60, 60, 40, 0))
+        self.assertEqual(Payment.objects.filter(status="COMPLETED").count(), 40)
+        self.assertEqual(Payment.objects.filter(status="INVALID").count(), 20)
+        self.assertEqual(Booking.objects.filter(status="confirmed").count(), 40)
+
+        # Nothing left pending: a second run makes no gateway calls
+        reconcile(batch_size=25, workers=4, min_age=timedelta(0))
+        self.assertEqual(self.gateway.calls["status"], 60)
+
+    def test_paying_for_a_group_confirms_every_booking(self):
+        group = BookingGroup.objects.create(user=self.user, total_price=300)
+        self.make_payment(0, paid=True, group=group)
+        for day in (1, 2):
+            check_in = date(2030, 1, 1) + timedelta(days=day)
+            Booking.objects.create(user=self.user, room=self.room, check_in=check_in, check_out=check_in + timedelta(days=1), group=group)
+
+        totals = reconcile(min_age=timedelta(0))
+
+        self.assertEqual(totals["bookings_confirmed"], 3)
+        self.assertFalse(Booking.objects.exclude(status="confirmed").exists())
+
+    def test_recent_payments_are_left_for_their_callback(self):
+        self.make_payment(0, paid=True)
+        totals = reconcile()
+        self.assertEqual(totals["checked"], 0)
+        self.assertNotIn("status", self.gateway.calls)
+
+
+class PesapalSimulatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room_type = RoomType.objects.create(name="Std", base_price=100)
+        room = Room.objects.create(room_number="101", room_type=room_type)
+        self.booking = Booking.objects.create(user=self.user, room=room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+
+    def test_gateway_base_url_comes_from_settings(self):
+        with override_settings(PESAPAL_BASE_URL="http://gateway.test/v3/"):
+            self.assertEqual(http_client.gateway_url("api/Auth/RequestToken"), "http://gateway.test/v3/api/Auth/RequestToken")
+        with override_settings():
+            del settings.PESAPAL_BASE_URL
+            self.assertEqual(http_client.gateway_url("/api/x"), "https://pay.pesapal.com/v3/api/x")
+
+    def test_payment_page_redirects_to_callback_and_sends_ipn(self):
+        with LocalServer(lambda path: (200, {}, 0)) as merchant, \
+                PesapalSimulator(ipn_url=f"{merchant.url}/ipn/") as gateway, \
+                override_settings(PESAPAL_BASE_URL=gateway.url, PESAPAL_CALLBACK_URL="http://testserver/cb/"):
+            order = PaymentService.initiate_pesapal_payment(self.booking.id, 100, self.user.id)
+
+            res = requests.get(order["redirect_url"], allow_redirects=False)
+            self.assertEqual(res.status_code, 302)
+            callback = urlparse(res.headers["Location"])
+            self.assertEqual(callback.path, "/cb/")
+
+            res = APIClient().get("/api/payments/pesapal/callback/", dict(parse_qsl(callback.query)))
+            self.assertEqual(res.json()["status"], "COMPLETED")
+
+            deadline = time.monotonic() + 5
+            while not merchant.hits and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(merchant.hits, ["/ipn/"])
+        self.assertEqual(gateway.calls["ipn"], 1)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "confirmed")
+
+    def test_error_rate(self):
+        with PesapalSimulator(error_rate=1.0) as gateway, override_settings(PESAPAL_BASE_URL=gateway.url):
+            with self.assertRaises(PesapalError):
+                PaymentService.initiate_pesapal_payment(self.booking.id, 100, self.user.id)
+        self.assertEqual(gateway.calls, {"errors": 1})
+        self.assertFalse(Payment.objects.exists())
+
+
+@override_settings(PAYMENTS_BREAKER_FAILURE_THRESHOLD=3, PAYMENTS_BREAKER_COOLDOWN=0.2)
+class PaymentCircuitBreakerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.replies = []
+        self.server = LocalServer(lambda path: self.replies.pop(0) if self.replies else (200, {}, 0))
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def call(self):
+        return http_client.post("submit_order", f"{self.server.url}/order", json={})
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        before = breaker.stats()
+        self.replies = [(503, {}, 0)] * 3
+        for _ in range(3):
+            self.call()
+        self.assertEqual(breaker.state(), breaker.OPEN)
+
+        started = time.monotonic()
+        with self.assertRaises(breaker.CircuitOpenError):
+            self.call()
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertEqual(len(self.server.hits), 3)
+
+        after = breaker.stats()
+        self.assertEqual(after["opened"] - before["opened"], 1)
+        self.assertEqual(after["rejected"] - before["rejected"], 1)
+
+    def test_successes_reset_the_failure_count(self):
+        self.replies = [(503, {}, 0), (503, {}, 0), (200, {}, 0), (503, {}, 0), (503, {}, 0)]
+        for _ in range(5):
+            self.call()
+        self.assertEqual(breaker.state(), breaker.CLOSED)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        self.replies = [(503, {}, 0)] * 4
+        for _ in range(3):
+            self.call()
+        time.sleep(0.25)
+        self.assertEqual(breaker.state(), breaker.HALF_OPEN)
+
+        # Failed probe: another cooldown
+        self.call()
+        self.assertEqual(breaker.state(), breaker.OPEN)
+        time.sleep(0.25)
+
+        # Only one caller probes; it succeeds and closes the circuit
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state(), breaker.CLOSED)
+        self.call()
+        self.assertEqual(len(self.server.hits), 5)
+
+    def test_booking_is_held_for_later_payment_while_open(self):
+        user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room = Room.objects.create(room_number="101", room_type=RoomType.objects.create(name="Std", base_price=100))
+        for _ in range(3):
+            breaker.record_failure()
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        with mock.patch.object(http_client, "request", side_effect=AssertionError("gateway called")):
+            res = client.post(reverse("create-booking"), {
+                "room_id": room.id,
+                "check_in": "2030-01-01",
+                "check_out": "2030-01-03",
+                "paymentMethod": "pesapal",
+            }, format="json")
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.json()["payment"], "pay_later")
+        self.assertEqual(Booking.objects.get().status, "pending")
+        self.assertFalse(Payment.objects.exists())
+
+    def test_callback_leaves_payment_pending_when_gateway_is_unavailable(self):
+        user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room = Room.objects.create(room_number="101", room_type=RoomType.objects.create(name="Std", base_price=100))
+        booking = Booking.objects.create(user=user, room=room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+        payment = Payment.objects.create(booking=booking, user=user, amount=100, pesapal_order_tracking_id="order-1")
+        params = {"OrderTrackingId": "order-1", "OrderMerchantReference": str(booking.id)}
+        cache.set(tokens.TOKEN_KEY, "tok")
+
+        for _ in range(3):
+            breaker.record_failure()
+        res = APIClient().get("/api/payments/pesapal/callback/", params)
+        self.assertEqual(res.status_code, 503)
+        self.assertIn("Retry-After", res)
+
+        breaker.reset()
+        with mock.patch.object(http_client, "request", side_effect=requests.ConnectionError("down")):
+            res = APIClient().get("/api/payments/pesapal/callback/", params)
+        self.assertEqual(res.status_code, 502)
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PENDING")
+
+
+class PaymentReferenceTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room = Room.objects.create(room_number="101", room_type=RoomType.objects.create(name="Std", base_price=100))
+        self.booking = Booking.objects.create(user=self.user, room=room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+
+    def test_lookup_by_tracking_id_is_one_indexed_query(self):
+        payment = Payment.objects.create(booking=self.booking, user=self.user, amount=100, pesapal_order_tracking_id="order-1")
+        with self.assertNumQueries(1):
+            found = PaymentService.find_by_tracking_id("order-1")
+            self.assertEqual(found.booking.id, self.booking.id)
+        self.assertEqual(found, payment)
+        self.assertIsNone(PaymentService.find_by_tracking_id("missing"))
+
+        plan = Payment.objects.filter(pesapal_order_tracking_id="order-1").explain()
+        self.assertNotIn("SCAN payments_payment", plan)
+
+    def test_tracking_id_is_unique(self):
+        Payment.objects.create(booking=self.booking, user=self.user, amount=100, pesapal_order_tracking_id="order-1")
+        Payment.objects.create(booking=self.booking, user=self.user, amount=100)
+        Payment.objects.create(booking=self.booking, user=self.user, amount=100)
+        with self.assertRaises(IntegrityError):
+            Payment.objects.create(booking=self.booking, user=self.user, amount=100, pesapal_order_tracking_id="order-1")
+
+    def test_data_migration_normalizes_references(self):
+        migration = importlib.import_module("payments.migrations.0006_payment_references_data")
+        blank = Payment.objects.create(booking=self.booking, user=self.user, amount=100, pesapal_order_tracking_id="")
+        kept = Payment.objects.create(
+            booking=self.booking, user=self.user, amount=100,
+            pesapal_order_tracking_id="order-1", pesapal_merchant_reference="ref-1",
+        )
+
+        migration.normalize_references(django_apps, None)
+
+        blank.refresh_from_db()
+        kept.refresh_from_db()
+        self.assertIsNone(blank.pesapal_order_tracking_id)
+        self.assertEqual(blank.pesapal_merchant_reference, str(self.booking.id))
+        self.assertEqual((kept.pesapal_order_tracking_id, kept.pesapal_merchant_reference), ("order-1", "ref-1"))
+
+
+class PaymentReferenceMigrationTests(TransactionTestCase):
+    """
+    Runs 0006 forwards and backwards on a schema that still allows
+    duplicate tracking ids.
+    """
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("payments", target)])
+        return executor.loader.project_state([("payments", target)]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes("payments")[0][1])
+
+    def test_cleared_duplicates_are_noted_and_restored(self):
+        apps = self.migrate("0005_ipninbox")
+        # Only payments is rolled back; the other apps keep their current schema
+        user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room = Room.objects.create(room_number="101", room_type=RoomType.objects.create(name="Std", base_price=100))
+        booking = Booking.objects.create(user=user, room=room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+        Payment = apps.get_model("payments", "Payment")
+        older, newest = [
+            Payment.objects.create(booking_id=booking.pk, user_id=user.pk, amount=100, pesapal_order_tracking_id="order-1")
+            for _ in range(2)
+        ]
+
+        apps = self.migrate("0006_payment_references_data")
+        Payment, PaymentLog = apps.get_model("payments", "Payment"), apps.get_model("payments", "PaymentLog")
+        self.assertIsNone(Payment.objects.get(pk=older.pk).pesapal_order_tracking_id)
+        self.assertEqual(Payment.objects.get(pk=newest.pk).pesapal_order_tracking_id, "order-1")
+        note = PaymentLog.objects.get(payment_id=older.pk)
+        self.assertIn("order-1", note.message)
+
+        apps = self.migrate("0005_ipninbox")
+        Payment, PaymentLog = apps.get_model("payments", "Payment"), apps.get_model("payments", "PaymentLog")
+        self.assertEqual(Payment.objects.get(pk=older.pk).pesapal_order_tracking_id, "order-1")
+        self.assertFalse(PaymentLog.objects.exists())
+
+
+class PaymentEventLogTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        room = Room.objects.create(room_number="101", room_type=RoomType.objects.create(name="Std", base_price=100))
+        booking = Booking.objects.create(user=self.user, room=room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+        self.payment = Payment.objects.create(booking=booking, user=self.user, amount=100, pesapal_order_tracking_id="order-1")
+
+    def test_events_are_written_in_bulk_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                for n in range(50):
+                    events.record(self.payment, "processing", f"step {n}")
+            self.assertFalse(PaymentLog.objects.exists())
+
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(PaymentLog.objects.count(), 50)
+
+    def test_events_of_a_rolled_back_transaction_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    events.record(self.payment, "failed", "lost")
+                    raise ValueError
+            except ValueError:
+                pass
+            with transaction.atomic():
+                events.record(self.payment, "success", "kept")
+
+        self.assertEqual(list(PaymentLog.objects.values_list("message", flat=True)), ["kept"])
+
+    def test_events_of_a_rolled_back_savepoint_are_dropped(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                events.record(self.payment, "processing", "before")
+                try:
+                    with transaction.atomic():
+                        events.record(self.payment, "failed", "lost")
+                        raise ValueError
+                except ValueError:
+                    pass
+                events.record(self.payment, "success", "after")
+
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(list(PaymentLog.objects.order_by("id").values_list("message", flat=True)), ["before", "after"])
+
+    def test_log_is_append_only(self):
+        entry = PaymentLog.objects.create(payment=self.payment, status="pending", message="created")
+        entry.message = "edited"
+        with self.assertRaises(ValueError):
+            entry.save()
+
+    def test_status_changes_are_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentService.apply_transaction_status(self.payment, {"status_code": 1})
+            PaymentService.apply_transaction_status(self.payment, {"status_code": 1})
+        self.assertEqual(list(PaymentLog.objects.values_list("status", "message")), [("success", "Pesapal status COMPLETED")])
+
+    def test_export_streams_a_time_range(self):
+        staff = CustomUser.objects.create_user(
+            username="finance", email="finance@example.com", password="pw", user_type="staff", is_staff=True,
+        )
+        for day in (1, 2, 3):
+            PaymentLog.objects.create(
+                payment=self.payment, status="pending", message=f"day {day}",
+                timestamp=timezone.make_aware(datetime(2030, 1, day, 12)),
+            )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(staff).access_token}")
+
+        res = client.get(reverse("payment-log-export"), {"start": "2030-01-02", "end": "2030-01-04"})
+        self.assertTrue(res.streaming)
+        lines = b"".join(res.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,payment_id,tracking_id,status,message,timestamp")
+        self.assertEqual([line.split(",")[4] for line in lines[1:]], ["day 2", "day 3"])
+
+        res = client.get(reverse("payment-log-export"), {"start": "2030-01-01", "end": "2030-01-02", "fmt": "ndjson"})
+        rows = [json.loads(line) for line in b"".join(res.streaming_content).decode().splitlines()]
+        self.assertEqual([(row["message"], row["tracking_id"]) for row in rows], [("day 1", "order-1")])
+
+        self.assertEqual(client.get(reverse("payment-log-export")).status_code, 400)
+
+    def test_log_export_and_metrics_need_is_staff(self):
+        # user_type "staff" is self-assignable at registration; is_staff is not
+        user = CustomUser.objects.create_user(username="typed", email="typed@example.com", password="pw", user_type="staff")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        self.assertEqual(client.get(reverse("payment-log-export"), {"start": "2030-01-01"}).status_code, 403)
+        self.assertEqual(client.get(reverse("payment-metrics")).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        self.assertEqual(client.get(reverse("payment-metrics")).status_code, 200)
+
+
+class PaymentListingAndExportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="payer", email="payer@example.com", password="pw")
+        self.other = CustomUser.objects.create_user(username="other", email="other@example.com", password="pw")
+        self.staff = CustomUser.objects.create_user(
+            username="finance", email="finance@example.com", password="pw", user_type="staff", is_staff=True,
+        )
+        room = Room.objects.create(room_number="101", room_type=RoomType.objects.create(name="Std", base_price=100))
+        self.booking = Booking.objects.create(user=self.user, room=room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2))
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        return client
+
+    def test_listing_pages_through_a_users_payments(self):
+        Payment.objects.bulk_create(
+            Payment(booking=self.booking, user=self.user, amount=n, pesapal_order_tracking_id=f"order-{n}")
+            for n in range(25)
+        )
+        Payment.objects.create(booking=self.booking, user=self.other, amount=1)
+        client = self.client_for(self.user)
+        url = reverse("list-payments", args=[self.user.id])
+
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(2):  # user lookup for the token, then one page
+                res = client.get(url, {"limit": 10, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(res.status_code, 200)
+            seen += [row["id"] for row in res.json()["results"]]
+            cursor = res.json()["next_cursor"]
+            if not cursor:
+                break
+
+        expected = list(Payment.objects.filter(user=self.user).order_by("-created", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(client.get(reverse("list-payments", args=[self.other.id])).status_code, 403)
+        self.assertEqual(self.client_for(self.staff).get(reverse("list-payments", args=[self.other.id])).status_code, 200)
+
+    def test_finance_export_streams_payments_in_chunks(self):
+        Payment.objects.bulk_create(
+            Payment(booking=self.booking, user=self.user if n % 2 else self.other, amount=n, pesapal_order_tracking_id=f"order-{n}")
+            for n in range(2500)
+        )
+        today = date.today()
+        res = self.client_for(self.staff).get(reverse("finance-export"), {"start": today.isoformat()})
+
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], "text/csv")
+        chunks = list(res.streaming_content)
+        self.assertEqual(len(chunks), 4)  # header, then 1000-row chunks
+        lines = b"".join(chunks).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:4], ["id", "created", "user_id", "user_email"])
+        self.assertEqual(len(lines), 2501)
+
+        res = self.client_for(self.staff).get(reverse("finance-export"), {
+            "start": today.isoformat(), "fmt": "ndjson", "kind": "transactions",
+        })
+        self.assertEqual(b"".join(res.streaming_content), b"")
+
+    def test_finance_export_is_staff_only(self):
+        res = self.client_for(self.user).get(reverse("finance-export"), {"start": "2030-01-01"})
+        self.assertEqual(res.status_code, 403)
+
+    def test_self_registered_staff_is_refused(self):
+        # The public staff registration sets user_type "staff", not is_staff
+        cache.clear()
+        res = APIClient().post(reverse("register-staff"), {
+            "email": "fake@example.com", "first_name": "F", "last_name": "S",
+            "phone": "+256700009999", "password": "pw-123456",
+        }, format="json")
+        self.assertEqual(res.status_code, 201)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {res.json()['tokens']['access']}")
+
+        self.assertEqual(client.get(reverse("finance-export"), {"start": "2030-01-01"}).status_code, 403)
+        self.assertEqual(client.get(reverse("list-payments", args=[self.other.id])).status_code, 403)
@@ -0,0 +1,138 @@
+# payments/tokens.py
+
+"""
+Shared Pesapal access-token provider.
+
+Pesapal tokens live for five minutes. The provider keeps the current token
+in the cache until shortly before it expires, so payment steps no longer pay
+for an extra RequestToken round trip. Refreshes are single-flight: inside a
+worker a lock lets one thread fetch while the others wait for its result,
+and across workers a cache.add() lease does the same, so a burst of
+payments triggers one RequestToken call instead of one per request.
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from . import http_client
+
+TOKEN_KEY = "pesapal:token"
+LEASE_KEY = "pesapal:token:refreshing"
+
+# Refresh this long before Pesapal's expiryDate
+EXPIRY_MARGIN = 30
+# Used when the response carries no parseable expiryDate
+DEFAULT_LIFETIME = 5 * 60
+LEASE_SECONDS = 15
+
+_stats = {"hits": 0, "refreshes": 0, "waits": 0, "invalidations": 0}
+_stats_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+class TokenUnavailable(requests.ConnectionError):
+    """
+    No token: another worker holds the refresh lease and never delivered.
+    """
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    """
+    Token cache counters for this worker process.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _lifetime(expiry_date):
+    try:
+        # e.g. "2021-08-26T12:29:30.5177702Z"; trim to microseconds
+        stamp = expiry_date.rstrip("Z")
+        if "." in stamp:
+            head, fraction = stamp.split(".", 1)
+            stamp = f"{head}.{fraction[:6]}"
+        expires = datetime.fromisoformat(stamp).replace(tzinfo=timezone.utc)
+        lifetime = (expires - datetime.now(timezone.utc)).total_seconds()
+        # A fresh token already "expired" means our clock is off; trust the default
+        return lifetime if lifetime > EXPIRY_MARGIN else DEFAULT_LIFETIME
+    except Exception:
+        return DEFAULT_LIFETIME
+
+
+def request_token():
+    """
+    Ask Pesapal for a new token. Returns (token, seconds until expiry).
+    """
+    url = http_client.gateway_url("api/Auth/RequestToken")
+    payload = {
+        "consumer_key": settings.PESAPAL_CONSUMER_KEY,
+        "consumer_secret": settings.PESAPAL_CONSUMER_SECRET,
+    }
+
+    res = http_client.post("token", url, json=payload)
+    data = res.json()
+
+    if not data.get("token"):
+        raise Exception(f"Pesapal token error: {data}")
+
+    return data["token"], _lifetime(data.get("expiryDate"))
+
+
+def get_token():
+    """
+    Current Pesapal access token, refreshed only when missing or about to expire.
+    """
+    token = cache.get(TOKEN_KEY)
+    if token:
+        _count("hits")
+        return token
+
+    with _refresh_lock:
+        # Another thread in this worker may have refreshed while we waited
+        token = cache.get(TOKEN_KEY)
+        if token:
+            _count("hits")
+            return token
+
+        lease = uuid.uuid4().hex
+        if not cache.add(LEASE_KEY, lease, timeout=LEASE_SECONDS):
+            # Another worker is refreshing; wait for its token, or for its
+            # lease to lapse if it died, and only then refresh ourselves
+            _count("waits")
+            deadline = time.monotonic() + LEASE_SECONDS + 1
+            while not cache.add(LEASE_KEY, lease, timeout=LEASE_SECONDS):
+                if time.monotonic() >= deadline:
+                    raise TokenUnavailable("Timed out waiting for another worker's Pesapal token refresh")
+                time.sleep(0.05)
+                token = cache.get(TOKEN_KEY)
+                if token:
+                    return token
+
+        try:
+            token, lifetime = request_token()
+            _count("refreshes")
+            cache.set(TOKEN_KEY, token, timeout=max(int(lifetime) - EXPIRY_MARGIN, 1))
+            return token
+        finally:
+            # Only our own lease: a slow refresh may have outlived it
+            if cache.get(LEASE_KEY) == lease:
+                cache.delete(LEASE_KEY)
+
+
+def invalidate():
+    """
+    Drop the cached token, e.g. after Pesapal answers 401.
+    """
+    cache.delete(TOKEN_KEY)
+    _count("invalidations")
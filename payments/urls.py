@@ -4,9 +4,12 @@ from . import views
 urlpatterns = [
     path("create/", views.create_payment),
     path("confirm/", views.confirm_payment),
-    path("list/<int:user_id>/", views.list_payments),
+    path("list/<int:user_id>/", views.ListPaymentsView.as_view(), name="list-payments"),
     path("init/", views.PesapalInitView.as_view()),       # Step 3
     path("pesapal/callback/", views.PesapalCallbackView.as_view()), # Step 4
     path("pesapal/token/", views.PesapalTokenView.as_view()),
     path("pesapal/ipn/", views.PesapalIPNCallback.as_view(), name="pesapal-ipn"),
+    path("metrics/", views.PaymentMetricsView.as_view(), name="payment-metrics"),
+    path("logs/export/", views.PaymentLogExportView.as_view(), name="payment-log-export"),
+    path("export/", views.FinanceExportView.as_view(), name="finance-export"),
 ]
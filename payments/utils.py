@@ -1,19 +1,9 @@
 # payments/utils.py
-import requests
-from django.conf import settings
+from payments import http_client, tokens
 
 def get_pesapal_access_token():
-    url = "https://pay.pesapal.com/v3/api/Auth/RequestToken"
-
-    payload = {
-        "consumer_key": settings.PESAPAL_CONSUMER_KEY,
-        "consumer_secret": settings.PESAPAL_CONSUMER_SECRET
-    }
-
-    res = requests.post(url, json=payload)
-    res.raise_for_status()
-
-    return res.json()["token"]
+    # Cached and shared across requests, see payments/tokens.py
+    return tokens.get_token()
 
 
 def verify_pesapal_transaction(order_tracking_id: str):
@@ -24,18 +14,25 @@ def verify_pesapal_transaction(order_tracking_id: str):
 
     token = get_pesapal_access_token()
 
-    url = f"{settings.PESAPAL_API_URL}/api/Transactions/GetTransactionStatus"
+    url = http_client.gateway_url("api/Transactions/GetTransactionStatus")
 
     headers = {
         "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
+        "Accept": "application/json"
     }
 
-    payload = {
+    params = {
         "orderTrackingId": order_tracking_id
     }
 
-    r = requests.post(url, json=payload, headers=headers)
+    # Status lookups are idempotent, so the client may retry them
+    r = http_client.get("status", url, params=params, headers=headers)
+
+    if r.status_code == 401:
+        # Token revoked or expired early: refresh once
+        tokens.invalidate()
+        headers["Authorization"] = f"Bearer {get_pesapal_access_token()}"
+        r = http_client.get("status", url, params=params, headers=headers)
 
     try:
         data = r.json()
@@ -5,18 +5,94 @@ from django.views.decorators.csrf import csrf_exempt
 import json
 
 from payments.utils import verify_pesapal_transaction
-from payments.utils import get_pesapal_access_token
-from .services import PaymentService, pesapal_get_token
-from .models import Payment, Transaction
-import uuid, base64, hmac, hashlib, requests, json
+from .services import PAYMENT_EXPORT_FIELDS, TRANSACTION_EXPORT_FIELDS, PaymentService, pesapal_get_token
+from . import breaker, events, export, http_client, ipn, tokens
+import math
+import uuid, base64, hmac, hashlib
+import requests
 from urllib.parse import urlencode
-from django.conf import settings
+from django.utils import timezone
+from datetime import date, datetime, timedelta
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Booking
-from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
+
+
+class PaymentMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "token": tokens.stats(),
+            "http": http_client.stats(),
+            "ipn_inbox": ipn.counts(),
+            "breaker": breaker.stats(),
+        }, status=200)
+
+
+def export_params(request):
+    """
+    (start, end, fmt, label) from start=YYYY-MM-DD, end=YYYY-MM-DD (exclusive,
+    default: through today) and fmt=csv|ndjson. Raises ValueError.
+    """
+    try:
+        start = date.fromisoformat(request.GET["start"])
+        end = date.fromisoformat(request.GET["end"]) if request.GET.get("end") else date.today() + timedelta(days=1)
+    except (KeyError, ValueError):
+        raise ValueError("start (and optional end) must be YYYY-MM-DD")
+
+    fmt = request.GET.get("fmt", "csv")
+    if fmt not in export.FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(export.FORMATS)}")
+
+    def midnight(day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+    return midnight(start), midnight(end), fmt, f"{start}-{end}"
+
+
+class PaymentLogExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """
+        Stream payment events for auditing. Query: start, end, fmt.
+        """
+        try:
+            start, end, fmt, label = export_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        rows = events.export_rows(start, end)
+        return export.streaming_response(events.EXPORT_FIELDS, rows, fmt, f"payment-log-{label}")
+
+
+class FinanceExportView(APIView):
+    # is_staff, not user_type: anyone can register with user_type "staff"
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """
+        Stream every payment (or, with kind=transactions, every Pesapal
+        transaction) created in a period, across all users. Query: start,
+        end, fmt, kind=payments|transactions.
+        """
+        try:
+            start, end, fmt, label = export_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        kind = request.GET.get("kind", "payments")
+        if kind == "payments":
+            fields, rows = PAYMENT_EXPORT_FIELDS, PaymentService.payment_export_rows(start, end)
+        elif kind == "transactions":
+            fields, rows = TRANSACTION_EXPORT_FIELDS, PaymentService.transaction_export_rows(start, end)
+        else:
+            return Response({"error": "kind must be payments or transactions"}, status=400)
+
+        return export.streaming_response(fields, rows, fmt, f"{kind}-{label}")
 
 
 class PesapalTokenView(APIView):
@@ -66,11 +142,37 @@ def confirm_payment(request):
     })
 
 
-def list_payments(request, user_id):
-    payments = Payment.objects.filter(user_id=user_id).values(
-        "id", "amount", "status", "method", "booking_id"
-    )
-    return JsonResponse(list(payments), safe=False)
+class ListPaymentsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, user_id):
+        """
+        A user's payments, newest first, one page at a time. Guests see only
+        their own; other users' need is_staff. Query params: cursor (from next_cursor), limit (1-100,
+        default 20), status.
+        """
+        if user_id != request.user.id and not request.user.is_staff:
+            return Response({"error": "Not allowed"}, status=403)
+
+        try:
+            limit = min(max(int(request.GET.get("limit") or 20), 1), 100)
+        except ValueError:
+            return Response({"error": "Invalid limit"}, status=400)
+
+        try:
+            payments, next_cursor = PaymentService.user_payments_page(
+                user_id,
+                cursor=request.GET.get("cursor"),
+                limit=limit,
+                status=request.GET.get("status"),
+            )
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=400)
+
+        return Response({
+            "results": payments,
+            "next_cursor": next_cursor,
+        }, status=200)
 
 
 def generate_merchant_reference():
@@ -89,67 +191,23 @@ class PesapalInitView(APIView):
                 print('missing fields')
                 return Response({"error": "Missing required fields"}, status=400)
 
-            # 1. Get Pesapal access token
-            token_url = "https://pay.pesapal.com/v3/api/Auth/RequestToken"
-            token_payload = {
-                "consumer_key": settings.PESAPAL_CONSUMER_KEY,
-                "consumer_secret": settings.PESAPAL_CONSUMER_SECRET,
-            }
-
-            token_res = requests.post(token_url, json=token_payload)
-            token_data = token_res.json()
-            print("PESAPAL TOKEN RESPONSE:", token_data)
-
-            access_token = token_data.get("token")
-            if not access_token:
-                return Response({
-                    "error": "Failed to get Pesapal token",
-                    "details": token_data
-                }, status=500)
-
-
-            # 2. Register order
-            order_url = "https://pay.pesapal.com/v3/api/Transactions/SubmitOrderRequest"
-            order_payload = {
-                "id": booking_id,
-                "currency": "UGX",
-                "amount": amount,
-                "description": "Room Booking Payment",
-                "callback_url": settings.PESAPAL_CALLBACK_URL,
-                "billing_address": {
-                    "email_address": request.user.email if request.user.is_authenticated else "",
-                    "phone_number": "",
-                    "country_code": "UG",
-                    "first_name": "",
-                    "last_name": "",
-                }
-            }
-
-            headers = {"Authorization": f"Bearer {access_token}"}
-
-            order_res = requests.post(order_url, json=order_payload, headers=headers)
-            order_data = order_res.json()
-
-            redirect_url = order_data["redirect_url"]
-            tracking_id = order_data["order_tracking_id"]
-
-            # 3. Save payment record
-            Payment.objects.create(
-                booking_id=booking_id,
-                user_id=user_id,
-                amount=amount,
-                pesapal_tracking_id=tracking_id
+            result = PaymentService.initiate_pesapal_payment(
+                booking_id,
+                amount,
+                user_id,
+                email=request.user.email if request.user.is_authenticated else "",
             )
 
-            return Response({
-                "redirect_url": redirect_url,
-                "tracking_id": tracking_id,
-            }, status=200)
+            return Response(result, status=200)
 
         except Exception as e:
             print('EXCEPTION IN PESAPAL',e)
             return Response({"error": str(e)}, status=500)
 
+
+PAYMENT_PENDING_MESSAGE = "Could not confirm the payment with Pesapal yet; it will be updated automatically."
+
+
 class PesapalCallbackView(APIView):
     permission_classes = []  # Pesapal servers do not send JWT
 
@@ -161,102 +219,47 @@ class PesapalCallbackView(APIView):
             return Response({"error": "Missing parameters"}, status=400)
 
         # 1️⃣ Fetch the Payment record
-        payment = get_object_or_404(Payment, id=merchant_ref)
-
-        # 2️⃣ Get fresh access token
-        token = get_pesapal_access_token()
-
-        # 3️⃣ Confirm payment from Pesapal API
-        url = f"{settings.PESAPAL_HOST}/api/Transactions/GetTransactionStatus"
-        headers = {"Authorization": f"Bearer {token}"}
-        payload = {"orderTrackingId": tracking_id}
-
-        pesapal_res = requests.post(url, json=payload, headers=headers).json()
-
-        status = pesapal_res.get("status")
-
-        # 4️⃣ Update payment record
-        payment.pesapal_transaction_tracking_id = tracking_id
-        payment.status = status
-        payment.save()
-
-        # 5️⃣ If completed → mark booking as paid
-        if status == "COMPLETED":
-            booking = payment.booking
-            booking.payment_status = "PAID"   # or booking.is_paid = True
-            booking.save()
-
-        return Response({"message": "Callback received"}, status=200)
-
-class PesapalIPNCallback(APIView):
-    permission_classes = []   # Pesapal does not send JWT
-    authentication_classes = [] 
-
-    def get(self, request):
-        tracking_id = request.GET.get("OrderTrackingId")
-        reference = request.GET.get("OrderReference")
+        payment = PaymentService.find_by_tracking_id(tracking_id)
+        if payment is None:
+            return Response({"error": "Payment not found"}, status=404)
 
-        if not tracking_id or not reference:
-            return Response({"error": "Missing fields"}, status=400)
-
-        # Fetch transaction
+        # 2️⃣ Confirm payment from Pesapal API (fetches the cached token itself).
+        # If Pesapal is unreachable the payment stays PENDING; the IPN worker
+        # or reconcile_payments settles it later.
         try:
-            tx = Transaction.objects.get(tracking_id=tracking_id, reference=reference)
-        except Transaction.DoesNotExist:
-            return Response({"error": "Transaction not found"}, status=404)
-
-        # 1. Get Access Token again
-        token_url = "https://pay.pesapal.com/v3/api/Auth/RequestToken"
-        token_res = requests.post(
-            token_url, 
-            json={"consumer_key": settings.PESAPAL_CONSUMER_KEY,
-                  "consumer_secret": settings.PESAPAL_CONSUMER_SECRET}
-        )
-        access_token = token_res.json().get("token")
-
-        # 2. Hit Pesapal status API
-        status_url = f"https://pay.pesapal.com/v3/api/Transactions/GetTransactionStatus?orderTrackingId={tracking_id}"
-        status_res = requests.get(status_url, headers={"Authorization": f"Bearer {access_token}"})
-        data = status_res.json()
-
-        tx.status = data.get("payment_status_description", "UNKNOWN")
-        tx.meta = data
-        tx.save()
-
-        # 3. If completed → mark booking as paid + create payment record
-        if data.get("status") == "COMPLETED":
-            booking = tx.booking
-            booking.is_paid = True
-            booking.save()
-
-            # Make sure we do not double–create payments
-            if not Payment.objects.filter(transaction=tx).exists():
-                Payment.objects.create(
-                    user=booking.user,
-                    booking=booking,
-                    transaction=tx,
-                    amount=data.get("amount", booking.amount),
-                    status="COMPLETED",
-                )
-
-        return Response({"message": "IPN received"}, status=200)
+            status_data = verify_pesapal_transaction(tracking_id)
+        except breaker.CircuitOpenError:
+            response = Response({"error": PAYMENT_PENDING_MESSAGE, "status": payment.status}, status=503)
+            response["Retry-After"] = str(max(1, math.ceil(breaker.cooldown())))
+            return response
+        except requests.RequestException:
+            return Response({"error": PAYMENT_PENDING_MESSAGE, "status": payment.status}, status=502)
+        if status_data.get("status") == "ERROR":
+            return Response({"error": "Verification failed"}, status=502)
+
+        # 3️⃣ Update payment record; confirms the booking once COMPLETED
+        payment_status = PaymentService.apply_transaction_status(payment, status_data["data"])
 
+        return Response({"message": "Callback received", "status": payment_status}, status=200)
 
 class PesapalIPNCallback(APIView):
     permission_classes = [AllowAny]   # Pesapal servers need access
+    authentication_classes = []
 
-    def post(self, request):
+    def handle(self, params):
         """
-        Pesapal sends: 
+        Pesapal sends (as a GET query or a POST body):
         {
+            "OrderNotificationType": "IPNCHANGE",
             "OrderTrackingId": "",
             "OrderMerchantReference": ""
         }
+        The IPN is only queued here; `manage.py process_ipn_inbox` verifies
+        it with Pesapal and updates the payment.
         """
-        print("IPN received:", request.data)
-
-        merchant_ref = request.data.get("OrderMerchantReference")
-        tracking_id = request.data.get("OrderTrackingId")
+        notification_type = params.get("OrderNotificationType", "")
+        tracking_id = params.get("OrderTrackingId")
+        merchant_ref = params.get("OrderMerchantReference")
 
         if not merchant_ref or not tracking_id:
             return Response(
@@ -264,32 +267,18 @@ class PesapalIPNCallback(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # 1️⃣ Fetch payment
-        payment = get_object_or_404(Payment, id=merchant_ref)
-
-        # 2️⃣ Get new token
-        try:
-            token = get_pesapal_access_token()
-        except Exception as e:
-            return Response({"error": str(e)}, status=500)
-
-        # 3️⃣ Verify the transaction
-        try:
-            status_data = verify_pesapal_transaction(token, tracking_id)
-        except Exception as e:
-            return Response({"error": "Verification failed", "details": str(e)}, status=500)
-
-        status_code = status_data.get("status")
+        ipn.enqueue(tracking_id, merchant_ref, notification_type, dict(params.items()))
 
-        # 4️⃣ Update payment record
-        payment.status = status_code
-        payment.tracking_id = tracking_id
-        payment.save()
+        # The acknowledgement Pesapal expects; anything else makes it retry
+        return Response({
+            "orderNotificationType": notification_type,
+            "orderTrackingId": tracking_id,
+            "orderMerchantReference": merchant_ref,
+            "status": 200,
+        }, status=200)
 
-        # 5️⃣ If PAID → mark booking as confirmed
-        if status_code == "COMPLETED":
-            booking = payment.booking
-            booking.is_paid = True
-            booking.save()
+    def get(self, request):
+        return self.handle(request.GET)
 
-        return Response({"message": "IPN processed", "status": status_code})
\ No newline at end of file
+    def post(self, request):
+        return self.handle(request.data)